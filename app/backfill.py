@@ -0,0 +1,266 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from threading import Event, Lock, Thread
+from typing import Any, Dict, List, Optional
+import logging
+import time
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from .config import settings
+from .db import bulk_upsert_bars
+from .ingest import _eod_payload, _sync_history_tier, get_engine
+from .tiingo_client import tiingo_client
+from .usage import can_make_call
+
+# Historical EOD backfill: (symbol x date-range) work units, checkpointed in market.BackfillProgress,
+# fetched in parallel (pacing comes from the shared Tiingo transport) and bulk-loaded per chunk.
+# Units already marked done are never fetched again, so a restart resumes where it stopped.
+
+log = logging.getLogger(__name__)
+
+DDL_PROGRESS = """
+IF OBJECT_ID(N'market.BackfillProgress', 'U') IS NULL
+BEGIN
+    CREATE TABLE market.BackfillProgress (
+        Symbol     NVARCHAR(20)  NOT NULL,
+        Source     NVARCHAR(32)  NOT NULL,
+        ChunkStart DATE          NOT NULL,
+        ChunkEnd   DATE          NOT NULL,
+        Status     NVARCHAR(16)  NOT NULL,
+        [Rows]     INT           NOT NULL DEFAULT 0,
+        Attempts   INT           NOT NULL DEFAULT 0,
+        Error      NVARCHAR(400) NULL,
+        UpdatedAt  DATETIME2(0)  NOT NULL,
+        CONSTRAINT PK_market_BackfillProgress PRIMARY KEY CLUSTERED (Symbol, Source, ChunkStart)
+    );
+END
+"""
+
+def ensure_progress_table(engine: Engine) -> None:
+    with engine.begin() as conn:
+        conn.exec_driver_sql(DDL_PROGRESS)
+
+def plan_chunks(start: date, end: date, years: int) -> List[tuple]:
+    """Split [start, end] into ranges of `years` calendar years; boundaries after the first are Jan 1,
+    so re-planning the same range yields the same keys."""
+    years = max(1, years)
+    chunks = []
+    lo = start
+    while lo <= end:
+        hi = min(end, date(lo.year + years, 1, 1) - timedelta(days=1))
+        chunks.append((lo, hi))
+        lo = hi + timedelta(days=1)
+    return chunks
+
+def register_units(engine: Engine, symbols: List[str], start: date, end: date, source: str) -> int:
+    rows = [
+        {"Symbol": sym, "Source": source, "ChunkStart": lo, "ChunkEnd": hi}
+        for sym in symbols for lo, hi in plan_chunks(start, end, settings.BACKFILL_CHUNK_YEARS)
+    ]
+    if not rows:
+        return 0
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"""
+            INSERT INTO [{settings.SQLSERVER_DB_SCHEMA}].[BackfillProgress]
+                ([Symbol],[Source],[ChunkStart],[ChunkEnd],[Status],[Rows],[Attempts],[UpdatedAt])
+            SELECT :Symbol, :Source, :ChunkStart, :ChunkEnd, 'pending', 0, 0, SYSUTCDATETIME()
+            WHERE NOT EXISTS (
+                SELECT 1 FROM [{settings.SQLSERVER_DB_SCHEMA}].[BackfillProgress]
+                WHERE [Symbol] = :Symbol AND [Source] = :Source AND [ChunkStart] = :ChunkStart
+            )
+            """
+        ), rows)
+    return len(rows)
+
+def _open_units(engine: Engine, source: str, symbols: Optional[List[str]]) -> List[dict]:
+    params: Dict[str, Any] = {"source": source, "max_attempts": settings.BACKFILL_MAX_ATTEMPTS}
+    where = ""
+    if symbols:
+        names = []
+        for i, sym in enumerate(symbols):
+            params[f"s{i}"] = sym
+            names.append(f":s{i}")
+        where = f"AND [Symbol] IN ({', '.join(names)})"
+    with engine.begin() as conn:
+        rows = conn.execute(text(
+            f"""
+            SELECT [Symbol],[Source],[ChunkStart],[ChunkEnd],[Attempts]
+            FROM [{settings.SQLSERVER_DB_SCHEMA}].[BackfillProgress]
+            WHERE [Source] = :source AND [Status] <> 'done' AND [Attempts] < :max_attempts {where}
+            ORDER BY [ChunkStart] DESC, [Symbol]
+            """
+        ), params).mappings().all()
+    return [dict(r) for r in rows]
+
+def _mark(engine: Engine, unit: dict, status: str, rows: int = 0, error: Optional[str] = None) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"""
+            UPDATE [{settings.SQLSERVER_DB_SCHEMA}].[BackfillProgress]
+            SET [Status] = :status, [Rows] = :rows, [Error] = :error, [UpdatedAt] = SYSUTCDATETIME(),
+                [Attempts] = [Attempts] + CASE WHEN :status IN ('done', 'failed') THEN 1 ELSE 0 END
+            WHERE [Symbol] = :symbol AND [Source] = :source AND [ChunkStart] = :chunk_start
+            """
+        ), {"status": status, "rows": rows, "error": None if error is None else error[:400],
+            "symbol": unit["Symbol"], "source": unit["Source"], "chunk_start": unit["ChunkStart"]})
+
+def load_chunk(engine: Engine, unit: dict) -> int:
+    df = tiingo_client.get_dataframe(
+        unit["Symbol"],
+        startDate=str(unit["ChunkStart"])[:10],
+        endDate=str(unit["ChunkEnd"])[:10],
+        frequency="daily",
+    )
+    if df is None or df.empty:
+        return 0
+    for col in ("open", "high", "low", "close", "volume", "adjClose"):
+        if col not in df.columns:
+            df[col] = pd.NA
+    return bulk_upsert_bars(engine, _eod_payload(unit["Symbol"], df))
+
+
+class BackfillRunner:
+    """One backfill at a time per process: start / pause / resume / stop, progress from the table."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._thread: Optional[Thread] = None
+        self._resume = Event()
+        self._resume.set()
+        self._stop = Event()
+        self.state = "idle"
+        self.reason: Optional[str] = None
+        self.symbols: Optional[List[str]] = None
+        self.started_at: Optional[datetime] = None
+        self.rows = 0
+        self.units_done = 0
+        self.units_failed = 0
+        self.in_flight: Dict[str, str] = {}
+
+    def start(self, symbols: Optional[List[str]] = None, start: Optional[str] = None,
+              end: Optional[str] = None) -> Dict[str, Any]:
+        """Plan units for `symbols` (if given) and work through every open unit; with no symbols it
+        resumes whatever is left in the progress table."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return {"started": False, **self.snapshot()}
+            engine = get_engine()
+            ensure_progress_table(engine)
+            source = settings.SOURCE_EOD
+            planned = 0
+            if symbols:
+                lo = date.fromisoformat(start or settings.INIT_START_DATE)
+                hi = date.fromisoformat(end) if end else date.today()
+                planned = register_units(engine, symbols, lo, hi, source)
+            self.symbols = symbols or None
+            self._stop.clear()
+            self._resume.set()
+            self.state, self.reason = "running", None
+            self.started_at = datetime.utcnow()
+            self.rows = self.units_done = self.units_failed = 0
+            self._thread = Thread(target=self._run, args=(engine, source), name="backfill", daemon=True)
+            self._thread.start()
+            return {"started": True, "planned_units": planned, **self.snapshot()}
+
+    def pause(self, reason: str = "requested") -> None:
+        self._resume.clear()
+        if self.state in ("running", "waiting"):
+            self.state, self.reason = "paused", reason
+
+    def resume(self) -> None:
+        if self.state == "paused":
+            self.state, self.reason = "running", None
+        self._resume.set()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._resume.set()
+
+    def _wait_turn(self) -> bool:
+        # Blocks while paused or out of daily budget (resumes by itself once the day rolls over); False once stopped
+        while not self._stop.is_set():
+            if not self._resume.wait(timeout=1.0):
+                continue
+            if can_make_call():
+                if self.state == "waiting":
+                    self.state, self.reason = "running", None
+                return True
+            self.state, self.reason = "waiting", "daily API budget exhausted"
+            self._stop.wait(60)
+        return False
+
+    def _process(self, engine: Engine, unit: dict) -> None:
+        if not self._wait_turn():
+            return
+        key = f"{unit['Symbol']}:{str(unit['ChunkStart'])[:10]}"
+        self.in_flight[key] = str(unit["ChunkEnd"])[:10]
+        t0 = time.perf_counter()
+        try:
+            _mark(engine, unit, "running")
+            rows = load_chunk(engine, unit)
+            _mark(engine, unit, "done", rows)
+            with self._lock:
+                self.rows += rows
+                self.units_done += 1
+            log.info("backfill %s: %d rows in %.1fs", key, rows, time.perf_counter() - t0)
+        except Exception as e:
+            with self._lock:
+                self.units_failed += 1
+            log.warning("backfill %s failed: %r", key, e)
+            try:
+                _mark(engine, unit, "failed", error=repr(e))
+            except Exception:
+                log.exception("backfill %s: could not record failure", key)
+        finally:
+            self.in_flight.pop(key, None)
+
+    def _run(self, engine: Engine, source: str) -> None:
+        try:
+            units = _open_units(engine, source, self.symbols)
+            with ThreadPoolExecutor(max_workers=max(1, settings.BACKFILL_WORKERS),
+                                    thread_name_prefix="backfill") as pool:
+                for _ in pool.map(lambda u: self._process(engine, u), units):
+                    pass
+            if not self._stop.is_set():
+                _sync_history_tier(sorted({u["Symbol"] for u in units}))
+            self.state = "stopped" if self._stop.is_set() else "done"
+        except Exception as e:
+            log.exception("backfill run failed")
+            self.state, self.reason = "failed", repr(e)
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = (datetime.utcnow() - self.started_at).total_seconds() if self.started_at else 0.0
+        return {
+            "state": self.state, "reason": self.reason,
+            "started_utc": self.started_at.isoformat() + "Z" if self.started_at else None,
+            "units_done": self.units_done, "units_failed": self.units_failed, "rows": self.rows,
+            "rows_per_s": round(self.rows / elapsed) if elapsed else None,
+            "in_flight": dict(self.in_flight),
+        }
+
+    def progress(self) -> Dict[str, Any]:
+        """Run snapshot plus unit/row totals per status from the progress table."""
+        engine = get_engine()
+        ensure_progress_table(engine)
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                f"""
+                SELECT [Status], COUNT(*) AS Units, SUM([Rows]) AS Rows, COUNT(DISTINCT [Symbol]) AS Symbols
+                FROM [{settings.SQLSERVER_DB_SCHEMA}].[BackfillProgress]
+                WHERE [Source] = :source
+                GROUP BY [Status]
+                """
+            ), {"source": settings.SOURCE_EOD}).mappings().all()
+        table = {r["Status"]: {"units": int(r["Units"]), "rows": int(r["Rows"] or 0), "symbols": int(r["Symbols"])}
+                 for r in rows}
+        total = sum(v["units"] for v in table.values())
+        done = table.get("done", {}).get("units", 0)
+        return {**self.snapshot(), "units": table, "percent_done": round(100.0 * done / total, 1) if total else None}
+
+
+backfill_runner = BackfillRunner()
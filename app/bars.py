@@ -0,0 +1,78 @@
+from __future__ import annotations
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from typing import Dict, List, Optional
+
+
+def bucket_start(ts: datetime, interval_sec: int) -> datetime:
+    # Floor a timestamp to its bar boundary (UTC)
+    ts = ts.astimezone(timezone.utc)
+    epoch = int(ts.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % interval_sec, tz=timezone.utc)
+
+
+class BarAggregator:
+    """Builds interval OHLCV bars per symbol from price observations (trades or quote snapshots).
+
+    Bars are emitted Tiingo-row shaped ({"date", "open", "high", "low", "close", "volume"}) so they
+    go through the same intraday write path as REST responses.
+    """
+
+    def __init__(self, interval_sec: int):
+        self.interval_sec = interval_sec
+        self._bars: Dict[str, dict] = {}
+        self._last_cum_volume: Dict[str, float] = {}
+        self._closed_upto: Dict[str, datetime] = {}
+        self._lock = Lock()
+
+    def add(self, symbol: str, ts: datetime, price: float,
+            size: Optional[float] = None, cum_volume: Optional[float] = None) -> List[dict]:
+        """Fold one observation in; returns bars closed by it (at most one per symbol).
+
+        `size` is a trade size; `cum_volume` is a running session volume (snapshots), turned into
+        per-bar volume by differencing.
+        """
+        start = bucket_start(ts, self.interval_sec)
+        closed: List[dict] = []
+        with self._lock:
+            bar = self._bars.get(symbol)
+            closed_upto = self._closed_upto.get(symbol)
+            if (bar is not None and start < bar["date"]) or (closed_upto is not None and start <= closed_upto):
+                # Late observation for an already-closed bar; the REST reconciliation picks it up
+                return closed
+            if bar is None or start > bar["date"]:
+                if bar is not None:
+                    closed.append(bar)
+                    self._closed_upto[symbol] = bar["date"]
+                bar = {"date": start, "open": price, "high": price, "low": price, "close": price, "volume": 0}
+                self._bars[symbol] = bar
+            else:
+                bar["high"] = max(bar["high"], price)
+                bar["low"] = min(bar["low"], price)
+                bar["close"] = price
+            if size:
+                bar["volume"] += int(size)
+            if cum_volume is not None:
+                prev = self._last_cum_volume.get(symbol)
+                # First sighting or a new session (counter reset): no delta we can attribute
+                if prev is not None and cum_volume >= prev:
+                    bar["volume"] += int(cum_volume - prev)
+                self._last_cum_volume[symbol] = cum_volume
+        return [dict(b) for b in closed]
+
+    def current(self, symbol: str) -> Optional[dict]:
+        with self._lock:
+            bar = self._bars.get(symbol)
+            return None if bar is None else dict(bar)
+
+    def close_due(self, now: Optional[datetime] = None) -> Dict[str, dict]:
+        """Pop every bar whose interval has ended by `now`."""
+        now = now or datetime.now(timezone.utc)
+        due: Dict[str, dict] = {}
+        with self._lock:
+            for sym, bar in list(self._bars.items()):
+                if bar["date"] + timedelta(seconds=self.interval_sec) <= now:
+                    due[sym] = dict(bar)
+                    self._closed_upto[sym] = bar["date"]
+                    del self._bars[sym]
+        return due
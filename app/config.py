@@ -8,6 +8,17 @@ load_dotenv()
 
 class Settings(BaseSettings):
     TIINGO_API_KEY: str
+    TIINGO_BASE_URL: str = "https://api.tiingo.com"
+    # Shared Tiingo HTTP transport (app.tiingo_http): pooled keep-alive session, timeouts, retries on 429/5xx
+    TIINGO_POOL_SIZE: int = 10
+    TIINGO_CONNECT_TIMEOUT: float = 5.0
+    TIINGO_READ_TIMEOUT: float = 30.0
+    TIINGO_MAX_RETRIES: int = 3
+    TIINGO_BACKOFF_SECONDS: float = 1.0
+    TIINGO_BACKOFF_MAX_SECONDS: float = 60.0
+    # Longest a call waits for room under the rate limiter (MAX_CALLS_PER_MINUTE, MAX_API_CALLS_PER_HOUR)
+    # before failing (RateLimitTimeout). The limiter is per process, not shared between replicas.
+    TIINGO_LIMIT_WAIT_SECONDS: float = 120.0
     SQLSERVER_HOST: str
     SQLSERVER_PORT: str
     SQLSERVER_DB: str
@@ -24,6 +35,60 @@ class Settings(BaseSettings):
     INTRADAY_ENABLED: bool
     INTRADAY_RESAMPLE: str
     INTRADAY_WINDOW_MINUTES: int
+    # Poll windows at timestamp precision (delta since the newest stored bar) instead of whole days
+    INTRADAY_TIMESTAMP_WINDOWS: bool = True
+    # Every RECONCILE_MINUTES (0 = never) a symbol's poll re-reads RECONCILE_WINDOW_MINUTES before its newest bar
+    INTRADAY_RECONCILE_MINUTES: int = 30
+    INTRADAY_RECONCILE_WINDOW_MINUTES: int = 60
+    # PriceBarIntra layout: columnstore | page | rowstore, monthly partitions from INTRADAY_PARTITION_START.
+    # Monthly rather than daily: a day of 1min bars (~40k rows per 100 symbols) is far below the ~1M rows a
+    # columnstore rowgroup compresses well at, and daily boundaries since 2020 would be thousands of partitions.
+    # The current day still lives apart: the INTRADAY_COMPRESS_CRON run ("m h dom mon dow", empty = off; keep
+    # it outside the session) compresses the current month's columnstore delta store too, leaving only rows
+    # written since in rowstore form. page: months that have ended are rebuilt PAGE-compressed.
+    INTRADAY_STORAGE: str = "columnstore"
+    INTRADAY_PARTITION_START: str = "2020-01-01"
+    INTRADAY_PARTITION_MONTHS_AHEAD: int = 3
+    INTRADAY_COMPRESS_CRON: str = "15 2 * * *"
+    # An existing PriceBarIntra without the partition layout stops startup; true copies it into a new
+    # partitioned table month by month (resumable after an interruption) and drops the old one
+    INTRADAY_MIGRATE_UNPARTITIONED: bool = False
+    # Adaptive polling (app.intraday_scheduler): only during trading sessions, per-symbol cadence re-planned every
+    # INTRADAY_REPLAN_SECONDS from the remaining hourly/daily budget and split by tier weight ("hot=6,normal=1,cold=0.2")
+    INTRADAY_ADAPTIVE: bool = True
+    INTRADAY_HOT_SYMBOLS: str = ""
+    INTRADAY_COLD_SYMBOLS: str = ""
+    INTRADAY_TIER_WEIGHTS: str = "hot=6,normal=1,cold=0.2"
+    INTRADAY_MIN_INTERVAL_SECONDS: int = 15
+    INTRADAY_MAX_INTERVAL_SECONDS: int = 900
+    INTRADAY_TICK_SECONDS: int = 5
+    INTRADAY_REPLAN_SECONDS: int = 60
+    INTRADAY_WORKERS: int = 4
+    # Trading calendar (NYSE rules): session hours are exchange-local, so MARKET_TIMEZONE is the exchange's zone,
+    # independent of TIMEZONE; MARKET_HOLIDAYS adds "YYYY-MM-DD,..." closures
+    MARKET_TIMEZONE: str = "America/New_York"
+    MARKET_OPEN: str = "09:30"
+    MARKET_CLOSE: str = "16:00"
+    MARKET_EARLY_CLOSE: str = "13:00"
+    MARKET_PRE_OPEN_MINUTES: int = 0
+    MARKET_POST_CLOSE_MINUTES: int = 15
+    MARKET_HOLIDAYS: str = ""
+    # Batch mode polls Tiingo's multi-ticker /iex endpoint, INTRADAY_BATCH_SIZE tickers per call
+    INTRADAY_BATCH_MODE: bool = False
+    INTRADAY_BATCH_SIZE: int = 100
+    # Batch bars are built from last-trade snapshots: high/low only see the prices that happened to be last at
+    # a poll, and volume is differenced session totals. They go under their own Source, so they never overwrite
+    # or pass for the trade-derived REST/stream "tiingo_iex" bars; the intraday read endpoints follow the mode.
+    INTRADAY_SNAPSHOT_SOURCE: str = "tiingo_iex_snap"
+    # "poll" runs the ingest-intraday interval job; "stream" subscribes to the IEX websocket instead
+    INTRADAY_MODE: str = "poll"
+    TIINGO_WS_URL: str = "wss://api.tiingo.com/iex"
+    STREAM_THRESHOLD_LEVEL: int = 6 # 6 = last-trade updates only
+    STREAM_FLUSH_SECONDS: float = 2.0
+    STREAM_FLUSH_MAX_BARS: int = 500
+    STREAM_BAR_GRACE_SECONDS: float = 2.0
+    STREAM_RECONNECT_MAX_SECONDS: int = 60
+    STREAM_BACKFILL_ON_START: bool = True
 
     # ODER OF PRECEDENCE
     INTRADAY_INTERVAL_SECONDS: int
@@ -45,16 +110,77 @@ class Settings(BaseSettings):
     FETCH_INTERVAL_MINUTES: int
     SOURCE_EOD: str
     SA_PASSWORD: str
-    RATE_LIMIT_SLEEP: int
-
+    # No longer used: EOD runs are paced by the shared Tiingo token bucket; kept so old .env files load
+    RATE_LIMIT_SLEEP: int = 0
+
+    # Bulk (staged MERGE) writer; set EOD_BULK_UPSERT=false to fall back to row-by-row upserts
+    EOD_BULK_UPSERT: bool = True
+    BULK_CHUNK_SIZE: int = 5000
+
+    # Single-flight: concurrent fetches of one symbol share a call; its result is reused for this long
+    EOD_FRESH_SECONDS: float = 60.0
+    INTRADAY_FRESH_SECONDS: float = 5.0
+
+    # EOD ingest workers; every run is paced by the shared Tiingo token bucket, >1 fetches symbols concurrently
+    INGEST_WORKERS: int = 1
+
+    # API usage counters live in memory and are written back to ApiUsage* on this cadence
+    USAGE_FLUSH_SECONDS: int = 15
+
+    # /prices/latest and /prices/intraday/latest cache; local writes invalidate, TTL covers other writers
+    LATEST_CACHE_TTL_SECONDS: int = 30
+
+    # Rows fetched from the cursor per block when history endpoints stream (format=ndjson|csv)
+    HISTORY_STREAM_BATCH_SIZE: int = 2000
+    # Default page size for keyset-paginated /prices/intraday/history (cursor without page_size)
+    INTRADAY_PAGE_SIZE: int = 5000
+
+    # Local Arrow tier for closed EOD years (empty = disabled); /prices/history reads it memory-mapped
+    HISTORY_TIER_DIR: str = ""
+
+    # Historical backfill (/backfill): parallel (symbol x BACKFILL_CHUNK_YEARS) units, checkpointed in
+    # market.BackfillProgress; failed units are retried on the next start up to BACKFILL_MAX_ATTEMPTS
+    BACKFILL_WORKERS: int = 4
+    BACKFILL_CHUNK_YEARS: int = 5
+    BACKFILL_MAX_ATTEMPTS: int = 3
+
+    # Multi-replica scheduling: none | sql (SQL Server applock) | sqlite (local lease file). Singleton jobs run on
+    # the leader only; intraday symbols are sharded across instances that heartbeat within the lease
+    COORDINATION_BACKEND: str = "none"
+    COORDINATION_LEASE_SECONDS: int = 30
+    COORDINATION_SQLITE_PATH: str = "coordination.db"
+    COORDINATION_INSTANCE_ID: str = ""
+
+    # Background sync jobs (POST /prices/sync, /prices/intraday/sync): JOBS_WORKERS at once, JOBS_MAX_QUEUE
+    # more waiting, the last JOBS_RETAIN jobs kept for GET /jobs/{id}
+    JOBS_WORKERS: int = 2
+    JOBS_MAX_QUEUE: int = 10
+    JOBS_RETAIN: int = 100
+
+    # Separate connection pools for API reads and ingest/scheduler writes
+    DB_API_POOL_SIZE: int = 10
+    DB_API_MAX_OVERFLOW: int = 5
+    DB_API_POOL_TIMEOUT: float = 5
+    DB_INGEST_POOL_SIZE: int = 5
+    DB_INGEST_MAX_OVERFLOW: int = 5
+    DB_INGEST_POOL_TIMEOUT: float = 30
+    # API DB executor: WORKERS run at once, up to MAX_QUEUE more wait; beyond that requests get 503
+    API_DB_WORKERS: int = 10
+    API_DB_MAX_QUEUE: int = 50
+
+    # Logging: root level, per-logger overrides ("app.ingest=DEBUG,app.db=WARNING"), text or json lines.
+    # Payload previews are DEBUG-only, sampled at LOG_PAYLOAD_SAMPLE_RATE and cut at LOG_PAYLOAD_PREVIEW_CHARS.
+    LOG_LEVEL: str = "INFO"
+    LOG_LEVELS: str = ""
+    LOG_FORMAT: str = "text"
+    LOG_PAYLOAD_SAMPLE_RATE: float = 1.0
+    LOG_PAYLOAD_PREVIEW_CHARS: int = 1000
 
 
     @field_validator("SYMBOLS", mode="before")
     @classmethod
     def split_symbols(cls, v):
-        print("parsing symblos")
         if isinstance(v, str):
-            print(v)
             return [s.strip().upper() for s in v.split(",") if s.strip()]
         return v
 
@@ -62,6 +188,4 @@ class Settings(BaseSettings):
         env_file = ".env"
         case_sensitive = True
 
-settings = Settings()
-
-print("Loaded symbols:", settings.SYMBOLS)
\ No newline at end of file
+settings = Settings()
\ No newline at end of file
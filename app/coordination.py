@@ -0,0 +1,319 @@
+from __future__ import annotations
+from contextlib import closing
+from functools import wraps
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Dict, List, Optional
+import hashlib
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+
+from sqlalchemy import text
+
+from .config import settings
+from .db import make_engine
+
+# Multi-replica coordination: every process runs the scheduler, but singleton jobs (EOD, maintenance) only
+# do work on the lease holder, and intraday symbols are sharded across live instances by rendezvous
+# (highest-random-weight) hashing, so a member joining or leaving only moves its own share of symbols.
+# COORDINATION_BACKEND: none (single instance) | sql (SQL Server applock + member table) | sqlite (local file).
+
+log = logging.getLogger(__name__)
+
+LEADER_LOCK = "tiingo-scheduler-leader"
+
+
+class LeaseBackend:
+    """Leader lease plus a member registry with heartbeats; `ttl` is the lease length in seconds."""
+
+    def acquire(self, name: str, owner: str, ttl: int) -> bool:
+        raise NotImplementedError
+
+    def release(self, name: str, owner: str) -> None:
+        raise NotImplementedError
+
+    def heartbeat(self, owner: str, ttl: int) -> None:
+        raise NotImplementedError
+
+    def members(self, ttl: int) -> List[str]:
+        raise NotImplementedError
+
+    def leave(self, owner: str) -> None:
+        raise NotImplementedError
+
+
+DDL_MEMBERS = """
+IF OBJECT_ID(N'market.SchedulerMember', 'U') IS NULL
+BEGIN
+    CREATE TABLE market.SchedulerMember (
+        InstanceId   NVARCHAR(128) NOT NULL PRIMARY KEY,
+        HeartbeatUtc DATETIME2(3)  NOT NULL
+    );
+END
+"""
+
+class SqlLeaseBackend(LeaseBackend):
+    """Leadership is a session-owned sp_getapplock held on a dedicated connection: if the process or its
+    connection dies, SQL Server releases the lock and another instance takes over on its next heartbeat.
+    Membership uses server time (SYSUTCDATETIME), so replica clock skew doesn't matter. Everything runs on
+    that one autocommit connection, from an engine of its own (make_backend), so the lease never holds a
+    slot of the ingest pool."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._conn = None
+        with engine.begin() as conn:
+            conn.exec_driver_sql(DDL_MEMBERS)
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = self.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        return self._conn
+
+    def _drop_conn(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _execute(self, sql: str, params: dict):
+        try:
+            return self._connection().execute(text(sql), params)
+        except Exception:
+            # A broken session has lost the lock anyway; reconnect on the next heartbeat
+            self._drop_conn()
+            raise
+
+    def acquire(self, name: str, owner: str, ttl: int) -> bool:
+        if self._conn is not None:
+            mode = self._execute("SELECT APPLOCK_MODE('public', :name, 'Session')", {"name": name}).scalar()
+            if mode == "Exclusive":
+                return True
+        result = self._execute(
+            """
+            DECLARE @r INT;
+            EXEC @r = sp_getapplock @Resource = :name, @LockMode = 'Exclusive', @LockOwner = 'Session',
+                                    @LockTimeout = 0, @DbPrincipal = 'public';
+            SELECT @r;
+            """, {"name": name}).scalar()
+        return result is not None and int(result) >= 0
+
+    def release(self, name: str, owner: str) -> None:
+        if self._conn is None:
+            return
+        try:
+            self._execute("EXEC sp_releaseapplock @Resource = :name, @LockOwner = 'Session', @DbPrincipal = 'public'",
+                          {"name": name})
+        except Exception:
+            log.debug("applock release failed", exc_info=True)
+
+    def heartbeat(self, owner: str, ttl: int) -> None:
+        self._execute(
+            f"""
+            MERGE [{settings.SQLSERVER_DB_SCHEMA}].[SchedulerMember] AS t
+            USING (SELECT CAST(:owner AS NVARCHAR(128)) AS InstanceId) AS src
+            ON t.InstanceId = src.InstanceId
+            WHEN MATCHED THEN UPDATE SET HeartbeatUtc = SYSUTCDATETIME()
+            WHEN NOT MATCHED THEN INSERT (InstanceId, HeartbeatUtc) VALUES (src.InstanceId, SYSUTCDATETIME());
+            """, {"owner": owner})
+
+    def members(self, ttl: int) -> List[str]:
+        return list(self._execute(
+            f"""
+            SELECT InstanceId FROM [{settings.SQLSERVER_DB_SCHEMA}].[SchedulerMember]
+            WHERE HeartbeatUtc >= DATEADD(SECOND, -:ttl, SYSUTCDATETIME())
+            """, {"ttl": ttl}).scalars())
+
+    def leave(self, owner: str) -> None:
+        try:
+            self._execute(f"DELETE FROM [{settings.SQLSERVER_DB_SCHEMA}].[SchedulerMember] WHERE InstanceId = :owner",
+                          {"owner": owner})
+        finally:
+            self._drop_conn()
+            self.engine.dispose()
+
+
+class SqliteLeaseBackend(LeaseBackend):
+    """TTL leases in a local SQLite file: a stand-in for the SQL backend when replicas share a host
+    (tests, docker-compose). Expiry uses the local clock."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS lease (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS member (owner TEXT PRIMARY KEY, expires REAL NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def acquire(self, name: str, owner: str, ttl: int) -> bool:
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT owner, expires FROM lease WHERE name = ?", (name,)).fetchone()
+            if row is not None and row[0] != owner and row[1] > now:
+                conn.execute("COMMIT")
+                return False
+            conn.execute("INSERT OR REPLACE INTO lease (name, owner, expires) VALUES (?, ?, ?)", (name, owner, now + ttl))
+            conn.execute("COMMIT")
+            return True
+
+    def release(self, name: str, owner: str) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM lease WHERE name = ? AND owner = ?", (name, owner))
+
+    def heartbeat(self, owner: str, ttl: int) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute("INSERT OR REPLACE INTO member (owner, expires) VALUES (?, ?)", (owner, time.time() + ttl))
+
+    def members(self, ttl: int) -> List[str]:
+        with closing(self._connect()) as conn:
+            return [r[0] for r in conn.execute("SELECT owner FROM member WHERE expires > ?", (time.time(),))]
+
+    def leave(self, owner: str) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM member WHERE owner = ?", (owner,))
+
+
+def _rank(member: str, key: str) -> int:
+    # Stable across processes (unlike hash())
+    return int.from_bytes(hashlib.blake2b(f"{member}|{key}".encode(), digest_size=8).digest(), "big")
+
+def shard(symbols: List[str], members: List[str], me: str) -> List[str]:
+    """The symbols `me` owns: each symbol goes to the member with the highest rank for it."""
+    if not members or members == [me]:
+        return list(symbols)
+    return [s for s in symbols if max(members, key=lambda m: _rank(m, s)) == me]
+
+def make_backend(kind: str) -> Optional[LeaseBackend]:
+    kind = kind.strip().lower()
+    if kind in ("", "none"):
+        return None
+    if kind == "sql":
+        # One connection, held for the lease's lifetime; nothing else draws from this engine
+        return SqlLeaseBackend(make_engine(pool_size=1, max_overflow=0))
+    if kind == "sqlite":
+        return SqliteLeaseBackend(settings.COORDINATION_SQLITE_PATH)
+    raise ValueError(f"COORDINATION_BACKEND must be none, sql or sqlite (got {kind!r})")
+
+
+class Coordinator:
+    """Heartbeats in its own thread (a busy scheduler pool can't starve the lease). With kind "none" this
+    process is always the leader and owns every symbol; otherwise the backend is built in start(), so
+    importing the app doesn't touch the DB, and nothing leads until the first heartbeat."""
+
+    def __init__(self, kind: str = "none", instance_id: Optional[str] = None, backend: Optional[LeaseBackend] = None):
+        self.kind = kind.strip().lower() or "none"
+        self.backend = backend
+        self.instance_id = instance_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.ttl = max(3, settings.COORDINATION_LEASE_SECONDS)
+        self._lock = Lock()
+        self._leader = self.kind == "none" and backend is None
+        self._members: List[str] = [self.instance_id]
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+        self._listeners: List[Callable[[], None]] = []
+
+    def beat(self) -> None:
+        if self.backend is None:
+            return
+        try:
+            self.backend.heartbeat(self.instance_id, self.ttl)
+            leader = self.backend.acquire(LEADER_LOCK, self.instance_id, self.ttl)
+            members = sorted(set(self.backend.members(self.ttl)) | {self.instance_id})
+        except Exception as e:
+            # Can't prove we still hold the lease: step down rather than risk two leaders, and keep the
+            # last known shard layout rather than claiming every symbol
+            log.warning("coordination heartbeat failed: %r", e)
+            leader, members = False, self._members
+        with self._lock:
+            if leader != self._leader:
+                log.info("instance %s %s leadership", self.instance_id, "acquired" if leader else "lost")
+            changed = members != self._members
+            if changed:
+                log.info("scheduler members: %s", members)
+            self._leader, self._members = leader, members
+            listeners = list(self._listeners) if changed else []
+        for fn in listeners:
+            try:
+                fn()
+            except Exception:
+                log.exception("coordination: membership listener failed")
+
+    def on_change(self, fn: Callable[[], None]) -> None:
+        """Call fn() (from the heartbeat thread) whenever the member list, and so the shard layout, changes."""
+        with self._lock:
+            if fn not in self._listeners:
+                self._listeners.append(fn)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.ttl / 3):
+            self.beat()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        if self.backend is None:
+            self.backend = make_backend(self.kind)
+            if self.backend is None:
+                return
+        self.beat()
+        self._thread = Thread(target=self._loop, name="coordination", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self.backend is None:
+            return
+        try:
+            self.backend.release(LEADER_LOCK, self.instance_id)
+            self.backend.leave(self.instance_id)
+        except Exception:
+            log.exception("coordination: leaving failed")
+        self._leader = False
+
+    def is_leader(self) -> bool:
+        with self._lock:
+            return self._leader
+
+    def my_symbols(self, symbols: List[str]) -> List[str]:
+        with self._lock:
+            members = list(self._members)
+        return shard(symbols, members, self.instance_id)
+
+    def share(self, symbols: List[str]) -> float:
+        # Fraction of the symbol universe (and so of the API budget) this instance polls
+        return len(self.my_symbols(symbols)) / max(1, len(symbols))
+
+    def leader_only(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+        @wraps(fn)
+        def run(*args, **kwargs):
+            if not self.is_leader():
+                return {"skipped": True, "reason": "not-leader"}
+            return fn(*args, **kwargs)
+        return run
+
+    def status(self, symbols: List[str]) -> Dict[str, Any]:
+        with self._lock:
+            members = list(self._members)
+            leader = self._leader
+        return {"backend": settings.COORDINATION_BACKEND, "instance": self.instance_id, "leader": leader,
+                "members": members, "symbols_owned": len(shard(symbols, members, self.instance_id)),
+                "symbols_total": len(symbols)}
+
+
+_coordinator: Optional[Coordinator] = None
+_coordinator_lock = Lock()
+
+def get_coordinator() -> Coordinator:
+    global _coordinator
+    if _coordinator is None:
+        with _coordinator_lock:
+            if _coordinator is None:
+                _coordinator = Coordinator(settings.COORDINATION_BACKEND, settings.COORDINATION_INSTANCE_ID or None)
+    return _coordinator
@@ -1,10 +1,17 @@
 from __future__ import annotations
-from typing import Optional
+from datetime import date, datetime
+from threading import Lock
+from typing import Optional, List, Dict, Tuple, Union
 from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Engine
 from urllib.parse import quote_plus
+import logging
 
 from .config import settings
+from .latest import EOD_INTERVAL_SEC, invalidate_latest
+from .metrics import rows_written
+
+log = logging.getLogger(__name__)
 
 # market.* is fixed by design; identifiers cannot be parameterized safely
 DDL_ENSURE = """
@@ -32,33 +39,310 @@ BEGIN
 END
 """
 
-def make_engine() -> Engine:
+def make_engine(**pool_kwargs) -> Engine:
     # TrustServerCertificate avoids cert hassles in local/dev networks; tune for prod.
     conn_str = (
     f"mssql+pyodbc://{quote_plus(settings.SQLSERVER_USER)}:{quote_plus(settings.SQLSERVER_PASSWORD)}"
     f"@{settings.SQLSERVER_HOST}:{settings.SQLSERVER_PORT}/{settings.SQLSERVER_DB}?"
     f"driver=ODBC+Driver+18+for+SQL+Server&Encrypt=no&TrustServerCertificate=yes"
     )
-    print("conn_str: ", conn_str)
-    engine = create_engine(conn_str, pool_pre_ping=True, pool_recycle=1800, future=True)
+    log.info("DB engine for %s:%s/%s", settings.SQLSERVER_HOST, settings.SQLSERVER_PORT, settings.SQLSERVER_DB)
+    engine = create_engine(conn_str, pool_pre_ping=True, pool_recycle=1800, fast_executemany=True, future=True,
+                           **pool_kwargs)
     return engine
 
 def ensure_schema_and_table(engine: Engine) -> None:
     # Important: use exec_driver_sql so SQLAlchemy doesn't try to param-bind identifiers.
     with engine.begin() as conn:
         conn.exec_driver_sql(DDL_ENSURE)
+    ensure_intraday_table(engine)
+
+# --- PriceBarIntra layout: monthly partitions on BarTime (see the INTRADAY_STORAGE comment for why not daily) ---
+# INTRADAY_STORAGE=columnstore: clustered columnstore (trickle inserts land in the rowstore delta store)
+#   plus a nonclustered PK for MERGE seeks; the nightly job compresses delta rowgroups up to the current day.
+# INTRADAY_STORAGE=page: clustered PK rowstore; closed months are rebuilt with PAGE compression.
+# INTRADAY_STORAGE=rowstore: clustered PK rowstore, partitioned, uncompressed.
+INTRADAY_PF = "PF_market_PriceBarIntra_Month"
+INTRADAY_PS = "PS_market_PriceBarIntra_Month"
+
+def _month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+def _add_months(d: date, n: int) -> date:
+    y, m = divmod(d.month - 1 + n, 12)
+    return date(d.year + y, m + 1, 1)
+
+def _intraday_boundaries(first: date, last: date) -> List[date]:
+    out, d = [], _month_start(first)
+    while d <= last:
+        out.append(d)
+        d = _add_months(d, 1)
+    return out
 
-def get_latest_date(engine: Engine, symbol: str, source: str) -> Optional[str]:
+def _intraday_storage() -> str:
+    storage = settings.INTRADAY_STORAGE.strip().lower()
+    if storage not in ("columnstore", "page", "rowstore"):
+        raise ValueError(f"INTRADAY_STORAGE must be columnstore, page or rowstore (got {storage!r})")
+    return storage
+
+def _intraday_ddl(boundaries: List[date], storage: str) -> str:
+    # Boundary literals are generated dates, never user input
+    values = ", ".join(f"'{b.isoformat()}'" for b in boundaries)
+    clustered = "NONCLUSTERED" if storage == "columnstore" else "CLUSTERED"
+    columnstore = (
+        f"CREATE CLUSTERED COLUMNSTORE INDEX CCI_market_PriceBarIntra ON market.PriceBarIntra ON {INTRADAY_PS}(BarTime);"
+        if storage == "columnstore" else ""
+    )
+    return f"""
+IF NOT EXISTS (SELECT 1 FROM sys.partition_functions WHERE name = N'{INTRADAY_PF}')
+    CREATE PARTITION FUNCTION {INTRADAY_PF} (DATETIME2(0)) AS RANGE RIGHT FOR VALUES ({values});
+
+IF NOT EXISTS (SELECT 1 FROM sys.partition_schemes WHERE name = N'{INTRADAY_PS}')
+    CREATE PARTITION SCHEME {INTRADAY_PS} AS PARTITION {INTRADAY_PF} ALL TO ([PRIMARY]);
+
+IF OBJECT_ID(N'market.PriceBarIntra', 'U') IS NULL
+BEGIN
+    CREATE TABLE market.PriceBarIntra (
+        Symbol      NVARCHAR(20)  NOT NULL,
+        Source      NVARCHAR(32)  NOT NULL,
+        BarTime     DATETIME2(0)  NOT NULL,
+        IntervalSec INT           NOT NULL,
+        [Open]      DECIMAL(18,6) NULL,
+        [High]      DECIMAL(18,6) NULL,
+        [Low]       DECIMAL(18,6) NULL,
+        [Close]     DECIMAL(18,6) NULL,
+        Volume      BIGINT        NULL,
+        CONSTRAINT PK_market_PriceBarIntra PRIMARY KEY {clustered} (Symbol, Source, BarTime, IntervalSec)
+            ON {INTRADAY_PS}(BarTime)
+    ) ON {INTRADAY_PS}(BarTime);
+
+    {columnstore}
+END
+"""
+
+LEGACY_INTRADAY = "PriceBarIntra_unpartitioned"
+INTRADAY_COLUMNS = "[Symbol],[Source],[BarTime],[IntervalSec],[Open],[High],[Low],[Close],[Volume]"
+
+def _intraday_scheme(conn) -> Optional[str]:
+    return conn.execute(text(
+        """
+        SELECT ps.name FROM sys.indexes i
+        JOIN sys.partition_schemes ps ON ps.data_space_id = i.data_space_id
+        WHERE i.object_id = OBJECT_ID(N'market.PriceBarIntra') AND i.index_id IN (0, 1)
+        """
+    )).scalar()
+
+def ensure_intraday_table(engine: Engine) -> None:
+    """Create PriceBarIntra partitioned (see INTRADAY_STORAGE) if missing and keep empty partitions
+    INTRADAY_PARTITION_MONTHS_AHEAD months into the future. An existing table without that layout is an
+    error unless INTRADAY_MIGRATE_UNPARTITIONED is set, in which case it is migrated first."""
+    storage = _intraday_storage()
+    today = date.today()
+    horizon = _add_months(_month_start(today), max(1, settings.INTRADAY_PARTITION_MONTHS_AHEAD))
+    first = date.fromisoformat(settings.INTRADAY_PARTITION_START)
+    ddl = _intraday_ddl(_intraday_boundaries(first, horizon), storage)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(ddl)
+        scheme = _intraday_scheme(conn)
+    if scheme != INTRADAY_PS:
+        if not settings.INTRADAY_MIGRATE_UNPARTITIONED:
+            raise RuntimeError(
+                f"market.PriceBarIntra exists without the {INTRADAY_PS} partition layout. Set "
+                "INTRADAY_MIGRATE_UNPARTITIONED=true to copy it into a partitioned table (month by month, "
+                "resumable), or rebuild it yourself; see INTRADAY_STORAGE.")
+        with engine.begin() as conn:
+            _set_aside_unpartitioned(conn)
+            conn.exec_driver_sql(ddl)
+    _copy_unpartitioned(engine)
+    with engine.begin() as conn:
+        last = conn.execute(text(
+            """
+            SELECT MAX(CAST(prv.value AS DATETIME2(0))) FROM sys.partition_range_values prv
+            JOIN sys.partition_functions pf ON pf.function_id = prv.function_id
+            WHERE pf.name = :pf
+            """
+        ), {"pf": INTRADAY_PF}).scalar()
+        # Split only ahead of the newest boundary, i.e. empty partitions: a metadata-only change
+        d = _add_months(_month_start(last.date() if last else first), 1)
+        while d <= horizon:
+            conn.exec_driver_sql(f"ALTER PARTITION SCHEME {INTRADAY_PS} NEXT USED [PRIMARY]")
+            conn.exec_driver_sql(f"ALTER PARTITION FUNCTION {INTRADAY_PF}() SPLIT RANGE ('{d.isoformat()}')")
+            d = _add_months(d, 1)
+
+def _set_aside_unpartitioned(conn) -> None:
+    # Rename the old table (and its PK, whose name the new table reuses) out of the way
+    log.warning("migrating market.PriceBarIntra to the %s partition layout", INTRADAY_PS)
+    conn.exec_driver_sql(f"""
+DECLARE @pk SYSNAME = (SELECT name FROM sys.key_constraints
+                       WHERE parent_object_id = OBJECT_ID(N'market.PriceBarIntra') AND type = 'PK');
+EXEC sp_rename N'market.PriceBarIntra', N'{LEGACY_INTRADAY}';
+IF @pk IS NOT NULL
+BEGIN
+    DECLARE @old NVARCHAR(300) = N'market.' + QUOTENAME(@pk), @new SYSNAME = @pk + N'_unpartitioned';
+    EXEC sp_rename @old, @new, N'OBJECT';
+END
+""")
+
+def _copy_unpartitioned(engine: Engine) -> None:
+    """Copy a set-aside unpartitioned PriceBarIntra into the partitioned one, one month per transaction,
+    then drop it. Months whose row counts already match are skipped, so an interrupted run resumes."""
+    legacy = f"market.{LEGACY_INTRADAY}"
+    with engine.begin() as conn:
+        if conn.execute(text(f"SELECT OBJECT_ID(N'{legacy}', 'U')")).scalar() is None:
+            return
+        lo, hi = conn.execute(text(f"SELECT MIN(BarTime), MAX(BarTime) FROM {legacy}")).one()
+    month = _month_start(lo.date()) if lo is not None else None
+    while month is not None and month <= hi.date():
+        params = {"lo": month, "hi": _add_months(month, 1)}
+        where = "WHERE BarTime >= :lo AND BarTime < :hi"
+        with engine.begin() as conn:
+            old_n = conn.execute(text(f"SELECT COUNT_BIG(*) FROM {legacy} {where}"), params).scalar()
+            new_n = conn.execute(text(f"SELECT COUNT_BIG(*) FROM market.PriceBarIntra {where}"), params).scalar()
+            if old_n != new_n:
+                conn.execute(text(f"DELETE FROM market.PriceBarIntra {where}"), params)
+                conn.execute(text(
+                    f"INSERT INTO market.PriceBarIntra WITH (TABLOCK) ({INTRADAY_COLUMNS}) "
+                    f"SELECT {INTRADAY_COLUMNS} FROM {legacy} {where}"), params)
+                log.info("PriceBarIntra migration: %s copied (%d rows)", month.isoformat()[:7], old_n)
+        month = _add_months(month, 1)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"DROP TABLE {legacy}")
+    log.warning("PriceBarIntra migration done; %s dropped", legacy)
+
+def compress_closed_intraday_partitions(engine: Engine) -> List[int]:
+    """Compress what has stopped changing. columnstore: every partition up to the current month, so after
+    a run outside the session only rows written since (the current day) remain in the rowstore delta
+    store. page: months that have ended are rebuilt. Returns the partition numbers touched."""
+    storage = _intraday_storage()
+    if storage == "rowstore":
+        return []
+    ensure_intraday_table(engine)
+    this_month = _month_start(date.today())
+    cutoff = _add_months(this_month, 1) if storage == "columnstore" else this_month
+    # RANGE RIGHT: partition n holds [boundary n-1, boundary n), so it is in range once boundary n <= cutoff
+    if storage == "columnstore":
+        pending_sql = f"""
+            SELECT DISTINCT rg.partition_number
+            FROM sys.dm_db_column_store_row_group_physical_stats rg
+            JOIN sys.partition_range_values prv ON prv.boundary_id = rg.partition_number
+            JOIN sys.partition_functions pf ON pf.function_id = prv.function_id AND pf.name = N'{INTRADAY_PF}'
+            WHERE rg.object_id = OBJECT_ID(N'market.PriceBarIntra') AND rg.state_desc IN ('OPEN', 'CLOSED')
+              AND CAST(prv.value AS DATETIME2(0)) <= :cutoff
+        """
+        alter = ("ALTER INDEX CCI_market_PriceBarIntra ON market.PriceBarIntra "
+                 "REORGANIZE PARTITION = {n} WITH (COMPRESS_ALL_ROW_GROUPS = ON)")
+    else:
+        pending_sql = f"""
+            SELECT p.partition_number
+            FROM sys.partitions p
+            JOIN sys.partition_range_values prv ON prv.boundary_id = p.partition_number
+            JOIN sys.partition_functions pf ON pf.function_id = prv.function_id AND pf.name = N'{INTRADAY_PF}'
+            WHERE p.object_id = OBJECT_ID(N'market.PriceBarIntra') AND p.index_id = 1
+              AND p.data_compression_desc = 'NONE' AND p.rows > 0
+              AND CAST(prv.value AS DATETIME2(0)) <= :cutoff
+        """
+        alter = ("ALTER INDEX PK_market_PriceBarIntra ON market.PriceBarIntra "
+                 "REBUILD PARTITION = {n} WITH (DATA_COMPRESSION = PAGE)")
+    with engine.connect() as conn:
+        partitions = [int(n) for n in conn.execute(text(pending_sql), {"cutoff": cutoff}).scalars()]
+    for n in partitions:
+        # One partition per transaction so a long rebuild doesn't hold locks on the others
+        with engine.begin() as conn:
+            conn.exec_driver_sql(alter.format(n=n))
+        log.info("PriceBarIntra partition %d compressed (%s)", n, storage)
+    return partitions
+
+# --- Watermark index: latest BarDate/BarTime per (symbol, source, interval), kept in process ---
+# EOD bars share the index under a fixed daily interval (EOD_INTERVAL_SEC); intraday bars use their IntervalSec.
+
+_wm_lock = Lock()
+_watermarks: Dict[Tuple[str, str, int], Optional[datetime]] = {}
+
+def _as_datetime(value: Union[str, date, datetime]) -> datetime:
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.fromisoformat(str(value).replace("Z", "")).replace(tzinfo=None)
+
+def _advance_watermark(symbol: str, source: str, interval_sec: int, values) -> None:
+    # Only ever moves forward; called after the write has committed
+    latest = max((_as_datetime(v) for v in values), default=None)
+    if latest is None:
+        return
+    invalidate_latest(symbol, source, interval_sec)
+    key = (symbol, source, interval_sec)
+    with _wm_lock:
+        current = _watermarks.get(key)
+        if current is None or latest > current:
+            _watermarks[key] = latest
+
+def _advance_chunk_watermarks(rows: List[dict], time_col: str, interval_of) -> None:
+    groups: Dict[Tuple[str, str, int], list] = {}
+    for r in rows:
+        groups.setdefault((r["Symbol"], r["Source"], interval_of(r)), []).append(r[time_col])
+    for (sym, src, isec), values in groups.items():
+        _advance_watermark(sym, src, isec, values)
+
+def load_watermarks(engine: Engine) -> int:
+    """(Re)load every watermark with one grouped query per table; returns the number of keys loaded."""
+    schema = settings.SQLSERVER_DB_SCHEMA
+    loaded: Dict[Tuple[str, str, int], Optional[datetime]] = {}
+    with engine.begin() as conn:
+        rows = conn.execute(text(
+            f"""
+            SELECT [Symbol], [Source], MAX([BarDate])
+            FROM [{schema}].[PriceBar]
+            GROUP BY [Symbol], [Source]
+            """
+        )).all()
+        for sym, src, latest in rows:
+            loaded[(sym, src, EOD_INTERVAL_SEC)] = _as_datetime(latest)
+        if conn.execute(text("SELECT OBJECT_ID(:name, 'U')"), {"name": f"{schema}.PriceBarIntra"}).scalar():
+            rows = conn.execute(text(
+                f"""
+                SELECT [Symbol], [Source], [IntervalSec], MAX([BarTime])
+                FROM [{schema}].[PriceBarIntra]
+                GROUP BY [Symbol], [Source], [IntervalSec]
+                """
+            )).all()
+            for sym, src, isec, latest in rows:
+                loaded[(sym, src, int(isec))] = _as_datetime(latest)
+    with _wm_lock:
+        _watermarks.clear()
+        _watermarks.update(loaded)
+    return len(loaded)
+
+def _cached_watermark(key: Tuple[str, str, int]):
+    # Returns (hit, value); a cached None means "looked up, no rows yet"
+    with _wm_lock:
+        if key in _watermarks:
+            return True, _watermarks[key]
+    return False, None
+
+def _store_watermark(key: Tuple[str, str, int], value) -> Optional[datetime]:
+    # The DB answer is authoritative (it already includes every committed write)
+    latest = None if value is None else _as_datetime(value)
+    with _wm_lock:
+        _watermarks[key] = latest
+    return latest
+
+def get_latest_date(engine: Engine, symbol: str, source: str, refresh: bool = False) -> Optional[str]:
+    key = (symbol, source, EOD_INTERVAL_SEC)
+    hit, latest = _cached_watermark(key)
+    if hit and not refresh:
+        return None if latest is None else latest.date().isoformat()
     with engine.begin() as conn:
         row = conn.execute(text(
             f"""
-            SELECT CONVERT(varchar(10), MAX([BarDate]), 23)
+            SELECT MAX([BarDate])
             FROM [{settings.SQLSERVER_DB_SCHEMA}].[PriceBar]
             WHERE [Symbol] = :symbol AND [Source] = :source
             """
         ), {"symbol": symbol, "source": source}).scalar()
-        return row # ISO string or None
-    
+    latest = _store_watermark(key, row)
+    return None if latest is None else latest.date().isoformat() # ISO string or None
+
 MERGE_SQL = text(
     f"""
     MERGE [{settings.SQLSERVER_DB_SCHEMA}].[PriceBar] AS target
@@ -78,6 +362,71 @@ MERGE_SQL = text(
 def upsert_bar(engine: Engine, payload: dict) -> None:
     with engine.begin() as conn:
         conn.execute(MERGE_SQL, payload)
+    rows_written("PriceBar", 1)
+    _advance_watermark(payload["Symbol"], payload["Source"], EOD_INTERVAL_SEC, [payload["BarDate"]])
+
+# --- Bulk EOD writer: stage a chunk in a session temp table, then one set-based MERGE ---
+STAGE_BARS_DDL = """
+IF OBJECT_ID(N'tempdb..#PriceBarStage') IS NOT NULL DROP TABLE #PriceBarStage;
+CREATE TABLE #PriceBarStage (
+    Symbol   NVARCHAR(20)  NOT NULL,
+    Source   NVARCHAR(32)  NOT NULL,
+    BarDate  DATETIME2(0)  NOT NULL,
+    [Open]   DECIMAL(18,6) NULL,
+    [High]   DECIMAL(18,6) NULL,
+    [Low]    DECIMAL(18,6) NULL,
+    [Close]  DECIMAL(18,6) NULL,
+    Volume   BIGINT        NULL,
+    AdjClose DECIMAL(18,6) NULL
+);
+"""
+
+STAGE_BARS_INSERT = text(
+    """
+    INSERT INTO #PriceBarStage ([Symbol],[Source],[BarDate],[Open],[High],[Low],[Close],[Volume],[AdjClose])
+    VALUES (:Symbol,:Source,:BarDate,:Open,:High,:Low,:Close,:Volume,:AdjClose)
+    """
+)
+
+MERGE_BARS_FROM_STAGE = text(
+    f"""
+    MERGE [{settings.SQLSERVER_DB_SCHEMA}].[PriceBar] AS target
+    USING #PriceBarStage AS src
+    ON target.Symbol = src.Symbol AND target.Source = src.Source AND target.BarDate = src.BarDate
+    WHEN MATCHED THEN UPDATE SET
+        [Open] = src.[Open], [High] = src.[High], [Low] = src.[Low],
+        [Close] = src.[Close], [Volume] = src.[Volume], [AdjClose] = src.[AdjClose]
+    WHEN NOT MATCHED THEN INSERT
+        ([Symbol],[Source],[BarDate],[Open],[High],[Low],[Close],[Volume],[AdjClose])
+        VALUES (src.Symbol,src.Source,src.BarDate,src.[Open],src.[High],src.[Low],src.[Close],src.[Volume],src.[AdjClose])
+    OUTPUT $action;
+    """
+)
+
+def _merged(result) -> int:
+    # One OUTPUT $action row per target row the MERGE actually inserted or updated
+    return len(result.fetchall())
+
+def bulk_upsert_bars(engine: Engine, rows: List[dict], chunk_size: Optional[int] = None) -> int:
+    """Upsert many PriceBar rows: fast_executemany into #PriceBarStage, one MERGE and commit per chunk."""
+    if not rows:
+        return 0
+    size = max(1, chunk_size or settings.BULK_CHUNK_SIZE)
+    written = 0
+    with engine.connect() as conn:
+        conn.exec_driver_sql(STAGE_BARS_DDL)
+        for i in range(0, len(rows), size):
+            chunk = rows[i:i + size]
+            conn.execute(STAGE_BARS_INSERT, chunk)
+            merged = _merged(conn.execute(MERGE_BARS_FROM_STAGE))
+            conn.exec_driver_sql("TRUNCATE TABLE #PriceBarStage")
+            conn.commit()
+            _advance_chunk_watermarks(chunk, "BarDate", lambda r: EOD_INTERVAL_SEC)
+            rows_written("PriceBar", merged)
+            written += merged
+        conn.exec_driver_sql("DROP TABLE #PriceBarStage")
+        conn.commit()
+    return written
 
 # --- Intraday helpers ---
 MERGE_INTRADAY = text(
@@ -94,14 +443,74 @@ MERGE_INTRADAY = text(
 def upsert_intraday(engine: Engine, payload: dict) -> None:
     with engine.begin() as conn:
         conn.execute(MERGE_INTRADAY, payload)
+    rows_written("PriceBarIntra", 1)
+    _advance_watermark(payload["Symbol"], payload["Source"], int(payload["IntervalSec"]), [payload["BarTime"]])
+
+# --- Batched intraday writer: one staged MERGE per fetched response, unchanged bars skipped ---
+STAGE_INTRADAY_DDL = """
+IF OBJECT_ID(N'tempdb..#PriceBarIntraStage') IS NOT NULL DROP TABLE #PriceBarIntraStage;
+CREATE TABLE #PriceBarIntraStage (
+    Symbol      NVARCHAR(20)  NOT NULL,
+    Source      NVARCHAR(32)  NOT NULL,
+    BarTime     DATETIME2(0)  NOT NULL,
+    IntervalSec INT           NOT NULL,
+    [Open]      DECIMAL(18,6) NULL,
+    [High]      DECIMAL(18,6) NULL,
+    [Low]       DECIMAL(18,6) NULL,
+    [Close]     DECIMAL(18,6) NULL,
+    Volume      BIGINT        NULL,
+    PRIMARY KEY (Symbol, Source, BarTime, IntervalSec)
+);
+"""
+
+STAGE_INTRADAY_INSERT = text(
+    """
+    INSERT INTO #PriceBarIntraStage ([Symbol],[Source],[BarTime],[IntervalSec],[Open],[High],[Low],[Close],[Volume])
+    VALUES (:Symbol,:Source,:BarTime,:IntervalSec,:Open,:High,:Low,:Close,:Volume)
+    """
+)
+
+# EXCEPT compares NULLs as equal, so a bar is only rewritten when its OHLCV actually changed
+MERGE_INTRADAY_FROM_STAGE = text(
+    f"""
+    MERGE [{settings.SQLSERVER_DB_SCHEMA}].[PriceBarIntra] AS t
+    USING #PriceBarIntraStage AS src
+    ON t.Symbol=src.Symbol AND t.Source=src.Source AND t.BarTime=src.BarTime AND t.IntervalSec=src.IntervalSec
+    WHEN MATCHED AND EXISTS (
+        SELECT src.[Open],src.[High],src.[Low],src.[Close],src.[Volume]
+        EXCEPT
+        SELECT t.[Open],t.[High],t.[Low],t.[Close],t.[Volume]
+    ) THEN UPDATE SET [Open]=src.[Open],[High]=src.[High],[Low]=src.[Low],[Close]=src.[Close],[Volume]=src.[Volume]
+    WHEN NOT MATCHED THEN INSERT ([Symbol],[Source],[BarTime],[IntervalSec],[Open],[High],[Low],[Close],[Volume])
+    VALUES (src.Symbol,src.Source,src.BarTime,src.IntervalSec,src.[Open],src.[High],src.[Low],src.[Close],src.[Volume])
+    OUTPUT $action;
+    """
+)
 
-def get_last_intraday_time(engine: Engine, symbol: str, source: str, interval_sec: int) -> Optional[str]:
+def bulk_upsert_intraday(engine: Engine, rows: List[dict]) -> int:
+    """Write a whole intraday response in one transaction; returns the number of bars inserted or changed."""
+    if not rows:
+        return 0
     with engine.begin() as conn:
-        row = conn.execute(text(
-            f"""
-            SELECT CONVERT(varchar(19), MAX([BarTime]), 120) -- yyyy-mm-dd hh:MM:ss
-            FROM [{settings.SQLSERVER_DB_SCHEMA}].[PriceBarIntra]
-            WHERE [Symbol] = :symbol AND [Source] = :source AND [IntervalSec] = :isec
-            """
-        ), {"symbol": symbol, "source": source, "isec": interval_sec}).scalar()
-        return row # ISO-like string or None
\ No newline at end of file
+        conn.exec_driver_sql(STAGE_INTRADAY_DDL)
+        conn.execute(STAGE_INTRADAY_INSERT, rows)
+        written = _merged(conn.execute(MERGE_INTRADAY_FROM_STAGE))
+        conn.exec_driver_sql("DROP TABLE #PriceBarIntraStage")
+    _advance_chunk_watermarks(rows, "BarTime", lambda r: int(r["IntervalSec"]))
+    rows_written("PriceBarIntra", written)
+    return written
+
+def get_last_intraday_time(engine: Engine, symbol: str, source: str, interval_sec: int, refresh: bool = False) -> Optional[str]:
+    key = (symbol, source, interval_sec)
+    hit, latest = _cached_watermark(key)
+    if not hit or refresh:
+        with engine.begin() as conn:
+            row = conn.execute(text(
+                f"""
+                SELECT MAX([BarTime])
+                FROM [{settings.SQLSERVER_DB_SCHEMA}].[PriceBarIntra]
+                WHERE [Symbol] = :symbol AND [Source] = :source AND [IntervalSec] = :isec
+                """
+            ), {"symbol": symbol, "source": source, "isec": interval_sec}).scalar()
+        latest = _store_watermark(key, row)
+    return None if latest is None else latest.strftime("%Y-%m-%d %H:%M:%S") # yyyy-mm-dd hh:MM:ss or None
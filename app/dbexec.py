@@ -0,0 +1,170 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from threading import Lock
+from typing import Any, Callable, Dict, Optional
+import asyncio
+import time
+
+from fastapi import HTTPException
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+from .config import settings
+from .db import make_engine
+from .metrics import instrument_engine, observe_pool_wait
+
+# DB execution layer: API reads get their own engine/pool ("api") and a bounded executor, separate
+# from the ingest/scheduler engine ("ingest", app.ingest.get_engine). Pool waits are measured per role.
+
+
+class PoolStats:
+    def __init__(self, role: str):
+        self.role = role
+        self._lock = Lock()
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    def record(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            self.waits += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+        observe_pool_wait(self.role, seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checkouts": self.waits,
+                "wait_avg_ms": round(1000 * self.wait_total / self.waits, 3) if self.waits else 0.0,
+                "wait_max_ms": round(1000 * self.wait_max, 3),
+                "wait_total_s": round(self.wait_total, 3),
+                "timeouts": self.timeouts,
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    stats: Optional[PoolStats] = None
+
+    def _do_get(self):
+        t = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except Exception:
+            if self.stats is not None:
+                self.stats.record(time.perf_counter() - t, timed_out=True)
+            raise
+        if self.stats is not None:
+            self.stats.record(time.perf_counter() - t)
+        return conn
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+pool_stats: Dict[str, PoolStats] = {"api": PoolStats("api"), "ingest": PoolStats("ingest")}
+
+def make_role_engine(role: str) -> Engine:
+    prefix = "DB_API" if role == "api" else "DB_INGEST"
+    engine = make_engine(
+        poolclass=TimedQueuePool,
+        pool_size=getattr(settings, f"{prefix}_POOL_SIZE"),
+        max_overflow=getattr(settings, f"{prefix}_MAX_OVERFLOW"),
+        pool_timeout=getattr(settings, f"{prefix}_POOL_TIMEOUT"),
+    )
+    engine.pool.stats = pool_stats[role]
+    instrument_engine(engine, role)
+    return engine
+
+_read_engine: Optional[Engine] = None
+_read_lock = Lock()
+
+def get_read_engine() -> Engine:
+    global _read_engine
+    if _read_engine is None:
+        with _read_lock:
+            if _read_engine is None:
+                _read_engine = make_role_engine("api")
+    return _read_engine
+
+
+class DbExecutor:
+    """Runs blocking DB calls on a dedicated thread pool; beyond workers + queue it rejects with 503."""
+
+    def __init__(self, name: str, workers: int, max_queue: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.capacity = self.workers + max(0, max_queue)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"db-{name}")
+        self._lock = Lock()
+        self.inflight = 0
+        self.rejected = 0
+
+    def _take(self) -> None:
+        with self._lock:
+            if self.inflight >= self.capacity:
+                self.rejected += 1
+                raise HTTPException(status_code=503, detail="Database busy, retry shortly",
+                                    headers={"Retry-After": "1"})
+            self.inflight += 1
+
+    def _give(self) -> None:
+        with self._lock:
+            self.inflight -= 1
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        self._take()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, partial(fn, *args, **kwargs))
+        finally:
+            self._give()
+
+    def reserve(self) -> Callable[[], None]:
+        """Take a slot for DB work that runs outside the pool (a streamed response reading as it sends);
+        503 when full. Returns the release function, which is safe to call more than once."""
+        self._take()
+        lock, released = Lock(), []
+
+        def release() -> None:
+            with lock:
+                if released:
+                    return
+                released.append(True)
+            self._give()
+        return release
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"workers": self.workers, "capacity": self.capacity, "inflight": self.inflight,
+                    "rejected": self.rejected}
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False)
+
+
+api_db = DbExecutor("api", settings.API_DB_WORKERS, settings.API_DB_MAX_QUEUE)
+
+def fetch_all(sql, params: dict) -> list:
+    with get_read_engine().connect() as conn:
+        return [dict(r) for r in conn.execute(sql, params).mappings().all()]
+
+def pools_status() -> Dict[str, Any]:
+    from .ingest import _engine as ingest_engine
+    status: Dict[str, Any] = {}
+    for role, engine in (("api", _read_engine), ("ingest", ingest_engine)):
+        entry: Dict[str, Any] = dict(pool_stats[role].snapshot())
+        if engine is not None:
+            pool = engine.pool
+            entry.update({"size": pool.size(), "checked_out": pool.checkedout(), "overflow": pool.overflow()})
+        status[role] = entry
+    status["api_executor"] = api_db.snapshot()
+    return status
@@ -0,0 +1,214 @@
+from __future__ import annotations
+from datetime import date, datetime
+from typing import Any, Callable, Iterator, List, Sequence
+import csv
+import io
+
+import simplejson as json
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import TextClause
+from starlette.background import BackgroundTask
+
+from .config import settings
+from .dbexec import api_db, get_read_engine
+
+# Streamed export formats for history endpoints; "json" keeps the buffered {"data": [...]} response
+STREAM_FORMATS = ("ndjson", "csv")
+COLUMNAR_FORMATS = ("arrow", "parquet")
+FORMAT_PATTERN = "^(?i)(json|ndjson|csv|arrow|parquet)$"
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Arrow column types per history column (DECIMAL -> float64, DATETIME2 -> timestamp)
+ARROW_TYPES = {
+    "Symbol": "string",
+    "Source": "string",
+    "BarDate": "timestamp[s]",
+    "BarTime": "timestamp[s]",
+    "IntervalSec": "int64",
+    "Open": "float64",
+    "High": "float64",
+    "Low": "float64",
+    "Close": "float64",
+    "Volume": "int64",
+    "AdjClose": "float64",
+}
+
+def _default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def _csv_value(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return "" if value is None else value
+
+def iter_partitions(sql: TextClause, params: dict) -> Iterator[Sequence]:
+    """Yield result rows in blocks of HISTORY_STREAM_BATCH_SIZE without materializing the result set.
+
+    The first item is the column list; the connection stays checked out until the generator finishes.
+    """
+    with get_read_engine().connect() as conn:
+        result = conn.execution_options(yield_per=settings.HISTORY_STREAM_BATCH_SIZE).execute(sql, params)
+        yield list(result.keys())
+        for block in result.partitions():
+            yield block
+
+def row_block(block: Any) -> Sequence:
+    """A block as row tuples; blocks are row sequences from the cursor or Arrow RecordBatches (history tier)."""
+    if hasattr(block, "columns") and hasattr(block, "num_rows"):
+        return list(zip(*(col.to_pylist() for col in block.columns)))
+    return block
+
+def _ndjson(parts: Iterator[Sequence]) -> Iterator[bytes]:
+    columns: List[str] = next(parts)
+    for block in map(row_block, parts):
+        yield "".join(
+            json.dumps(dict(zip(columns, row)), default=_default, use_decimal=True) + "\n" for row in block
+        ).encode("utf-8")
+
+def _csv(parts: Iterator[Sequence]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(next(parts))
+    for block in map(row_block, parts):
+        writer.writerows([_csv_value(v) for v in row] for row in block)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate(0)
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+def stream_rows(sql: TextClause, params: dict, fmt: str, filename: str) -> StreamingResponse:
+    return _stream_parts(iter_partitions(sql, params), fmt, filename)
+
+def _stream_parts(parts: Iterator[Sequence], fmt: str, filename: str) -> StreamingResponse:
+    fmt = fmt.lower()
+    body = _ndjson(parts) if fmt == "ndjson" else _csv(parts)
+    headers = {"Content-Disposition": f'inline; filename="{filename}.{fmt}"'}
+    return _bounded_response(body, MEDIA_TYPES[fmt], headers)
+
+def _bounded_response(body: Iterator[bytes], media_type: str, headers: dict) -> StreamingResponse:
+    # A streamed body reads from the DB while it sends, so it holds an api_db slot (503 when none is free)
+    # until it ends; the background task covers clients that disconnect before the body starts
+    release = api_db.reserve()
+    return StreamingResponse(_releasing(body, release), media_type=media_type, headers=headers,
+                             background=BackgroundTask(release))
+
+def _releasing(body: Iterator[bytes], release: Callable[[], None]) -> Iterator[bytes]:
+    try:
+        yield from body
+    finally:
+        release()
+
+def parts_response(parts: Iterator[Sequence], fmt: str, filename: str):
+    """Render an iter_partitions-shaped iterator (column list, then row blocks) in any supported format."""
+    fmt = fmt.lower()
+    if fmt in STREAM_FORMATS:
+        return _stream_parts(parts, fmt, filename)
+    if fmt in COLUMNAR_FORMATS:
+        return _columnar_response(parts, fmt, filename)
+    columns: List[str] = next(parts)
+    return {"data": [dict(zip(columns, row)) for block in map(row_block, parts) for row in block]}
+
+def _arrow():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise HTTPException(status_code=501, detail="pyarrow is not installed; arrow/parquet output unavailable")
+    return pa
+
+def _arrow_schema(pa, columns: List[str]):
+    types = {
+        "string": pa.string(), "int64": pa.int64(), "float64": pa.float64(), "timestamp[s]": pa.timestamp("s"),
+    }
+    return pa.schema([(c, types[ARROW_TYPES.get(c, "string")]) for c in columns])
+
+def _to_arrow(pa, values: list, target):
+    # DECIMAL(18,6) columns arrive as Decimal: converting with an explicit decimal type and casting
+    # is far cheaper than letting Arrow infer; anything else (floats, odd scales) converts directly
+    if pa.types.is_floating(target):
+        try:
+            return pa.array(values, type=pa.decimal128(18, 6)).cast(target)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            pass
+    return pa.array(values, type=target)
+
+def record_batches(parts: Iterator[Sequence]) -> Iterator[Any]:
+    """Turn cursor blocks into typed Arrow record batches, column by column (no per-row dicts)."""
+    pa = _arrow()
+    columns: List[str] = next(parts)
+    schema = _arrow_schema(pa, columns)
+    yield schema
+    for block in parts:
+        if isinstance(block, pa.RecordBatch):
+            # Already typed (history tier): pass through without a round trip via Python objects
+            if block.num_rows:
+                yield block if block.schema.equals(schema) else block.cast(schema)
+            continue
+        if not block:
+            continue
+        arrays = [_to_arrow(pa, list(col), field.type) for col, field in zip(zip(*block), schema)]
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only sink that hands out what has been written so far; tell() stays cumulative
+    so Parquet footers get correct offsets."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        data = bytes(b)
+        self._chunks.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks.clear()
+        return out
+
+def _columnar(parts: Iterator[Sequence], fmt: str) -> Iterator[bytes]:
+    # Arrow IPC stream or Parquet (one row group per cursor block), flushed to the client per block
+    pa = _arrow()
+    batches = record_batches(parts)
+    schema = next(batches)
+    sink = _ChunkSink()
+    out = pa.PythonFile(sink, mode="w")
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(out, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_stream(out, schema)
+    for batch in batches:
+        writer.write_batch(batch)
+        chunk = sink.drain()
+        if chunk:
+            yield chunk
+    writer.close()
+    yield sink.drain()
+
+def columnar_response(sql: TextClause, params: dict, fmt: str, filename: str) -> StreamingResponse:
+    return _columnar_response(iter_partitions(sql, params), fmt, filename)
+
+def _columnar_response(parts: Iterator[Sequence], fmt: str, filename: str) -> StreamingResponse:
+    fmt = fmt.lower()
+    _arrow() # fail with 501 before the response starts if pyarrow is missing
+    ext = "arrows" if fmt == "arrow" else fmt
+    headers = {"Content-Disposition": f'attachment; filename="{filename}.{ext}"'}
+    return _bounded_response(_columnar(parts, fmt), MEDIA_TYPES[fmt], headers)
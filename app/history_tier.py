@@ -0,0 +1,156 @@
+from __future__ import annotations
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import os
+
+from sqlalchemy import TextClause, text
+from sqlalchemy.engine import Engine
+
+from .config import settings
+from .export import _arrow, iter_partitions, record_batches
+
+# Optional local tier for closed EOD years: one uncompressed Arrow IPC file per (source, symbol, year)
+# under HISTORY_TIER_DIR, read through memory maps. The current year always comes from SQL Server.
+EOD_COLUMNS = ["Symbol", "Source", "BarDate", "Open", "High", "Low", "Close", "Volume", "AdjClose"]
+
+def tier_enabled() -> bool:
+    return bool(settings.HISTORY_TIER_DIR)
+
+def _path(source: str, symbol: str, year: int) -> str:
+    return os.path.join(settings.HISTORY_TIER_DIR, source, symbol, f"{year}.arrow")
+
+def _closed_year(year: int) -> bool:
+    return year < date.today().year
+
+def _select_eod(where: str, order_sql: str = "ASC") -> TextClause:
+    return text(
+        f"""
+        SELECT {",".join(f"[{c}]" for c in EOD_COLUMNS)}
+        FROM [{settings.SQLSERVER_DB_SCHEMA}].[PriceBar]
+        WHERE [Symbol] = :symbol AND [Source] = :source {where}
+        ORDER BY [BarDate] {order_sql}
+        """
+    )
+
+def _file_rows(path: str) -> Optional[int]:
+    pa = _arrow()
+    try:
+        with pa.memory_map(path, "r") as source:
+            reader = pa.ipc.open_file(source)
+            return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+    except (FileNotFoundError, OSError):
+        return None
+
+def write_year(symbol: str, source: str, year: int) -> int:
+    """Snapshot one closed year of PriceBar into the tier (atomic replace); returns rows written."""
+    pa = _arrow()
+    params = {"symbol": symbol, "source": source, "y0": f"{year}-01-01", "y1": f"{year + 1}-01-01"}
+    batches = record_batches(iter_partitions(_select_eod("AND [BarDate] >= :y0 AND [BarDate] < :y1"), params))
+    schema = next(batches)
+    path = _path(source, symbol, year)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    rows = 0
+    with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    os.replace(tmp, path)
+    return rows
+
+def sync_tier(engine: Engine, symbols: Optional[List[str]] = None, source: Optional[str] = None) -> Dict[str, List[int]]:
+    """Write every closed year whose file is missing or whose row count no longer matches the DB
+    (e.g. after a backfill). One grouped count query decides what to (re)write."""
+    if not tier_enabled():
+        return {}
+    src = source or settings.SOURCE_EOD
+    wanted = {s.upper() for s in (symbols or settings.SYMBOLS)}
+    with engine.begin() as conn:
+        counts = conn.execute(text(
+            f"""
+            SELECT [Symbol], YEAR([BarDate]) AS Y, COUNT(*) AS N
+            FROM [{settings.SQLSERVER_DB_SCHEMA}].[PriceBar]
+            WHERE [Source] = :source AND [BarDate] < :this_year
+            GROUP BY [Symbol], YEAR([BarDate])
+            """
+        ), {"source": src, "this_year": f"{date.today().year}-01-01"}).all()
+    written: Dict[str, List[int]] = {}
+    for sym, year, n in counts:
+        if sym not in wanted:
+            continue
+        if _file_rows(_path(src, sym, int(year))) != int(n):
+            write_year(sym, src, int(year))
+            written.setdefault(sym, []).append(int(year))
+    return written
+
+def _year_table(symbol: str, source: str, year: int, start: Optional[str], end: Optional[str]):
+    pa = _arrow()
+    import pyarrow.compute as pc
+    # memory_map: pages come straight from the OS cache; the uncompressed IPC buffers are used in place
+    with pa.memory_map(_path(source, symbol, year), "r") as mm:
+        table = pa.ipc.open_file(mm).read_all()
+    mask = None
+    if start:
+        mask = pc.greater_equal(table["BarDate"], pa.scalar(datetime.fromisoformat(start), pa.timestamp("s")))
+    if end:
+        upper = pc.less_equal(table["BarDate"], pa.scalar(datetime.fromisoformat(end), pa.timestamp("s")))
+        mask = upper if mask is None else pc.and_(mask, upper)
+    return table if mask is None else table.filter(mask)
+
+def _table_blocks(table) -> Iterator[Any]:
+    # RecordBatches as they are: arrow/parquet write them straight out, row formats unpack them (export.row_block)
+    yield from table.to_batches(max_chunksize=settings.HISTORY_STREAM_BATCH_SIZE)
+
+def eod_partitions(symbol: str, source: str, start: Optional[str], end: Optional[str], order: str) -> Iterator[Sequence]:
+    """iter_partitions-shaped history: closed years from tier files (as Arrow RecordBatches), everything
+    else from SQL Server (as row tuples). `start`/`end` are ISO dates or datetimes."""
+    first = datetime.fromisoformat(start).year if start else None
+    last = datetime.fromisoformat(end).year if end else date.today().year
+    tier_root = os.path.join(settings.HISTORY_TIER_DIR, source, symbol)
+    on_disk = set()
+    if os.path.isdir(tier_root):
+        on_disk = {int(f[:-6]) for f in os.listdir(tier_root) if f.endswith(".arrow") and f[:-6].isdigit()}
+    if first is None:
+        first = min(on_disk, default=last)
+
+    # Ordered segments: ("tier", year) or ("sql", from, to) for the gaps, merged into ranges
+    segments: List[Tuple] = []
+    for year in range(first, last + 1):
+        if year in on_disk and _closed_year(year):
+            segments.append(("tier", year))
+        elif segments and segments[-1][0] == "sql":
+            segments[-1] = ("sql", segments[-1][1], year)
+        else:
+            segments.append(("sql", year, year))
+    if not start:
+        # Anything older than the first requested year that isn't tiered (e.g. pre-tier data)
+        if segments and segments[0][0] == "sql":
+            segments[0] = ("sql", None, segments[0][2])
+        else:
+            segments.insert(0, ("sql", None, first - 1))
+    if order.lower() == "desc":
+        segments.reverse()
+
+    yield list(EOD_COLUMNS)
+    for seg in segments:
+        if seg[0] == "tier":
+            table = _year_table(symbol, source, seg[1], start, end)
+            if order.lower() == "desc":
+                table = table.take(list(range(table.num_rows - 1, -1, -1)))
+            yield from _table_blocks(table)
+            continue
+        _, y0, y1 = seg
+        params = {"symbol": symbol, "source": source}
+        where = []
+        lo = start if start and (y0 is None or start > f"{y0}-01-01") else (f"{y0}-01-01" if y0 else None)
+        if lo:
+            params["lo"] = lo
+            where.append("AND [BarDate] >= CONVERT(date, :lo)")
+        if y1 < date.today().year or end:
+            hi = min(end, f"{y1}-12-31") if end else f"{y1}-12-31"
+            params["hi"] = hi
+            where.append("AND [BarDate] <= CONVERT(date, :hi)")
+        sql = _select_eod(" ".join(where), "DESC" if order.lower() == "desc" else "ASC")
+        parts = iter_partitions(sql, params)
+        next(parts)
+        yield from parts
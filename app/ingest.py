@@ -1,23 +1,36 @@
 from __future__ import annotations
 from datetime import datetime, date, timedelta
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional
+import logging
 import time
-import math
 import pandas as pd
 
 
 from .config import settings
-from .db import make_engine, ensure_schema_and_table, get_latest_date, upsert_bar
+from .db import ensure_schema_and_table, load_watermarks, get_latest_date, upsert_bar, bulk_upsert_bars
+from .dbexec import make_role_engine
+from .latest import EOD_INTERVAL_SEC
+from .logs import log_payload
+from .singleflight import SingleFlight
 from .tiingo_client import tiingo_client
 
+log = logging.getLogger(__name__)
+
 _engine = None
+_engine_lock = Lock()
 _last_run_utc: datetime | None = None
 
 def get_engine():
     global _engine
     if _engine is None:
-        _engine = make_engine()
-        ensure_schema_and_table(_engine)
+        with _engine_lock:
+            if _engine is None:
+                engine = make_role_engine("ingest")
+                ensure_schema_and_table(engine)
+                load_watermarks(engine)
+                _engine = engine
     return _engine
 
 # def get_engine() -> Engine:
@@ -28,6 +41,8 @@ def get_engine():
 def _parse_symbols(raw: str) -> List[str]:
     return [s.strip().upper() for s in raw.split(',') if s.strip()]
 
+_flights = SingleFlight("eod")
+
 def _iso_to_date(iso: str) -> date:
     return datetime.fromisoformat(iso).date()
 
@@ -35,32 +50,31 @@ def _next_day(iso: str) -> str:
     return (_iso_to_date(iso) + timedelta(days=1)).isoformat()
 
 def fetch_prices_for_symbol(symbol: str) -> int:
-    print("into fetch_prices_for_symbol")
+    # Concurrent callers for the same symbol share one fetch; a just-finished one is reused for EOD_FRESH_SECONDS
+    return _flights.do((symbol, settings.SOURCE_EOD, EOD_INTERVAL_SEC), lambda: _fetch_prices_for_symbol(symbol),
+                       settings.EOD_FRESH_SECONDS)
+
+def _fetch_prices_for_symbol(symbol: str) -> int:
     engine = get_engine()
     latest = get_latest_date(engine, symbol, settings.SOURCE_EOD)
 
     start_iso = _next_day(latest) if latest else settings.INIT_START_DATE
-    print("start_iso: ", start_iso)
-
     end_iso = date.today().isoformat()
-    print("end_iso: ", end_iso)
+    log.debug("eod %s: window %s..%s", symbol, start_iso, end_iso)
 
     # Nothing to do
     if start_iso > end_iso:
-        print("nothing to do returning")
         return 0
-    
-    print("about to get_dataframe")
+
     df: pd.DataFrame = tiingo_client.get_dataframe(
         symbol,
         startDate=start_iso,
         endDate=end_iso,
         frequency="daily",
     )
-    print("end get_dataframe")
 
     if df is None or df.empty:
-        print("empty dataframe returning")
+        log.debug("eod %s: empty response", symbol)
         return 0
     
     # Normalize columns
@@ -68,8 +82,38 @@ def fetch_prices_for_symbol(symbol: str) -> int:
         if col not in df.columns:
             df[col] = pd.NA
 
-    print(df)
+    log_payload(log, "eod %s response", df, symbol)
+
+    t0 = time.perf_counter()
+    if settings.EOD_BULK_UPSERT:
+        count = bulk_upsert_bars(engine, _eod_payload(symbol, df))
+    else:
+        count = _upsert_rows(engine, symbol, df)
+    elapsed = time.perf_counter() - t0
+    log.info("upsert %s: %d rows in %.2fs (%.0f rows/s, %s path)", symbol, count, elapsed,
+             count / max(elapsed, 1e-9), "bulk" if settings.EOD_BULK_UPSERT else "row")
+    return count
 
+def _num(col: pd.Series):
+    return pd.to_numeric(col, errors="coerce").astype("float64").to_numpy()
+
+def _eod_payload(symbol: str, df: pd.DataFrame) -> List[dict]:
+    # Vectorized equivalent of the per-row payload built in _upsert_rows
+    payload = pd.DataFrame({
+        "Symbol": symbol,
+        "Source": settings.SOURCE_EOD,
+        "BarDate": pd.DatetimeIndex(pd.to_datetime(df.index)).strftime("%Y-%m-%d"),
+        "Open": _num(df["open"]),
+        "High": _num(df["high"]),
+        "Low": _num(df["low"]),
+        "Close": _num(df["close"]),
+        "Volume": pd.array(_num(df["volume"]).round(), dtype="Int64"),
+        "AdjClose": _num(df["adjClose"]),
+    }).astype(object)
+    # plain Python values with NaN/NA mapped to None (what pyodbc expects)
+    return payload.where(payload.notna(), None).to_dict("records")
+
+def _upsert_rows(engine, symbol: str, df: pd.DataFrame) -> int:
     # Index is datetime; normalize to date string YYYY-MM-DD
     count = 0
     for idx, row in df.iterrows():
@@ -88,25 +132,70 @@ def fetch_prices_for_symbol(symbol: str) -> int:
         }
         upsert_bar(engine, payload)
         count += 1
-    print("upsert_bar count: ", count)
     return count
 
-def run_ingest_once() -> Dict[str, Any]:
-    print("about to run_ingest_once")
+def _report(progress: Optional[Callable[[str, Dict[str, Any]], None]], symbol: str, **state: Any) -> None:
+    # Per-symbol progress hook for background jobs (app.jobs)
+    if progress is not None:
+        progress(symbol, state)
+
+def run_ingest_once(symbols: Optional[List[str]] = None,
+                    progress: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    # Pacing comes from the shared token bucket every Tiingo call passes, not a fixed sleep; a failing
+    # symbol is recorded and the rest still run, and symbols past the daily budget are skipped
+    # Imported here: usage -> ingest would be circular at module load
+    from .usage import can_make_call
     global _last_run_utc
-    print("last_run_utc: ", _last_run_utc)
-    # symbols = _parse_symbols(settings.SYMBOLS)
-    symbols = settings.SYMBOLS
-    print("symbols: ", symbols)
-    totals = {}
-    for i, sym in enumerate(symbols):
-        inserted = fetch_prices_for_symbol(sym)
-        totals[sym] = inserted
-        # Basic rate limit pacing
-        if i < len(symbols) - 1 and settings.RATE_LIMIT_SLEEP  > 0:
-            time.sleep(settings.RATE_LIMIT_SLEEP )
+    symbols = settings.SYMBOLS if symbols is None else symbols
+    log.debug("run_ingest_once: %d symbol(s), last run %s", len(symbols), _last_run_utc)
+    totals: Dict[str, int] = {}
+    errors: Dict[str, str] = {}
+    skipped: List[str] = []
+
+    def fetch(sym: str) -> Optional[int]:
+        if not can_make_call():
+            return None
+        _report(progress, sym, status="running")
+        return fetch_prices_for_symbol(sym)
+
+    with ThreadPoolExecutor(max_workers=max(1, settings.INGEST_WORKERS), thread_name_prefix="ingest-eod") as pool:
+        futures = {pool.submit(fetch, sym): sym for sym in symbols}
+        for fut in as_completed(futures):
+            sym = futures[fut]
+            try:
+                rows = fut.result()
+                totals[sym] = rows or 0
+                if rows is None:
+                    skipped.append(sym)
+                    _report(progress, sym, status="skipped", reason="rate-limit-guard")
+                else:
+                    _report(progress, sym, status="done", rows=rows)
+            except Exception as e:
+                log.warning("ingest %s failed: %r", sym, e)
+                totals[sym] = 0
+                errors[sym] = str(e)
+                _report(progress, sym, status="failed", error=str(e))
     _last_run_utc = datetime.utcnow()
-    return {"inserted": totals, "run_utc": _last_run_utc.isoformat() + "Z"}
+    _sync_history_tier(symbols)
+    result: Dict[str, Any] = {"inserted": {sym: totals[sym] for sym in symbols}, "run_utc": _last_run_utc.isoformat() + "Z"}
+    if errors:
+        result["errors"] = errors
+    if skipped:
+        result["skipped"] = skipped
+    return result
+
+def _sync_history_tier(symbols: List[str]) -> None:
+    # Snapshot newly closed (or backfilled) years into the local history tier, if enabled.
+    # Imported here: history_tier -> export -> ingest would be circular at module load.
+    from .history_tier import sync_tier, tier_enabled
+    if not tier_enabled():
+        return
+    try:
+        written = sync_tier(get_engine(), symbols)
+        if written:
+            log.info("history tier updated: %s", written)
+    except Exception:
+        log.exception("history tier sync failed")
 
 def last_run_utc() -> str | None:
     return None if _last_run_utc is None else _last_run_utc.isoformat() + "Z"
\ No newline at end of file
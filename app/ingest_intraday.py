@@ -1,17 +1,20 @@
 from __future__ import annotations
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Any, List, Optional
-import requests
-# import json;
-from websocket import create_connection
-import simplejson as json
+from typing import Any, Callable, Dict, List, Optional
+import logging
+import math
+import pandas as pd
 
+from .bars import BarAggregator
 from .config import settings
-from .db import get_last_intraday_time, upsert_intraday
+from .db import get_last_intraday_time, bulk_upsert_intraday
 from .ingest import get_engine
-from .usage import can_make_call, increment_calls
+from .logs import log_payload
+from .singleflight import SingleFlight
+from .usage import can_make_call
+from . import tiingo_http
 
-_TIINGO_BASE = "https://api.tiingo.com"
+log = logging.getLogger(__name__)
 
 def _interval_seconds(resample: str) -> int:
     if resample.endswith("min"):
@@ -30,8 +33,17 @@ def _now_utc() -> datetime:
 def now() -> datetime:
     return _now_utc()
 
+_flights = SingleFlight("intraday")
+
 def sync_intraday_for_symbol(symbol: str, window_minutes: Optional[int] = None) -> Dict[str, Any]:
+    # Scheduler, manual syncs and dashboards hitting the same symbol at once share one Tiingo call and MERGE;
+    # a result younger than INTRADAY_FRESH_SECONDS is returned as is. An explicit window fetches a different
+    # range, so it only shares with callers asking for the same one
     symbol = symbol.upper()
+    key = (symbol, "tiingo_iex", _interval_seconds(settings.INTRADAY_RESAMPLE), window_minutes)
+    return _flights.do(key, lambda: _sync_intraday_for_symbol(symbol, window_minutes), settings.INTRADAY_FRESH_SECONDS)
+
+def _sync_intraday_for_symbol(symbol: str, window_minutes: Optional[int] = None) -> Dict[str, Any]:
     if not can_make_call():
         return {"symbol": symbol, "skipped": True, "reason": "rate-limit-guard"}
 
@@ -42,17 +54,22 @@ def sync_intraday_for_symbol(symbol: str, window_minutes: Optional[int] = None)
     last_str = get_last_intraday_time(engine, symbol, "tiingo_iex", isec)
     now = _now_utc()
 
-    if last_str:
-        # backfill 2 minutes overlap to handle late updates
-        start = datetime.strptime(last_str, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc) - timedelta(minutes=2)
-    else:
+    last = datetime.strptime(last_str, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc) if last_str else None
+    reconcile = last is not None and _reconcile_due(symbol, now)
+    if last is None:
         wm = window_minutes or settings.INTRADAY_WINDOW_MINUTES
         start = now - timedelta(minutes=wm)
+    elif reconcile:
+        # Periodic wider pass so late corrections to already-stored bars get picked up
+        start = last - timedelta(minutes=settings.INTRADAY_RECONCILE_WINDOW_MINUTES)
+    else:
+        # Delta only: the newest stored bar may still have been open when written, so it is refetched
+        start = last
     end = now
 
     params = {
-        "startDate": start.date().isoformat(),
-        "endDate": end.date().isoformat(),
+        "startDate": _window_param(start),
+        "endDate": _window_param(end),
         "resampleFreq": settings.INTRADAY_RESAMPLE,
         "columns": "open,high,low,close,volume",
     }
@@ -63,81 +80,161 @@ def sync_intraday_for_symbol(symbol: str, window_minutes: Optional[int] = None)
     #     "resampleFreq": "5min"
     # }
 
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization' : f"Token {settings.TIINGO_API_KEY}"
-        }
-
-    #Llamama a un conjunto de datos   
-    url = f"{_TIINGO_BASE}/iex/{symbol}/prices"
-    # url = f"{_TIINGO_BASE}/crypto/prices"
-    #hace una prueba para obtener respuesta valida
-    # url = f"{_TIINGO_BASE}/api/test"
-    print(url)
-    r = requests.get(url, params=params, headers=headers, timeout=20)
-
-    print(r.url)
-    print(r.status_code, r.headers.get("content-type"), r.url)
-    print(r.text[:1000])
-    print(r.json())
-    print(json.dumps(r.json(), indent=2)[:1500])
-    print("finish first response")
-
-    # ########
-    # ws = create_connection("wss://api.tiingo.com/tiingo/crypto/top")
-    # # ws = create_connection("wss://api.tiingo.com/test")
-    # print("wss connetion created")
-
-    # subscribe = {
-    #                 'eventName':'subscribe',
-    #                 'authorization':f'{settings.TIINGO_API_KEY}',
-    #                 'eventData': {
-    #                             'tickers':['btcusd']
-    #                             }
-    #                 }
-
-    # print("ws.send")
-    # ws.send(json.dumps(subscribe))
-    # print("before while respnse")
-    # print(ws.recv())
-    # print("printing while response")
-    # while True:
-    #     print(ws.recv())
-    ########
-
-    r = requests.get(url, params=params, headers=headers, timeout=20)
-    print(r)
-    r.raise_for_status()
+    # One request per symbol; the transport retries, rate-limits and counts it in API usage
+    r = tiingo_http.get(f"/iex/{symbol}/prices", params=params)
     rows: List[dict] = r.json() or []
+    log_payload(log, "iex %s rows", rows, symbol)
+
+    # Bars before the newest stored one are confirmed: drop them before they reach the writer
+    # (a date-granular window would otherwise rewrite the whole day every tick)
+    payloads = intraday_payloads(symbol, isec, rows)
+    if last is not None and not reconcile:
+        floor = last.replace(tzinfo=None)
+        payloads = [p for p in payloads if p["BarTime"] >= floor]
+    inserted = bulk_upsert_intraday(engine, payloads)
+    if reconcile:
+        _mark_reconciled(symbol, now)
+    return {"symbol": symbol, "fetched": len(rows), "kept": len(payloads), "inserted": inserted,
+            "reconcile": reconcile, "from": _iso(start), "to": _iso(end)}
+
+def _window_param(ts: datetime) -> str:
+    # IEX prices accept full timestamps; INTRADAY_TIMESTAMP_WINDOWS=false falls back to whole days
+    if settings.INTRADAY_TIMESTAMP_WINDOWS:
+        return ts.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+    return ts.date().isoformat()
+
+# symbol -> last reconciliation pass (UTC); a symbol's first synced tick counts as one
+_reconciled: Dict[str, datetime] = {}
+
+def _reconcile_due(symbol: str, now: datetime) -> bool:
+    every = settings.INTRADAY_RECONCILE_MINUTES
+    if not every:
+        return False
+    done = _reconciled.setdefault(symbol, now)
+    return now - done >= timedelta(minutes=every)
+
+def _mark_reconciled(symbol: str, now: datetime) -> None:
+    _reconciled[symbol] = now
+
+def _parse_ts(value) -> datetime:
+    # Tiingo timestamps come with Z, an offset, or nanosecond fractions; stored as naive UTC
+    if isinstance(value, datetime):
+        ts = value
+    else:
+        ts = pd.Timestamp(value).to_pydatetime(warn=False)
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc).replace(tzinfo=None)
 
-    print(rows)
+def _write_intraday_rows(engine, symbol: str, isec: int, rows: List[dict], source: str = "tiingo_iex") -> int:
+    return bulk_upsert_intraday(engine, intraday_payloads(symbol, isec, rows, source))
 
-    inserted = 0
+def intraday_payloads(symbol: str, isec: int, rows: List[dict], source: str = "tiingo_iex") -> List[dict]:
+    # Tiingo can repeat a bar at the window edge; the staging table is keyed, so keep the last one
+    payloads: Dict[datetime, dict] = {}
     for row in rows:
-        # Tiingo returns ISO with Z
-        ts = datetime.fromisoformat(row["date"].replace("Z", "+00:00"))
-        payload = {
+        ts = _parse_ts(row["date"])
+        payloads[ts] = {
             "Symbol": symbol,
-            "Source": "tiingo_iex",
+            "Source": source,
             "BarTime": ts,
             "IntervalSec": isec,
             "Open": row.get("open"),
             "High": row.get("high"),
             "Low": row.get("low"),
             "Close": row.get("close"),
-            "Volume": row.get("volume"),
+            "Volume": None if row.get("volume") is None else int(row["volume"]),
         }
-        upsert_intraday(engine, payload)
-        inserted += 1
-    increment_calls(1) # account for this API request
-    return {"symbol": symbol, "inserted": inserted, "from": _iso(start), "to": _iso(end)}
+    return list(payloads.values())
+
+def intraday_calls_per_cycle(symbol_count: int) -> int:
+    # Per-symbol mode costs one /iex/{symbol}/prices call per ticker; batch mode one /iex call per batch
+    if settings.INTRADAY_BATCH_MODE:
+        return int(math.ceil(symbol_count / max(1, settings.INTRADAY_BATCH_SIZE)))
+    return symbol_count
+
+# Snapshot -> bar state for batch mode (the multi-ticker endpoint only returns the latest quote)
+_batch_bars: Optional[BarAggregator] = None
 
-def sync_intraday_for_all_symbols(window_minutes: Optional[int] = None) -> Dict[str, Any]:
+def _batch_aggregator(isec: int) -> BarAggregator:
+    global _batch_bars
+    if _batch_bars is None or _batch_bars.interval_sec != isec:
+        _batch_bars = BarAggregator(isec)
+    return _batch_bars
+
+def sync_intraday_batch(symbols: List[str]) -> Dict[str, Any]:
+    """Poll the multi-ticker IEX endpoint in batches and fan the quotes out to per-symbol bar writes."""
+    isec = _interval_seconds(settings.INTRADAY_RESAMPLE)
+    engine = get_engine()
+    agg = _batch_aggregator(isec)
+    size = max(1, settings.INTRADAY_BATCH_SIZE)
+    totals: Dict[str, Any] = {}
+    for i in range(0, len(symbols), size):
+        batch = [s.upper() for s in symbols[i:i + size]]
+        if not can_make_call():
+            for sym in batch:
+                totals[sym] = {"symbol": sym, "skipped": True, "reason": "rate-limit-guard"}
+            continue
+        try:
+            # one API request for the whole batch
+            r = tiingo_http.get("/iex/", params={"tickers": ",".join(batch)})
+            quotes: List[dict] = r.json() or []
+        except Exception as e:
+            for sym in batch:
+                totals[sym] = {"symbol": sym, "error": str(e)}
+            continue
+
+        bars: Dict[str, List[dict]] = {sym: [] for sym in batch}
+        for q in quotes:
+            sym = (q.get("ticker") or "").upper()
+            price = q.get("tngoLast") or q.get("last")
+            stamp = q.get("lastSaleTimestamp") or q.get("timestamp")
+            if sym not in bars or price is None or not stamp:
+                continue
+            ts = _parse_ts(stamp).replace(tzinfo=timezone.utc)
+            bars[sym].extend(agg.add(sym, ts, float(price), cum_volume=q.get("volume")))
+            current = agg.current(sym)
+            if current is not None:
+                # Write the still-open bar too so readers see the latest price; later polls update it
+                bars[sym].append(current)
+
+        for sym, rows in bars.items():
+            try:
+                inserted = _write_intraday_rows(engine, sym, isec, rows, settings.INTRADAY_SNAPSHOT_SOURCE)
+                totals[sym] = {"symbol": sym, "fetched": len(rows), "inserted": inserted, "batch": True}
+            except Exception as e:
+                totals[sym] = {"symbol": sym, "error": str(e)}
+    return totals
+
+def _report_result(progress: Optional[Callable[[str, Dict[str, Any]], None]], sym: str, res: Dict[str, Any]) -> None:
+    if progress is None:
+        return
+    if res.get("error"):
+        progress(sym, {"status": "failed", "error": res["error"]})
+    else:
+        progress(sym, {"status": "skipped" if res.get("skipped") else "done", "rows": int(res.get("inserted") or 0)})
+
+def sync_intraday_for_all_symbols(window_minutes: Optional[int] = None, symbols: Optional[List[str]] = None,
+                                  progress: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
     # symbols = [s.strip().upper() for s in settings.SYMBOLS.split(',') if s.strip()]
-    symbols = settings.SYMBOLS
+    symbols = settings.SYMBOLS if symbols is None else symbols
+    if settings.INTRADAY_BATCH_MODE:
+        totals = sync_intraday_batch(symbols)
+        for sym, res in totals.items():
+            _report_result(progress, sym, res)
+        return totals
     totals: Dict[str, Any] = {}
     for sym in symbols:
-        res = sync_intraday_for_symbol(sym, window_minutes)
+        if progress is not None:
+            progress(sym, {"status": "running"})
+        try:
+            res = sync_intraday_for_symbol(sym, window_minutes)
+        except Exception as e:
+            if progress is None:
+                raise
+            # In a background job one bad symbol shouldn't abort the rest
+            log.warning("intraday %s failed: %r", sym, e)
+            res = {"symbol": sym, "error": str(e)}
         totals[sym] = res
+        _report_result(progress, sym, res)
     return totals
-
@@ -0,0 +1,234 @@
+from __future__ import annotations
+from datetime import datetime, timedelta, timezone
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Dict, List, Optional
+import logging
+import random
+import time
+
+import simplejson as json
+from websocket import create_connection, WebSocketTimeoutException
+
+from .bars import BarAggregator, bucket_start
+from .config import settings
+from .db import bulk_upsert_intraday
+from .ingest import get_engine
+from .ingest_intraday import _interval_seconds, _parse_ts, intraday_payloads, sync_intraday_for_symbol
+
+log = logging.getLogger(__name__)
+
+# Tiingo IEX websocket trade update layout:
+# [updateType, date, nanos, ticker, bidSize, bidPrice, midPrice, askPrice, askSize, lastPrice, lastSize, ...]
+_IEX_TYPE, _IEX_DATE, _IEX_TICKER, _IEX_PRICE, _IEX_SIZE = 0, 1, 3, 9, 10
+
+
+class IntradayStreamer:
+    """Streams IEX trades over the Tiingo websocket and writes INTRADAY_RESAMPLE bars in micro-batches.
+
+    `connect` defaults to websocket.create_connection; together with TIINGO_WS_URL it lets the
+    streamer run against a local stand-in that replays recorded messages.
+    """
+
+    def __init__(self, symbols: List[str], url: Optional[str] = None,
+                 connect: Callable[..., Any] = create_connection):
+        self.symbols = [s.upper() for s in symbols]
+        self._owned = set(self.symbols)
+        self._lock = Lock()
+        self._wanted: Optional[List[str]] = None # new symbol set from set_symbols, applied by the run loop
+        self._subscription_id: Optional[int] = None
+        self.url = url or settings.TIINGO_WS_URL
+        self.connect = connect
+        self.isec = _interval_seconds(settings.INTRADAY_RESAMPLE)
+        self.agg = BarAggregator(self.isec)
+        self.stop_event = Event()
+        self.stats: Dict[str, Any] = {"connects": 0, "messages": 0, "trades": 0, "bars_written": 0, "flushes": 0,
+                                      "flush_errors": 0, "last_error": None}
+        self._pending: Dict[tuple, dict] = {}
+        # First bar per symbol on the current connection; it (and anything older) only saw part of its trades
+        self._first_bucket: Dict[str, datetime] = {}
+        self._last_flush = time.monotonic()
+        self._retry_at = 0.0 # after a failed write, next attempt no sooner than this (monotonic)
+        self._last_event: Optional[tuple] = None # (latest trade time, monotonic time it arrived)
+
+    def _clock(self) -> datetime:
+        # Feed time advanced by wall time since the last trade, so bars close on quiet symbols and
+        # replayed recordings close on their own timeline
+        if self._last_event is None:
+            return datetime.now(timezone.utc)
+        ts, seen = self._last_event
+        return ts + timedelta(seconds=time.monotonic() - seen)
+
+    def _subscribe(self, ws, symbols: List[str], event: str = "subscribe") -> None:
+        if not symbols:
+            return # an empty ticker list would subscribe to the whole IEX feed
+        data: Dict[str, Any] = {"thresholdLevel": settings.STREAM_THRESHOLD_LEVEL, "tickers": [s.lower() for s in symbols]}
+        if self._subscription_id is not None:
+            data["subscriptionId"] = self._subscription_id
+        ws.send(json.dumps({"eventName": event, "authorization": settings.TIINGO_API_KEY, "eventData": data}))
+
+    def set_symbols(self, symbols: List[str]) -> None:
+        """Change the subscribed symbols (e.g. after a shard rebalance); the run loop applies it."""
+        with self._lock:
+            self._wanted = [s.upper() for s in symbols]
+
+    def _take_wanted(self) -> Optional[List[str]]:
+        with self._lock:
+            wanted, self._wanted = self._wanted, None
+        return wanted
+
+    def _resubscribe(self, ws) -> None:
+        wanted = self._take_wanted()
+        if wanted is None:
+            return
+        keep = set(wanted)
+        added = [s for s in wanted if s not in self._owned]
+        removed = [s for s in self.symbols if s not in keep]
+        self.symbols, self._owned = wanted, keep
+        for symbol in added:
+            self._first_bucket.pop(symbol, None) # its next bar starts mid-stream again
+        log.info("stream resubscribe: +%d -%d symbol(s)", len(added), len(removed))
+        self._subscribe(ws, removed, "unsubscribe")
+        self._subscribe(ws, added)
+        # Whoever streamed the added symbols until now stopped at some point; REST fills from our watermark
+        self.backfill_gap(added)
+
+    def handle_message(self, raw: str) -> None:
+        msg = json.loads(raw)
+        self.stats["messages"] += 1
+        if msg.get("messageType") == "I" and isinstance(msg.get("data"), dict):
+            self._subscription_id = msg["data"].get("subscriptionId", self._subscription_id)
+        if msg.get("messageType") != "A":
+            return # heartbeats ("H") and subscription info ("I")
+        data = msg.get("data") or []
+        if len(data) <= _IEX_SIZE or data[_IEX_TYPE] != "T" or data[_IEX_PRICE] is None:
+            return
+        symbol = str(data[_IEX_TICKER]).upper()
+        if symbol not in self._owned:
+            return # unsubscribed (moved to another replica); updates can trail the unsubscribe
+        ts = _parse_ts(data[_IEX_DATE]).replace(tzinfo=timezone.utc)
+        self.stats["trades"] += 1
+        if self._last_event is None or ts > self._last_event[0]:
+            self._last_event = (ts, time.monotonic())
+        self._first_bucket.setdefault(symbol, bucket_start(ts, self.isec))
+        for bar in self.agg.add(symbol, ts, float(data[_IEX_PRICE]), size=data[_IEX_SIZE]):
+            self._queue(symbol, bar)
+
+    def _queue(self, symbol: str, bar: dict) -> None:
+        first = self._first_bucket.get(symbol)
+        if symbol not in self._owned or first is None or bar["date"] <= first:
+            return # partial bar; covered by the REST gap backfill instead
+        self._pending[(symbol, bar["date"])] = {"symbol": symbol, **bar}
+
+    def flush(self, force: bool = False) -> int:
+        # Close bars whose interval ended (plus a grace period for stragglers), then write one micro-batch
+        for symbol, bar in self.agg.close_due(self._clock() - timedelta(seconds=settings.STREAM_BAR_GRACE_SECONDS)).items():
+            self._queue(symbol, bar)
+        due = force or len(self._pending) >= settings.STREAM_FLUSH_MAX_BARS \
+            or time.monotonic() - self._last_flush >= settings.STREAM_FLUSH_SECONDS
+        if not due or not self._pending or (not force and time.monotonic() < self._retry_at):
+            return 0
+        payloads: List[dict] = []
+        for bar in self._pending.values():
+            payloads.extend(intraday_payloads(bar["symbol"], self.isec, [bar]))
+        written = bulk_upsert_intraday(get_engine(), payloads)
+        self._pending.clear()
+        self._last_flush = time.monotonic()
+        self.stats["bars_written"] += written
+        self.stats["flushes"] += 1
+        return written
+
+    def backfill_gap(self, symbols: Optional[List[str]] = None) -> None:
+        # Bars missed while disconnected come from REST, starting at each symbol's watermark
+        for symbol in self.symbols if symbols is None else symbols:
+            if self.stop_event.is_set():
+                return
+            try:
+                sync_intraday_for_symbol(symbol)
+            except Exception as e:
+                log.warning("stream gap backfill %s failed: %r", symbol, e)
+
+    def run(self) -> None:
+        attempt = 0
+        while not self.stop_event.is_set():
+            ws = None
+            try:
+                ws = self.connect(self.url, timeout=10)
+                ws.settimeout(1.0)
+                wanted = self._take_wanted()
+                if wanted is not None:
+                    self.symbols, self._owned = wanted, set(wanted)
+                self._subscription_id = None
+                self._subscribe(ws, self.symbols)
+                self._first_bucket = {}
+                self.stats["connects"] += 1
+                if self.stats["connects"] > 1 or settings.STREAM_BACKFILL_ON_START:
+                    self.backfill_gap()
+                attempt = 0
+                while not self.stop_event.is_set():
+                    self._resubscribe(ws)
+                    try:
+                        raw = ws.recv()
+                    except WebSocketTimeoutException:
+                        raw = None
+                    if raw:
+                        self.handle_message(raw)
+                    elif raw is not None:
+                        raise ConnectionError("websocket closed by server")
+                    try:
+                        self.flush()
+                    except Exception as e:
+                        # A DB problem is not a feed problem: keep the socket and the pending bars, retry later
+                        self.stats["flush_errors"] += 1
+                        self.stats["last_error"] = repr(e)
+                        self._retry_at = time.monotonic() + settings.STREAM_FLUSH_SECONDS
+                        log.warning("stream flush failed, keeping %d bars: %r", len(self._pending), e)
+            except Exception as e:
+                self.stats["last_error"] = repr(e)
+                log.warning("stream error: %r", e)
+            finally:
+                if ws is not None:
+                    try:
+                        ws.close()
+                    except Exception:
+                        pass
+                try:
+                    self.flush(force=True)
+                except Exception:
+                    log.exception("stream flush failed")
+            if not self.stop_event.is_set():
+                # Exponential backoff with jitter, capped
+                attempt += 1
+                delay = min(settings.STREAM_RECONNECT_MAX_SECONDS, 2 ** attempt) * random.uniform(0.5, 1.0)
+                self.stop_event.wait(delay)
+
+
+_streamer: Optional[IntradayStreamer] = None
+_thread: Optional[Thread] = None
+
+def start_stream(symbols: Optional[List[str]] = None) -> bool:
+    global _streamer, _thread
+    if stream_running():
+        return False
+    _streamer = IntradayStreamer(settings.SYMBOLS if symbols is None else symbols)
+    _thread = Thread(target=_streamer.run, name="intraday-stream", daemon=True)
+    _thread.start()
+    return True
+
+def stop_stream(timeout: float = 10.0) -> bool:
+    if not stream_running():
+        return False
+    _streamer.stop_event.set()
+    _thread.join(timeout)
+    return True
+
+def resubscribe_stream(symbols: List[str]) -> bool:
+    if not stream_running():
+        return False
+    _streamer.set_symbols(symbols)
+    return True
+
+def stream_running() -> bool:
+    return _thread is not None and _thread.is_alive()
+
+def stream_stats() -> Optional[Dict[str, Any]]:
+    return None if _streamer is None else dict(_streamer.stats)
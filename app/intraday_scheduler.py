@@ -0,0 +1,191 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+from .config import settings
+from .coordination import get_coordinator
+from .ingest_intraday import sync_intraday_batch, sync_intraday_for_symbol
+from .market_calendar import current_session, market_tz, next_session_open
+from .usage import calls_left_today, calls_this_hour, can_make_call
+
+# Adaptive intraday polling: a short tick job dispatches whichever poll units are due. Units are single
+# symbols (or INTRADAY_BATCH_SIZE chunks of one tier in batch mode); their intervals are re-planned from
+# the API budget left for the rest of the hour/session and shared out by tier weight. Nothing runs
+# outside trading sessions.
+
+log = logging.getLogger(__name__)
+
+TIERS = ("hot", "normal", "cold")
+
+def _symbol_list(raw: str) -> set:
+    return {s.strip().upper() for s in (raw or "").split(",") if s.strip()}
+
+def symbol_tiers(symbols: List[str]) -> Dict[str, str]:
+    hot, cold = _symbol_list(settings.INTRADAY_HOT_SYMBOLS), _symbol_list(settings.INTRADAY_COLD_SYMBOLS)
+    return {s: "hot" if s in hot else "cold" if s in cold else "normal" for s in symbols}
+
+def tier_weights() -> Dict[str, float]:
+    weights = {"hot": 6.0, "normal": 1.0, "cold": 0.2}
+    for item in settings.INTRADAY_TIER_WEIGHTS.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() in weights and value.strip():
+            weights[name.strip()] = max(0.0, float(value))
+    return weights
+
+def poll_units(symbols: List[str]) -> Dict[str, Tuple[str, List[str]]]:
+    """unit key -> (tier, symbols it polls); every unit costs one API call per run."""
+    tiers = symbol_tiers([s.upper() for s in symbols])
+    if not settings.INTRADAY_BATCH_MODE:
+        return {sym: (tier, [sym]) for sym, tier in tiers.items()}
+    size = max(1, settings.INTRADAY_BATCH_SIZE)
+    units = {}
+    for tier in TIERS:
+        members = [s for s, t in tiers.items() if t == tier]
+        for i in range(0, len(members), size):
+            units[f"{tier}:{i // size}"] = (tier, members[i:i + size])
+    return units
+
+def budget_rate(now: datetime, session_end: datetime, unit_count: int) -> float:
+    """API calls per second intraday polling may spend from now on."""
+    rates = []
+    if settings.MAX_API_CALLS_PER_DAY:
+        # Reserve one call per symbol (+2) for the nightly EOD run, as the fixed cadence did
+        left = (calls_left_today() or 0) - len(settings.SYMBOLS) - 2
+        rates.append(max(0, left) / max(60.0, (session_end - now).total_seconds()))
+    if settings.MAX_API_CALLS_PER_HOUR:
+        cap = settings.MAX_API_CALLS_PER_HOUR - settings.MAX_API_CALLS_PER_HOUR / 6
+        hour_end = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        rates.append(max(0.0, cap - calls_this_hour()) / max(60.0, (hour_end - now).total_seconds()))
+    if rates:
+        return min(rates)
+    # No budget configured: spend what the fixed INTRADAY_INTERVAL_SECONDS cadence would
+    return unit_count / max(15, settings.INTRADAY_INTERVAL_SECONDS or 60)
+
+def allocate(weights: Dict[str, float], rate: float) -> Dict[str, float]:
+    """Interval (s) per unit so that sum(1/interval) <= rate, shared by weight and clamped to
+    [INTRADAY_MIN_INTERVAL_SECONDS, INTRADAY_MAX_INTERVAL_SECONDS]. Units pinned at the maximum are taken
+    out of the pool first, so the rest share what is actually left."""
+    lo, hi = max(1, settings.INTRADAY_MIN_INTERVAL_SECONDS), max(1, settings.INTRADAY_MAX_INTERVAL_SECONDS)
+    free = {k: w for k, w in weights.items() if w > 0}
+    intervals = {k: float(hi) for k in weights if k not in free}
+    budget = rate
+    while free:
+        total = sum(free.values())
+        if budget <= 0:
+            intervals.update({k: float(hi) for k in free})
+            break
+        pinned = [k for k, w in free.items() if total / (budget * w) > hi]
+        if not pinned:
+            intervals.update({k: max(float(lo), total / (budget * w)) for k, w in free.items()})
+            break
+        for k in pinned:
+            intervals[k] = float(hi)
+            budget -= 1.0 / hi
+            del free[k]
+    return intervals
+
+
+class AdaptiveIntradayScheduler:
+    def __init__(self):
+        self._lock = Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._units: Dict[str, Tuple[str, List[str]]] = {}
+        self._intervals: Dict[str, float] = {}
+        self._next_due: Dict[str, datetime] = {}
+        self._in_flight: set = set()
+        self._planned_at: Optional[datetime] = None
+        self.rate = 0.0
+        self.state = "idle"
+        self.runs = 0
+        self.errors = 0
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=max(1, settings.INTRADAY_WORKERS),
+                                            thread_name_prefix="intraday-poll")
+        return self._pool
+
+    def replan(self, now: datetime, session_end: datetime) -> None:
+        # Other replicas poll the rest of the universe and spend their share of the same budget
+        coordinator = get_coordinator()
+        units = poll_units(coordinator.my_symbols(settings.SYMBOLS))
+        weights = tier_weights()
+        self.rate = budget_rate(now, session_end, len(units)) * coordinator.share(settings.SYMBOLS) if units else 0.0
+        intervals = allocate({k: weights[tier] for k, (tier, _) in units.items()}, self.rate)
+        for i, key in enumerate(sorted(units, key=lambda k: -weights[units[k][0]])):
+            due = self._next_due.get(key)
+            if due is None:
+                # Stagger first runs across one interval instead of firing every unit on the first tick
+                self._next_due[key] = now + timedelta(seconds=intervals[key] * i / max(1, len(units)))
+            elif key in self._intervals and intervals[key] < self._intervals[key]:
+                # Budget freed up: pull the next run forward
+                self._next_due[key] = due - timedelta(seconds=self._intervals[key] - intervals[key])
+        for key in set(self._next_due) - set(units):
+            del self._next_due[key]
+        self._units, self._intervals, self._planned_at = units, intervals, now
+        log.debug("intraday plan: %.3f calls/s over %d units", self.rate, len(units))
+
+    def tick(self) -> None:
+        """Scheduler job: dispatch due units; cheap when nothing is due or the market is closed."""
+        now = datetime.now(market_tz())
+        live = current_session(now)
+        with self._lock:
+            if live is None:
+                if self.state != "closed":
+                    log.info("intraday polling paused until %s", next_session_open(now).isoformat())
+                self.state = "closed"
+                self._next_due.clear()
+                self._planned_at = None
+                return
+            if self.state != "open":
+                log.info("intraday polling open until %s", live[1].isoformat())
+            self.state = "open"
+            if self._planned_at is None or (now - self._planned_at).total_seconds() >= settings.INTRADAY_REPLAN_SECONDS:
+                self.replan(now, live[1])
+            weights = tier_weights()
+            due = sorted((k for k, t in self._next_due.items() if t <= now and k not in self._in_flight),
+                         key=lambda k: (-weights[self._units[k][0]], self._next_due[k]))
+            for key in due:
+                if not can_make_call():
+                    break
+                self._in_flight.add(key)
+                self._next_due[key] = now + timedelta(seconds=self._intervals[key])
+                self._executor().submit(self._run, key, list(self._units[key][1]))
+
+    def _run(self, key: str, symbols: List[str]) -> Any:
+        try:
+            if settings.INTRADAY_BATCH_MODE:
+                return sync_intraday_batch(symbols)
+            return sync_intraday_for_symbol(symbols[0])
+        except Exception as e:
+            self.errors += 1
+            log.warning("intraday poll %s failed: %r", key, e)
+        finally:
+            self.runs += 1
+            with self._lock:
+                self._in_flight.discard(key)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            by_tier: Dict[str, Dict[str, Any]] = {}
+            for key, (tier, symbols) in self._units.items():
+                entry = by_tier.setdefault(tier, {"units": 0, "symbols": 0, "interval_s": None})
+                entry["units"] += 1
+                entry["symbols"] += len(symbols)
+                entry["interval_s"] = round(self._intervals.get(key, 0.0), 1)
+            status = {"state": self.state, "calls_per_min": round(self.rate * 60, 2), "tiers": by_tier,
+                      "in_flight": len(self._in_flight), "runs": self.runs, "errors": self.errors}
+        if self.state != "open":
+            status["next_open"] = next_session_open().isoformat()
+        return status
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+intraday_scheduler = AdaptiveIntradayScheduler()
@@ -0,0 +1,145 @@
+from __future__ import annotations
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+import uuid
+
+from fastapi import HTTPException
+
+from .config import settings
+
+# Background sync jobs: POST /prices/sync and /prices/intraday/sync enqueue here and return a job id at once;
+# GET /jobs/{id} reports per-symbol progress. A request for symbols already being synced by an active job
+# of the same kind attaches to that job instead of fetching them twice.
+
+log = logging.getLogger(__name__)
+
+ACTIVE = ("queued", "running")
+
+
+class Job:
+    def __init__(self, kind: str, symbols: List[str]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.symbols = symbols
+        self.status = "queued"
+        self.created = datetime.utcnow()
+        self.started: Optional[datetime] = None
+        self.finished: Optional[datetime] = None
+        self.error: Optional[str] = None
+        self.progress: Dict[str, Dict[str, Any]] = {s: {"status": "queued"} for s in symbols}
+        self._lock = Lock()
+
+    def report(self, symbol: str, state: Dict[str, Any]) -> None:
+        with self._lock:
+            self.progress.setdefault(symbol, {}).update(state)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            progress = {s: dict(p) for s, p in self.progress.items()}
+        end = self.finished or datetime.utcnow()
+        counts: Dict[str, int] = {}
+        for p in progress.values():
+            counts[p.get("status", "queued")] = counts.get(p.get("status", "queued"), 0) + 1
+        return {
+            "id": self.id, "kind": self.kind, "status": self.status,
+            "created_utc": self.created.isoformat() + "Z",
+            "started_utc": self.started.isoformat() + "Z" if self.started else None,
+            "finished_utc": self.finished.isoformat() + "Z" if self.finished else None,
+            "elapsed_s": round((end - self.started).total_seconds(), 3) if self.started else 0.0,
+            "rows": sum(int(p.get("rows") or 0) for p in progress.values()),
+            "symbols": counts,
+            "errors": {s: p["error"] for s, p in progress.items() if p.get("error")},
+            "error": self.error,
+            "progress": progress,
+        }
+
+
+class JobRunner:
+    """Bounded pool for sync jobs: WORKERS run at once, up to MAX_QUEUE wait; beyond that submit() rejects with 503."""
+
+    def __init__(self, workers: int, max_queue: int, retain: int):
+        self.workers = max(1, workers)
+        self.capacity = self.workers + max(0, max_queue)
+        self.retain = max(1, retain)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sync-job")
+        self._lock = Lock()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+
+    def _active(self, kind: Optional[str] = None) -> List[Job]:
+        return [j for j in self._jobs.values() if j.status in ACTIVE and (kind is None or j.kind == kind)]
+
+    def find(self, kind: str, symbol: str) -> Optional[Job]:
+        """The active job of `kind` that is syncing `symbol`, if any."""
+        with self._lock:
+            for job in self._active(kind):
+                if symbol in job.symbols:
+                    return job
+        return None
+
+    def submit(self, kind: str, symbols: List[str],
+               fn: Callable[[List[str], Callable[[str, Dict[str, Any]], None]], Any]) -> Tuple[Job, bool]:
+        """Run fn(symbols, report) in the background; returns (job, attached)."""
+        with self._lock:
+            active = self._active(kind)
+            for job in active:
+                if set(symbols) <= set(job.symbols):
+                    return job, True
+            if len(self._active()) >= self.capacity:
+                raise HTTPException(status_code=503, detail="Sync queue full, retry shortly",
+                                    headers={"Retry-After": "5"})
+            owner = {s: job.id for job in active for s in job.symbols}
+            job = Job(kind, [s for s in symbols if s not in owner])
+            for s in symbols:
+                if s in owner:
+                    job.progress[s] = {"status": "attached", "job": owner[s]}
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.retain:
+                oldest = next((k for k, j in self._jobs.items() if j.status not in ACTIVE), None)
+                if oldest is None:
+                    break
+                del self._jobs[oldest]
+        if not job.symbols:
+            job.status, job.started = "done", job.created
+            job.finished = job.created
+            return job, False
+        self._pool.submit(self._run, job, fn)
+        return job, False
+
+    def _run(self, job: Job, fn) -> None:
+        job.started = datetime.utcnow()
+        job.status = "running"
+        try:
+            fn(list(job.symbols), job.report)
+            with job._lock:
+                failed = [s for s in job.symbols if job.progress.get(s, {}).get("status") == "failed"]
+            # Per-symbol failures are reported in progress; the job itself fails only if nothing succeeded
+            if failed and len(failed) == len(job.symbols):
+                job.error = f"all {len(failed)} symbol(s) failed"
+                job.status = "failed"
+            else:
+                job.status = "done"
+        except Exception as e:
+            log.exception("sync job %s (%s) failed", job.id, job.kind)
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished = datetime.utcnow()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def recent(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            jobs = list(self._jobs.values())[-limit:]
+        return [{k: v for k, v in j.snapshot().items() if k != "progress"} for j in reversed(jobs)]
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+sync_jobs = JobRunner(settings.JOBS_WORKERS, settings.JOBS_MAX_QUEUE, settings.JOBS_RETAIN)
@@ -0,0 +1,108 @@
+from __future__ import annotations
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+import time
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from .config import settings
+
+# Process-local latest-bar cache keyed by (symbol, source, interval_sec). The write paths in app.db
+# invalidate entries after committing; the TTL bounds staleness from writers in other processes.
+EOD_INTERVAL_SEC = 86400
+
+_lock = Lock()
+_cache: Dict[Tuple[str, str, int], Tuple[float, Optional[dict]]] = {}
+# Bumped per key on invalidation, so an in-flight load can't cache a stale row for that key; writes to
+# other keys don't stop it caching. Never reset (clear_latest keeps it) for the same reason.
+_generation: Dict[Tuple[str, str, int], int] = {}
+
+EOD_COLUMNS = "[Symbol],[Source],[BarDate],[Open],[High],[Low],[Close],[Volume],[AdjClose]"
+INTRADAY_COLUMNS = "[Symbol],[Source],[BarTime],[IntervalSec],[Open],[High],[Low],[Close],[Volume]"
+
+def _values(symbols: List[str], params: dict) -> str:
+    rows = []
+    for i, sym in enumerate(symbols):
+        params[f"s{i}"] = sym
+        rows.append(f"(CAST(:s{i} AS NVARCHAR(20)))")
+    return ", ".join(rows)
+
+def _query_latest_eod(engine: Engine, symbols: List[str], source: str) -> Dict[str, dict]:
+    # One statement; CROSS APPLY TOP (1) is a backward seek per symbol on the (Symbol, ..., BarDate) keys
+    params: dict = {"source": source}
+    sql = text(
+        f"""
+        SELECT b.*
+        FROM (VALUES {_values(symbols, params)}) AS s(Symbol)
+        CROSS APPLY (
+            SELECT TOP (1) {EOD_COLUMNS}
+            FROM [{settings.SQLSERVER_DB_SCHEMA}].[PriceBar] p
+            WHERE p.[Symbol] = s.Symbol AND p.[Source] = :source
+            ORDER BY p.[BarDate] DESC
+        ) AS b
+        """
+    )
+    with engine.begin() as conn:
+        return {r["Symbol"]: dict(r) for r in conn.execute(sql, params).mappings().all()}
+
+def _query_latest_intraday(engine: Engine, symbols: List[str], source: str, interval_sec: int) -> Dict[str, dict]:
+    params: dict = {"source": source, "isec": interval_sec}
+    sql = text(
+        f"""
+        SELECT b.*
+        FROM (VALUES {_values(symbols, params)}) AS s(Symbol)
+        CROSS APPLY (
+            SELECT TOP (1) {INTRADAY_COLUMNS}
+            FROM [{settings.SQLSERVER_DB_SCHEMA}].[PriceBarIntra] p
+            WHERE p.[Symbol] = s.Symbol AND p.[Source] = :source AND p.[IntervalSec] = :isec
+            ORDER BY p.[BarTime] DESC
+        ) AS b
+        """
+    )
+    with engine.begin() as conn:
+        return {r["Symbol"]: dict(r) for r in conn.execute(sql, params).mappings().all()}
+
+def _latest(engine: Engine, symbols: List[str], source: str, interval_sec: int, loader) -> List[dict]:
+    now = time.monotonic()
+    ttl = settings.LATEST_CACHE_TTL_SECONDS
+    found: Dict[str, Optional[dict]] = {}
+    missing: List[str] = []
+    generations: Dict[str, int] = {}
+    with _lock:
+        for sym in symbols:
+            key = (sym, source, interval_sec)
+            entry = _cache.get(key)
+            if entry is not None and now - entry[0] < ttl:
+                found[sym] = entry[1]
+            else:
+                missing.append(sym)
+                generations[sym] = _generation.get(key, 0)
+    if missing:
+        loaded = loader(missing)
+        with _lock:
+            for sym in missing:
+                key = (sym, source, interval_sec)
+                row = loaded.get(sym)
+                if _generation.get(key, 0) == generations[sym]:
+                    _cache[key] = (now, row)
+                found[sym] = row
+    return [found[sym] for sym in symbols if found.get(sym)]
+
+def latest_eod(engine: Engine, symbols: List[str], source: Optional[str] = None) -> List[dict]:
+    src = source or settings.SOURCE_EOD
+    return _latest(engine, symbols, src, EOD_INTERVAL_SEC, lambda missing: _query_latest_eod(engine, missing, src))
+
+def latest_intraday(engine: Engine, symbols: List[str], interval_sec: int, source: str = "tiingo_iex") -> List[dict]:
+    return _latest(engine, symbols, source, interval_sec,
+                   lambda missing: _query_latest_intraday(engine, missing, source, interval_sec))
+
+def invalidate_latest(symbol: str, source: str, interval_sec: int) -> None:
+    key = (symbol, source, interval_sec)
+    with _lock:
+        _generation[key] = _generation.get(key, 0) + 1
+        _cache.pop(key, None)
+
+def clear_latest() -> None:
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,88 @@
+from __future__ import annotations
+from datetime import datetime, timezone
+from typing import Any, Callable
+import json
+import logging
+import random
+import sys
+
+from .config import settings
+
+# Logging setup: per-module loggers (logging.getLogger(__name__)), levels from LOG_LEVEL / LOG_LEVELS,
+# text or JSON lines, and sampled, truncated payload previews that are only rendered when emitted.
+
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+_configured = False
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        # Anything passed via extra={...} becomes a field
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def _parse_levels(raw: str) -> dict:
+    # "app.ingest=DEBUG,app.db=WARNING"
+    levels = {}
+    for item in (raw or "").split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+def configure_logging() -> None:
+    """Install the root handler once; safe to call from every entry point."""
+    global _configured
+    if _configured:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    if settings.LOG_FORMAT.strip().lower() == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(settings.LOG_LEVEL.upper())
+    for name, level in _parse_levels(settings.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+    _configured = True
+
+
+class _Preview:
+    """Deferred payload rendering: str() runs only if a handler actually formats the record."""
+
+    __slots__ = ("payload",)
+
+    def __init__(self, payload: Any):
+        self.payload = payload
+
+    def __str__(self) -> str:
+        value = self.payload() if callable(self.payload) else self.payload
+        text = value if isinstance(value, str) else str(value)
+        limit = settings.LOG_PAYLOAD_PREVIEW_CHARS
+        if limit and len(text) > limit:
+            return f"{text[:limit]}... ({len(text)} chars)"
+        return text
+
+def log_payload(logger: logging.Logger, msg: str, payload: Any, *args: Any) -> None:
+    """DEBUG-level, sampled (LOG_PAYLOAD_SAMPLE_RATE) preview of a payload; pass a callable to defer
+    producing it. Costs one isEnabledFor check when DEBUG is off."""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    rate = settings.LOG_PAYLOAD_SAMPLE_RATE
+    if rate < 1.0 and random.random() >= rate:
+        return
+    logger.debug(f"{msg}: %s", *args, _Preview(payload))
+
+def lazy(fn: Callable[[], Any]) -> _Preview:
+    # For %s arguments that are expensive to build, e.g. logger.debug("jobs: %s", lazy(list_jobs))
+    return _Preview(fn)
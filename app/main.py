@@ -1,22 +1,38 @@
 from __future__ import annotations
-from fastapi import FastAPI, Query, HTTPException
+from fastapi import FastAPI, Query, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from sqlalchemy import text
+from datetime import datetime
 from typing import List, Optional
+import base64
+import json
 import logging
 import math
+import time
 
 
 from .config import settings
 from .ingest import run_ingest_once, last_run_utc, get_engine
-from .ingest_intraday import sync_intraday_for_all_symbols, sync_intraday_for_symbol, now
-from .usage import calls_today, calls_left_today, calls_this_hour
-
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger("tiingo-layer")
+from .ingest_intraday import sync_intraday_for_all_symbols, sync_intraday_for_symbol, intraday_calls_per_cycle
+from .backfill import backfill_runner
+from .db import compress_closed_intraday_partitions
+from .coordination import get_coordinator
+from .dbexec import api_db, fetch_all, get_read_engine, pools_status
+from .export import COLUMNAR_FORMATS, FORMAT_PATTERN, STREAM_FORMATS, columnar_response, parts_response, stream_rows
+from .history_tier import eod_partitions, tier_enabled
+from .latest import latest_eod, latest_intraday
+from .logs import configure_logging, lazy
+from .metrics import HTTP_REQUEST_SECONDS, instrument_scheduler, render as render_metrics, track_budget
+from .intraday_scheduler import intraday_scheduler
+from .jobs import sync_jobs
+from .ingest_stream import resubscribe_stream, start_stream, stop_stream, stream_running, stream_stats
+from .usage import calls_today, calls_left_today, calls_this_hour, load_usage, flush_usage
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Trading Data Layer", version="1.1.0")
 
@@ -35,10 +51,29 @@ app.add_middleware(
     allow_headers=["*"],            # or list specific headers
 )
 
+@app.middleware("http")
+async def _observe_latency(request: Request, call_next):
+    t = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route template, not the raw path, to keep label cardinality bounded
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.labels(request.method, getattr(route, "path", "unmatched"), str(status)).observe(
+            time.perf_counter() - t)
+
 scheduler = BackgroundScheduler(timezone=settings.TIMEZONE)
+coordinator = get_coordinator()
+instrument_scheduler(scheduler)
+track_budget(calls_today, calls_this_hour, calls_left_today)
 
 EOD_Scheduler_Id = "ingest-eod"
 IntraDay_Scheduler_Id = "ingest-intraday"
+Usage_Flush_Id = "usage-flush"
+Intraday_Compress_Id = "intraday-compress"
 
 def scheduler_eod_jobId():
     return EOD_Scheduler_Id
@@ -51,20 +86,23 @@ def _schedule_eod_job():
         # format: "m h dom mon dow" e.g. "30 23 * * *"
         minute, hour, dom, mon, dow = settings.SQLSERVER_SCHEDULE_CRON.split()
         trigger = CronTrigger(minute=minute, hour=hour, day=dom, month=mon, day_of_week=dow)
-        scheduler.add_job(run_ingest_once, trigger, id=EOD_Scheduler_Id, replace_existing=True)
+        scheduler.add_job(coordinator.leader_only(run_ingest_once), trigger, id=EOD_Scheduler_Id, replace_existing=True)
         logger.info(f"Scheduled EOD via CRON: {settings.SQLSERVER_SCHEDULE_CRON}")
     else:
         minutes = settings.FETCH_INTERVAL_MINUTES or 1440
         trigger = IntervalTrigger(minutes=minutes)
-        scheduler.add_job(run_ingest_once, trigger, id=EOD_Scheduler_Id, replace_existing=True)
+        scheduler.add_job(coordinator.leader_only(run_ingest_once), trigger, id=EOD_Scheduler_Id, replace_existing=True)
         logger.info(f"Scheduled EOD every {minutes} minutes")
 
 def _compute_intraday_interval_seconds(symbol_count: int) -> int:
     if settings.INTRADAY_INTERVAL_SECONDS:
+        # API calls one intraday cycle costs (1 per symbol, or 1 per batch in batch mode)
+        calls_per_cycle = max(1, intraday_calls_per_cycle(symbol_count))
+        hour_rate = day_rate = 0
         # If MAX_API_CALLS_PER_HOUR is defined, derive a cadence that stays under (max -buffer)
         if settings.MAX_API_CALLS_PER_HOUR:
             budget = max(1, settings.MAX_API_CALLS_PER_HOUR - int(settings.MAX_API_CALLS_PER_HOUR)/6)
-            interval = int(math.ceil(3600 * symbol_count / max(1, budget)))
+            interval = int(math.ceil(3600 * calls_per_cycle / max(1, budget)))
             hour_rate = max(30, interval)
             # return(max(30, interval))
         # If MAX_API_CALLS_PER_DAY is defined, derive a cadence that stays under (max - buffer)
@@ -72,61 +110,119 @@ def _compute_intraday_interval_seconds(symbol_count: int) -> int:
             budget = max(1, settings.MAX_API_CALLS_PER_DAY - settings.API_CALLS_BUFFER)
             # Reserve symbol_count calls for nightly EOD (rough estimate)
             budget = max(1, budget - symbol_count - 2)   # insertamos un numero reservado de peticiones para mantener los tiempos de peticion levemente altos y asegurar la estabilidad
-            # Each intraday cycle makes `symbol_count` API calls (1 per symbol)
-            # cycles_per_day <= budget / symbol_count
-            # interval_sec >= 86400 / cycles_per_day => 86400 * symbol_count / budget
-            interval = int(math.ceil(86400 * symbol_count / max(1, budget)))
+            # Each intraday cycle makes `calls_per_cycle` API calls
+            # cycles_per_day <= budget / calls_per_cycle
+            # interval_sec >= 86400 / cycles_per_day => 86400 * calls_per_cycle / budget
+            interval = int(math.ceil(86400 * calls_per_cycle / max(1, budget)))
             day_rate = max(30, interval)
             # return max(30, interval) # never faster than 30s by default
 
-        print("day_rate: ", day_rate)
-        print("hour_rate: ", hour_rate)
-        print("INTRADAY_INTERVAL_SECONDS: ", int(settings.INTRADAY_INTERVAL_SECONDS))
+        logger.debug("intraday cadence: calls_per_cycle=%s day_rate=%s hour_rate=%s configured=%s",
+                     calls_per_cycle, day_rate, hour_rate, settings.INTRADAY_INTERVAL_SECONDS)
 
         return max(15, int(settings.INTRADAY_INTERVAL_SECONDS), day_rate, hour_rate)
     
     # Fallback: 60s cycle
     return 60
 
+def _stream_mode() -> bool:
+    return settings.INTRADAY_MODE.strip().lower() == "stream"
+
+def _intraday_source() -> str:
+    # Batch polling stores snapshot bars apart from the trade-derived ones (see INTRADAY_SNAPSHOT_SOURCE)
+    return settings.INTRADAY_SNAPSHOT_SOURCE if settings.INTRADAY_BATCH_MODE and not _stream_mode() else "tiingo_iex"
+
+def _intraday_running() -> bool:
+    return stream_running() if _stream_mode() else scheduler.get_job(IntraDay_Scheduler_Id) is not None
+
 def _schedule_intraday_job():
     if not settings.INTRADAY_ENABLED:
         logger.info("Intraday sync disabled")
         return
     # symbols = [s.strip() for s in settings.SYMBOLS.split(',') if s.strip()]
     symbols = settings.SYMBOLS
+    if _stream_mode():
+        # Each replica subscribes to its own shard and follows rebalances when members join or leave
+        owned = coordinator.my_symbols(symbols)
+        start_stream(owned)
+        coordinator.on_change(_reshard_stream)
+        logger.info(f"Started INTRADAY websocket stream for {len(owned)} of {len(symbols)} symbol(s)")
+        return
+    if settings.INTRADAY_ADAPTIVE:
+        # Per-symbol cadence is re-planned inside the tick from the remaining budget; idle outside sessions
+        trigger = IntervalTrigger(seconds=max(1, settings.INTRADAY_TICK_SECONDS))
+        scheduler.add_job(intraday_scheduler.tick, trigger, id=IntraDay_Scheduler_Id, replace_existing=True,
+                          max_instances=1, coalesce=True)
+        logger.info(f"Scheduled adaptive INTRADAY polling (tick {settings.INTRADAY_TICK_SECONDS}s) for {len(symbols)} symbol(s)")
+        return
     interval_sec = _compute_intraday_interval_seconds(len(symbols))
-    print(now())
-    print("Intraday interval [sec]: ", interval_sec)
     trigger = IntervalTrigger(seconds=interval_sec)
-    scheduler.add_job(sync_intraday_for_all_symbols, trigger, id=IntraDay_Scheduler_Id, replace_existing=True)
+    scheduler.add_job(_sync_intraday_shard, trigger, id=IntraDay_Scheduler_Id, replace_existing=True)
     logger.info(f"Scheduled INTRADAY every {interval_sec}s for {len(symbols)} symbol(s)")
 
+def _schedule_usage_flush_job():
+    trigger = IntervalTrigger(seconds=max(1, settings.USAGE_FLUSH_SECONDS))
+    scheduler.add_job(flush_usage, trigger, id=Usage_Flush_Id, replace_existing=True)
+    logger.info(f"Scheduled API usage flush every {settings.USAGE_FLUSH_SECONDS}s")
+
+def _sync_intraday_shard():
+    # With other replicas running, poll only the symbols this instance owns
+    return sync_intraday_for_all_symbols(symbols=coordinator.my_symbols(settings.SYMBOLS))
+
+def _reshard_stream():
+    resubscribe_stream(coordinator.my_symbols(settings.SYMBOLS))
+
+def _compress_intraday():
+    return compress_closed_intraday_partitions(get_engine())
+
+def _schedule_intraday_compress_job():
+    if not settings.INTRADAY_COMPRESS_CRON.strip() or settings.INTRADAY_STORAGE.strip().lower() == "rowstore":
+        return
+    minute, hour, dom, mon, dow = settings.INTRADAY_COMPRESS_CRON.split()
+    trigger = CronTrigger(minute=minute, hour=hour, day=dom, month=mon, day_of_week=dow)
+    scheduler.add_job(coordinator.leader_only(_compress_intraday), trigger, id=Intraday_Compress_Id, replace_existing=True)
+    logger.info(f"Scheduled PriceBarIntra compression via CRON: {settings.INTRADAY_COMPRESS_CRON}")
+
+def _db_ping():
+    with get_read_engine().connect() as conn:
+        conn.execute(text("SELECT 1"))
+
 def getJobsList():
-    jobs = scheduler.get_jobs()
-    for job in jobs:
-        print(f"Job ID: {job.id}, Function: {job.func.__name__}, Next run time: {job.next_run_time}")
-    return jobs
+    return [f"{job.id} ({job.func.__name__}) next={job.next_run_time}" for job in scheduler.get_jobs()]
 
 @app.on_event("startup")
 def _on_startup():
     # Ensure DB ready and schedule jobs
     get_engine() # warms engine and ensures schema/tables
+    load_usage() # seeds in-memory API usage counters
+    coordinator.start() # leader lease + membership before any job fires
+    _schedule_usage_flush_job()
     _schedule_eod_job()
     _schedule_intraday_job()
+    _schedule_intraday_compress_job()
     scheduler.start()
 
-    logger.info("Service started")
+    logger.info("Service started for %d symbol(s)", len(settings.SYMBOLS))
 
 @app.on_event("shutdown")
 def _on_shutdown():
     scheduler.shutdown(wait=False)
+    stop_stream()
+    backfill_runner.stop()
+    intraday_scheduler.shutdown()
+    sync_jobs.shutdown()
+    coordinator.stop()
+    api_db.shutdown()
+    try:
+        flush_usage()
+    except Exception:
+        logger.exception("Final API usage flush failed")
 
 @app.get("/healthz")
-def healthz():
-    # Simple DB ping
+async def healthz():
+    # Simple DB ping, through the API pool so a saturated pool shows up here
     try:
-        with get_engine().begin() as conn:
-            conn.execute(text("SELECT 1"))
+        await api_db.run(_db_ping)
         db_ok = True
     except Exception:
         db_ok = False
@@ -143,8 +239,7 @@ def healthz():
 
 @app.post("/daemon/start")
 def start_daemon():
-    job = scheduler.get_job(IntraDay_Scheduler_Id)
-    if job:
+    if _intraday_running():
         return {"message": "Daemon already running"}
     # scheduler.add_job(sync_intraday_for_symbol, "interval", minutes=2, id=IntraDay_Scheduler_Id)
     _schedule_intraday_job()
@@ -152,117 +247,184 @@ def start_daemon():
 
 @app.post("/daemon/stop")
 def stop_daemon():
-    job = scheduler.get_job(IntraDay_Scheduler_Id)
-    if not job:
+    if not _intraday_running():
         return {"message": "Daemon not running"}
-    scheduler.remove_job(IntraDay_Scheduler_Id)
+    if _stream_mode():
+        stop_stream()
+    else:
+        scheduler.remove_job(IntraDay_Scheduler_Id)
     return {"message": "Daemon stopped"}
 
 @app.get("/daemon/status")
 def daemon_status():
-    job = scheduler.get_job(IntraDay_Scheduler_Id)
-    return {"running": job is not None}
-
-# Seed EOD history (recommended first)
-@app.post("/prices/sync")
+    status = {"running": _intraday_running(), "mode": "stream" if _stream_mode() else "poll"}
+    if _stream_mode():
+        status["stream"] = stream_stats()
+    elif settings.INTRADAY_ADAPTIVE:
+        status["adaptive"] = intraday_scheduler.status()
+    return status
+
+def _job_accepted(job, attached: bool) -> dict:
+    return {"job_id": job.id, "status": job.status, "attached": attached, "url": f"/jobs/{job.id}"}
+
+# Seed EOD history (recommended first); runs in the background, poll /jobs/{id}
+@app.post("/prices/sync", status_code=202)
 def sync_now():
-    return run_ingest_once()
+    job, attached = sync_jobs.submit("eod", list(settings.SYMBOLS),
+                                     lambda symbols, report: run_ingest_once(symbols, progress=report))
+    return _job_accepted(job, attached)
 
-# Seed intraday (optional, for “today” minutes)
+# Seed intraday (optional, for “today” minutes); one symbol runs inline, all symbols as a background job
 @app.post("/prices/intraday/sync")
-def intraday_sync(symbol: Optional[str] = Query(None), window_minutes: Optional[int] = Query(None)):
-    print("into /prices/intraday/sync")
+def intraday_sync(response: Response, symbol: Optional[str] = Query(None), window_minutes: Optional[int] = Query(None)):
     if symbol:
+        running = sync_jobs.find("intraday", symbol.upper())
+        if running is not None:
+            response.status_code = 202
+            return _job_accepted(running, True)
         res = sync_intraday_for_symbol(symbol.upper(), window_minutes)
         return {"data": {symbol.upper(): res}}
-    else:
-        return {"data": sync_intraday_for_all_symbols(window_minutes)}
-    
+    job, attached = sync_jobs.submit(
+        "intraday", list(settings.SYMBOLS),
+        lambda symbols, report: sync_intraday_for_all_symbols(window_minutes, symbols, progress=report))
+    response.status_code = 202
+    return _job_accepted(job, attached)
+
+@app.get("/jobs")
+def jobs_list(limit: int = Query(20, ge=1, le=200)):
+    return {"jobs": sync_jobs.recent(limit)}
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = sync_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id")
+    return job.snapshot()
+
+# Historical backfill: checkpointed per (symbol, chunk), so start again after a restart to resume
+@app.post("/backfill")
+def backfill_start(symbols: Optional[str] = Query(None, description="Comma-separated; omit to resume open units"),
+                   start: Optional[str] = Query(None, description="YYYY-MM-DD, default INIT_START_DATE"),
+                   end: Optional[str] = Query(None, description="YYYY-MM-DD, default today")):
+    syms = [s.strip().upper() for s in symbols.split(",") if s.strip()] if symbols else None
+    try:
+        return backfill_runner.start(syms, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/backfill/pause")
+def backfill_pause():
+    backfill_runner.pause()
+    return backfill_runner.snapshot()
+
+@app.post("/backfill/resume")
+def backfill_resume():
+    backfill_runner.resume()
+    return backfill_runner.snapshot()
+
+@app.get("/backfill")
+def backfill_progress():
+    return backfill_runner.progress()
+
 @app.get("/prices/latest")
-def latest_prices(symbol: Optional[str] = Query(None, description="If omitted, returns latest for all configured symbols")):
-    print("/prices/latest - arg symbol: ", symbol)
+async def latest_prices(symbol: Optional[str] = Query(None, description="If omitted, returns latest for all configured symbols")):
     symbols: List[str]
     if symbol:
-        print("if symbol")
         symbols = [symbol.upper()]
     else:
-        print("else symbol")
         symbols = [s.strip().upper() for s in settings.SYMBOLS if s.strip()]
+    return {"data": await api_db.run(latest_eod, get_read_engine(), symbols)}
 
-    print("baked symbols: ", symbols)
+@app.get("/prices/intraday/latest")
+async def intraday_latest(
+    symbol: Optional[str] = Query(None, description="If omitted, returns latest for all configured symbols"),
+    interval_sec: Optional[int] = Query(None, description="Override interval in seconds (default from config)"),
+    ):
+    symbols = [symbol.upper()] if symbol else [s.strip().upper() for s in settings.SYMBOLS if s.strip()]
+    isec = interval_sec or _interval_seconds_from_config()
+    return {"data": await api_db.run(latest_intraday, get_read_engine(), symbols, isec, _intraday_source())}
 
-    results = []
-    sql = text(
-        f"""
-        SELECT TOP (1) [Symbol],[Source],[BarDate],[Open],[High],[Low],[Close],[Volume],[AdjClose]
-        FROM [{settings.SQLSERVER_DB_SCHEMA}].[PriceBar]
-        WHERE [Symbol] = :symbol AND [Source] = :source
-        ORDER BY [BarDate] DESC
-        """
-    )
-    with get_engine().begin() as conn:
-        for sym in symbols:
-            row = conn.execute(sql, {"symbol": sym, "source": settings.SOURCE_EOD}).mappings().first()
-            if row:
-                results.append(dict(row))
-    return {"data": results}
+@app.get("/metrics")
+def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/coordination")
+def coordination_status():
+    return coordinator.status(settings.SYMBOLS)
+
+@app.get("/db/pools")
+def db_pools():
+    # Checkout wait times per pool (api/ingest) and API executor saturation, for sizing the pools
+    return pools_status()
 
 @app.get("/usage")
 def usage():
-    print("Printing jobs: ",getJobsList())
+    logger.debug("jobs: %s", lazy(getJobsList))
     return {"calls_today": calls_today(), "calls_this_hour": calls_this_hour(),"calls_left_today": calls_left_today()}
 
 @app.get("/prices/history")
-def eod_history(
+async def eod_history(
     symbol: str = Query(..., description="Ticker symbol, e.g., MSFT"),
     start: Optional[str] = Query(None, description="YYYY-MM-DD (inclusive)"),
     end: Optional[str] = Query(None, description="YYYY-MM-DD (inclusive)"),
     order: str = Query("asc", pattern="^(?i)(asc|desc)$", description="Sort by date"),
+    fmt: str = Query("json", alias="format", pattern=FORMAT_PATTERN, description="json, ndjson/csv streamed, or arrow/parquet columnar"),
     ):
-    print("into /prices/history")
     # Return EOD bars from PriceBar for a date range (inclusive).
     symbol = symbol.upper()
+    _check_iso("start", start)
+    _check_iso("end", end)
+    if tier_enabled():
+        # Closed years from the local Arrow tier, only the open tail from SQL Server
+        return await api_db.run(parts_response, eod_partitions(symbol, settings.SOURCE_EOD, start, end, order),
+                                fmt, f"{symbol}_eod")
     params = {"symbol": symbol, "source": settings.SOURCE_EOD}
     clauses = ["[Symbol] = :symbol", "[Source] = :source"]
     if start:
         params["start"] = start
-        clauses.append("[BarDate] >= :start")
+        clauses.append("[BarDate] >= CONVERT(date, :start)")
     if end:
         params["end"] = end
-        clauses.append("[BarDate] <= :end")
+        clauses.append("[BarDate] <= CONVERT(date, :end)")
 
     sql = text(
         f"""
         SELECT [Symbol],[Source],[BarDate],[Open],[High],[Low],[Close],[Volume],[AdjClose]
         FROM [{settings.SQLSERVER_DB_SCHEMA}].[PriceBar]
-        WHERE [Symbol] = :symbol AND [Source] = :source
-        AND (:start IS NULL OR [BarDate] >= CONVERT(date, :start))
-        AND (:end   IS NULL OR [BarDate] <= CONVERT(date, :end))
+        WHERE {" AND ".join(clauses)}
         ORDER BY [BarDate] {"ASC" if order.lower()=="asc" else "DESC"}
     """
     )
-    print("execution query: ", sql, params)
-    with get_engine().begin() as conn:
-        rows = conn.execute(sql, params).mappings().all()
-
-    print("returned rows: ", rows)
-    return {"data": [dict(r) for r in rows]}
+    if fmt.lower() in STREAM_FORMATS:
+        return stream_rows(sql, params, fmt, f"{symbol}_eod")
+    if fmt.lower() in COLUMNAR_FORMATS:
+        return columnar_response(sql, params, fmt, f"{symbol}_eod")
+    return {"data": await api_db.run(fetch_all, sql, params)}
 
 @app.get("/prices/intraday/history")
-def intraday_history(
+async def intraday_history(
     symbol: str = Query(..., description="Ticker symbol, e.g., MSFT"),
     start: Optional[str] = Query(None, description="ISO date or datetime; filters BarTime >= start"),
     end: Optional[str] = Query(None, description="ISO date or datetime; filters BarTime <= end"),
     interval_sec: Optional[int] = Query(None, description="Override interval in seconds (default from config)"),
     order: str = Query("asc", pattern="^(?i)(asc|desc)$"),
-    limit: Optional[int] = Query(None, ge=1, le=100000),
+    limit: Optional[int] = Query(None, ge=1, le=100000, description="Unpaged only; not with page_size/cursor"),
+    fmt: str = Query("json", alias="format", pattern=FORMAT_PATTERN, description="json, ndjson/csv streamed, or arrow/parquet columnar"),
+    page_size: Optional[int] = Query(None, ge=1, le=100000, description="Keyset-paginate; response carries next_cursor"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
     ):
     """Return intraday bars from PriceBarIntra for a time range (inclusive)."""
     symbol = symbol.upper()
     isec = interval_sec or _interval_seconds_from_config()
+    paged = page_size is not None or cursor is not None
+    if paged and fmt.lower() != "json":
+        raise HTTPException(status_code=400, detail="page_size/cursor are only supported with format=json")
+    if paged and limit is not None:
+        raise HTTPException(status_code=400, detail="limit cannot be combined with page_size/cursor; use page_size")
 
 
-    params = {"symbol": symbol, "source": "tiingo_iex", "isec": isec}
+    params = {"symbol": symbol, "source": _intraday_source(), "isec": isec}
     clauses = ["[Symbol] = :symbol", "[Source] = :source", "[IntervalSec] = :isec"]
     if start:
         params["start"] = start
@@ -273,6 +435,14 @@ def intraday_history(
     
     order_sql = "ASC" if order.lower() == "asc" else "DESC"
     top_sql = f"TOP ({int(limit)}) " if limit else ""
+    if paged:
+        # Keyset: continue strictly after the last BarTime served; a range seek on the PK, never OFFSET
+        page_size = page_size or settings.INTRADAY_PAGE_SIZE
+        if cursor:
+            params["after"] = _decode_cursor(cursor, symbol, isec, order_sql)
+            clauses.append("[BarTime] > :after" if order_sql == "ASC" else "[BarTime] < :after")
+        # One extra row tells us whether another page exists
+        top_sql = f"TOP ({int(page_size) + 1}) "
 
 
     sql = text(
@@ -283,9 +453,107 @@ def intraday_history(
         ORDER BY [BarTime] {order_sql}
         """
     )
-    with get_engine().begin() as conn:
-        rows = conn.execute(sql, params).mappings().all()
-    return {"data": [dict(r) for r in rows]}
+    if fmt.lower() in STREAM_FORMATS:
+        return stream_rows(sql, params, fmt, f"{symbol}_{isec}s")
+    if fmt.lower() in COLUMNAR_FORMATS:
+        return columnar_response(sql, params, fmt, f"{symbol}_{isec}s")
+    rows = await api_db.run(fetch_all, sql, params)
+    if paged:
+        data = rows[:page_size]
+        next_cursor = _encode_cursor(data[-1]["BarTime"], symbol, isec, order_sql) if len(rows) > page_size else None
+        return {"data": data, "page_size": page_size, "next_cursor": next_cursor}
+    return {"data": rows}
+
+@app.get("/prices/intraday/bars")
+async def intraday_bars(
+    resample: str = Query(..., description="Target bar size, e.g. 5min, 15min, 1h (multiple of the stored interval)"),
+    symbol: Optional[str] = Query(None, description="Comma-separated tickers; defaults to all configured symbols"),
+    start: Optional[str] = Query(None, description="ISO date or datetime; filters BarTime >= start"),
+    end: Optional[str] = Query(None, description="ISO date or datetime; filters BarTime <= end"),
+    interval_sec: Optional[int] = Query(None, description="Stored interval to aggregate from (default from config)"),
+    order: str = Query("asc", pattern="^(?i)(asc|desc)$"),
+    ):
+    """Aggregate stored intraday bars to a coarser size in SQL: first open, max high, min low, last close, sum volume."""
+    isec = interval_sec or _interval_seconds_from_config()
+    bucket = _parse_resample(resample)
+    if bucket < isec or bucket % isec:
+        raise HTTPException(status_code=400, detail=f"resample must be a multiple of the stored interval ({isec}s)")
+    symbols = [s.strip().upper() for s in symbol.split(",") if s.strip()] if symbol else \
+        [s.strip().upper() for s in settings.SYMBOLS if s.strip()]
+    if not symbols:
+        raise HTTPException(status_code=400, detail="No symbols requested")
+
+    params = {"source": _intraday_source(), "isec": isec, "bucket": bucket}
+    placeholders = []
+    for i, sym in enumerate(symbols):
+        params[f"s{i}"] = sym
+        placeholders.append(f":s{i}")
+    clauses = [f"[Symbol] IN ({', '.join(placeholders)})", "[Source] = :source", "[IntervalSec] = :isec"]
+    if start:
+        params["start"] = start
+        clauses.append("[BarTime] >= :start")
+    if end:
+        params["end"] = end
+        clauses.append("[BarTime] <= :end")
+    order_sql = "ASC" if order.lower() == "asc" else "DESC"
+
+    # Buckets are aligned to 2000-01-01 UTC (so to midnight for any size that divides a day)
+    sql = text(
+        f"""
+        WITH b AS (
+            SELECT [Symbol],[BarTime],[Open],[High],[Low],[Close],[Volume],
+                   DATEADD(second, (DATEDIFF(second, '2000-01-01', [BarTime]) / :bucket) * :bucket,
+                           CAST('2000-01-01' AS DATETIME2(0))) AS Bucket
+            FROM [{settings.SQLSERVER_DB_SCHEMA}].[PriceBarIntra]
+            WHERE {" AND ".join(clauses)}
+        ), w AS (
+            SELECT *,
+                   FIRST_VALUE([Open]) OVER (PARTITION BY [Symbol], Bucket ORDER BY [BarTime]
+                       ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING) AS FirstOpen,
+                   LAST_VALUE([Close]) OVER (PARTITION BY [Symbol], Bucket ORDER BY [BarTime]
+                       ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING) AS LastClose
+            FROM b
+        )
+        SELECT [Symbol], Bucket AS [BarTime], :bucket AS [IntervalSec],
+               MIN(FirstOpen) AS [Open], MAX([High]) AS [High], MIN([Low]) AS [Low],
+               MIN(LastClose) AS [Close], SUM([Volume]) AS [Volume], COUNT(*) AS [Bars]
+        FROM w
+        GROUP BY [Symbol], Bucket
+        ORDER BY [Symbol], Bucket {order_sql}
+        """
+    )
+    return {"resample": resample, "interval_sec": bucket, "data": await api_db.run(fetch_all, sql, params)}
+
+def _check_iso(name: str, value: Optional[str]) -> None:
+    if value is None:
+        return
+    try:
+        datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be an ISO date (YYYY-MM-DD), got '{value}'")
+
+def _parse_resample(value: str) -> int:
+    r = (value or "").strip().lower()
+    units = (("min", 60), ("sec", 1), ("hour", 3600), ("h", 3600), ("s", 1))
+    for suffix, mult in units:
+        if r.endswith(suffix) and r[:-len(suffix)].isdigit() and int(r[:-len(suffix)]) > 0:
+            return int(r[:-len(suffix)]) * mult
+    raise HTTPException(status_code=400, detail=f"Unsupported resample '{value}' (use e.g. 30sec, 5min, 1h)")
+
+def _encode_cursor(last_bar_time: datetime, symbol: str, isec: int, order_sql: str) -> str:
+    raw = json.dumps({"t": last_bar_time.isoformat(), "s": symbol, "i": isec, "o": order_sql}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor: str, symbol: str, isec: int, order_sql: str) -> datetime:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        state = json.loads(raw)
+        last = datetime.fromisoformat(state["t"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if (state.get("s"), state.get("i"), state.get("o")) != (symbol, isec, order_sql):
+        raise HTTPException(status_code=400, detail="Cursor does not belong to this symbol/interval/order")
+    return last
 
 def _interval_seconds_from_config() -> int:
     r = (settings.INTRADAY_RESAMPLE or "1min").strip().lower()
@@ -298,16 +566,5 @@ def _interval_seconds_from_config() -> int:
     return 60
 
 def _fetch_latest_intraday(symbol: str):
-    isec = _interval_seconds_from_config()
-    sql = text(
-        f"""
-        SELECT TOP (1)
-        [Symbol],[Source],[BarTime],[IntervalSec],[Open],[High],[Low],[Close],[Volume]
-        FROM [{settings.SQLSERVER_DB_SCHEMA}].[PriceBarIntra]
-        WHERE [Symbol] = :symbol AND [Source] = 'tiingo_iex' AND [IntervalSec] = :isec
-        ORDER BY [BarTime] DESC
-        """
-    )
-    with get_engine().begin() as conn:
-        row = conn.execute(sql, {"symbol": symbol, "isec": isec}).mappings().first()
-        return (dict(row) if row else None)
\ No newline at end of file
+    rows = latest_intraday(get_read_engine(), [symbol.upper()], _interval_seconds_from_config(), _intraday_source())
+    return rows[0] if rows else None
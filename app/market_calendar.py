@@ -0,0 +1,104 @@
+from __future__ import annotations
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import FrozenSet, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from .config import settings
+
+# US equity trading calendar (NYSE rules: weekends, full holidays, 13:00 early closes) with session hours
+# MARKET_OPEN..MARKET_CLOSE read in MARKET_TIMEZONE (exchange time). MARKET_HOLIDAYS adds closures.
+
+def market_tz() -> ZoneInfo:
+    return ZoneInfo(settings.MARKET_TIMEZONE)
+
+def _hhmm(value: str) -> time:
+    h, _, m = value.strip().partition(":")
+    return time(int(h), int(m or 0))
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    # n-th (1-based) weekday of the month; n = -1 for the last one
+    if n > 0:
+        d = date(year, month, 1)
+        return d + timedelta(days=(weekday - d.weekday()) % 7 + 7 * (n - 1))
+    d = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return d - timedelta(days=(d.weekday() - weekday) % 7)
+
+def _easter(year: int) -> date:
+    # Anonymous Gregorian algorithm
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 19 * l) // 433
+    month = (h + l - 7 * m + 90) // 25
+    return date(year, month, (h + l - 7 * m + 33 * month + 19) % 32)
+
+def _observed(d: date) -> date:
+    if d.weekday() == 5:
+        return d - timedelta(days=1)
+    if d.weekday() == 6:
+        return d + timedelta(days=1)
+    return d
+
+@lru_cache(maxsize=8)
+def holidays(year: int) -> FrozenSet[date]:
+    days = {
+        _nth_weekday(year, 1, 0, 3),            # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),            # Washington's Birthday
+        _easter(year) - timedelta(days=2),      # Good Friday
+        _nth_weekday(year, 5, 0, -1),           # Memorial Day
+        _observed(date(year, 7, 4)),
+        _nth_weekday(year, 9, 0, 1),            # Labor Day
+        _nth_weekday(year, 11, 3, 4),           # Thanksgiving
+        _observed(date(year, 12, 25)),
+    }
+    # New Year's Day on a Saturday is not observed on the Friday before
+    if date(year, 1, 1).weekday() != 5:
+        days.add(_observed(date(year, 1, 1)))
+    if year >= 2022:
+        days.add(_observed(date(year, 6, 19)))  # Juneteenth
+    for item in settings.MARKET_HOLIDAYS.split(","):
+        if item.strip() and item.strip().startswith(str(year)):
+            days.add(date.fromisoformat(item.strip()))
+    return frozenset(days)
+
+@lru_cache(maxsize=8)
+def early_closes(year: int) -> FrozenSet[date]:
+    days = {_nth_weekday(year, 11, 3, 4) + timedelta(days=1)}  # day after Thanksgiving
+    jul3, dec24 = date(year, 7, 3), date(year, 12, 24)
+    if jul3.weekday() < 4 and date(year, 7, 4).weekday() < 5:
+        days.add(jul3)
+    if dec24.weekday() < 4:
+        days.add(dec24)
+    return frozenset(days - holidays(year))
+
+def is_trading_day(d: date) -> bool:
+    return d.weekday() < 5 and d not in holidays(d.year)
+
+def session(d: date) -> Optional[Tuple[datetime, datetime]]:
+    """(open, close) for `d` in market time, padded by MARKET_PRE_OPEN/POST_CLOSE_MINUTES; None if closed."""
+    if not is_trading_day(d):
+        return None
+    tz = market_tz()
+    close = settings.MARKET_EARLY_CLOSE if d in early_closes(d.year) else settings.MARKET_CLOSE
+    start = datetime.combine(d, _hhmm(settings.MARKET_OPEN), tz) - timedelta(minutes=settings.MARKET_PRE_OPEN_MINUTES)
+    end = datetime.combine(d, _hhmm(close), tz) + timedelta(minutes=settings.MARKET_POST_CLOSE_MINUTES)
+    return start, end
+
+def current_session(now: Optional[datetime] = None) -> Optional[Tuple[datetime, datetime]]:
+    now = (now or datetime.now(market_tz())).astimezone(market_tz())
+    s = session(now.date())
+    return s if s is not None and s[0] <= now < s[1] else None
+
+def next_session_open(now: Optional[datetime] = None) -> datetime:
+    now = (now or datetime.now(market_tz())).astimezone(market_tz())
+    d = now.date()
+    for _ in range(15):
+        s = session(d)
+        if s is not None and now < s[0]:
+            return s[0]
+        d += timedelta(days=1)
+    raise RuntimeError("no trading session in the next 15 days; check MARKET_HOLIDAYS")
@@ -0,0 +1,161 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Any, Dict, Optional
+import re
+import time
+
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Prometheus metrics for the hot paths (exposed at /metrics): Tiingo calls, DB statements and pool
+# waits, scheduler jobs, HTTP routes. Buckets cover LAN DB round trips up to slow backfills.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+JOB_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 5000, 10000, 50000, 100000, 500000)
+
+TIINGO_REQUEST_SECONDS = Histogram(
+    "tiingo_request_seconds", "Latency of Tiingo HTTP attempts by outcome (ok, throttled, client_error, error)",
+    ["client", "endpoint", "outcome"], buckets=LATENCY_BUCKETS)
+DB_STATEMENT_SECONDS = Histogram(
+    "db_statement_seconds", "Latency of DB statements by type (verb + target table)",
+    ["role", "statement"], buckets=LATENCY_BUCKETS)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a pooled DB connection", ["role"], buckets=LATENCY_BUCKETS)
+DB_ROWS_WRITTEN = Counter("db_rows_written_total", "Bars the DB writers inserted or changed", ["table"])
+JOB_DURATION_SECONDS = Histogram(
+    "scheduler_job_duration_seconds", "Wall time of scheduled jobs", ["job"], buckets=JOB_BUCKETS)
+JOB_LAG_SECONDS = Histogram(
+    "scheduler_job_lag_seconds", "Delay between a job's planned run time and its actual start", ["job"],
+    buckets=LATENCY_BUCKETS)
+JOB_ROWS = Histogram("scheduler_job_rows_written", "Rows written per job run", ["job"], buckets=ROW_BUCKETS)
+FETCH_COALESCED = Counter(
+    "fetch_coalesced_total", "Symbol fetches by single-flight outcome (leader = actually fetched)", ["kind", "outcome"])
+JOB_RUNS = Counter("scheduler_job_runs_total", "Scheduled job runs by outcome", ["job", "outcome"])
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "API latency by route (streamed bodies: until headers are sent)",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS)
+API_CALLS_TODAY = Gauge("tiingo_api_calls_today", "Tiingo calls counted today")
+API_CALLS_THIS_HOUR = Gauge("tiingo_api_calls_this_hour", "Tiingo calls counted this hour")
+API_CALLS_LEFT_TODAY = Gauge("tiingo_api_calls_left_today", "Daily Tiingo budget left (+Inf when unlimited)")
+
+def render() -> tuple:
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+# --- Tiingo ---
+
+def tiingo_outcome(status: Optional[int]) -> str:
+    """Outcome label for a Tiingo response status; None means no response (connection error, timeout)."""
+    if status is None or status >= 500:
+        return "error"
+    if status == 429:
+        return "throttled"
+    return "client_error" if status >= 400 else "ok"
+
+@contextmanager
+def tiingo_timer(client: str, endpoint: str):
+    """Time one HTTP attempt; the caller stores the response status in the yielded dict (call["status"])."""
+    t = time.perf_counter()
+    call: Dict[str, Optional[int]] = {"status": None}
+    try:
+        yield call
+    finally:
+        TIINGO_REQUEST_SECONDS.labels(client, endpoint, tiingo_outcome(call["status"])).observe(time.perf_counter() - t)
+
+# --- DB ---
+
+_VERB = re.compile(r"^\s*(?:IF\s+OBJECT_ID\(N'tempdb\.\.#\w+'\)\s+IS\s+NOT\s+NULL\s+DROP\s+TABLE\s+#\w+;\s*)?(\w+)", re.I)
+_TABLE = re.compile(r"(?:FROM|INTO|MERGE|TABLE|UPDATE)\s+((?:\[\w+\]\.)?\[?#?\w+\]?)", re.I)
+
+def statement_kind(sql: str) -> str:
+    """Low-cardinality label for a statement, e.g. "merge PriceBar" or "select PriceBarIntra"."""
+    verb = _VERB.match(sql)
+    table = _TABLE.search(sql)
+    name = table.group(1).split(".")[-1].strip("[]") if table else ""
+    return f"{verb.group(1).lower() if verb else 'other'} {name}".strip()
+
+def instrument_engine(engine: Engine, role: str) -> None:
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_t0", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_t0"].pop()
+        DB_STATEMENT_SECONDS.labels(role, statement_kind(statement)).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(ctx):
+        stack = ctx.connection.info.get("metrics_t0") if ctx.connection is not None else None
+        if stack:
+            stack.pop()
+
+def observe_pool_wait(role: str, seconds: float) -> None:
+    DB_POOL_WAIT_SECONDS.labels(role).observe(seconds)
+
+def rows_written(table: str, n: int) -> None:
+    DB_ROWS_WRITTEN.labels(table).inc(n)
+
+# --- Scheduler ---
+
+_job_lock = Lock()
+# job id -> wall-clock start; None marks a run that finished before its SUBMITTED event was dispatched
+_job_started: Dict[str, Optional[datetime]] = {}
+
+def _job_rows(retval: Any) -> Optional[int]:
+    # run_ingest_once -> {"inserted": {sym: n}}; sync_intraday_* -> {sym: {"inserted": n, ...}}
+    if not isinstance(retval, dict):
+        return None
+    if isinstance(retval.get("inserted"), dict):
+        return sum(int(n or 0) for n in retval["inserted"].values())
+    counts = [v.get("inserted") for v in retval.values() if isinstance(v, dict)]
+    return sum(int(n or 0) for n in counts) if counts else None
+
+def _on_job_event(ev) -> None:
+    now = datetime.now(timezone.utc)
+    if ev.code == EVENT_JOB_SUBMITTED:
+        with _job_lock:
+            if ev.job_id in _job_started and _job_started[ev.job_id] is None:
+                del _job_started[ev.job_id]
+            else:
+                _job_started[ev.job_id] = now
+        for planned in ev.scheduled_run_times:
+            JOB_LAG_SECONDS.labels(ev.job_id).observe(max(0.0, (now - planned).total_seconds()))
+        return
+    if ev.code == EVENT_JOB_MISSED:
+        JOB_RUNS.labels(ev.job_id, "missed").inc()
+        return
+    with _job_lock:
+        started = _job_started.pop(ev.job_id, None)
+        if started is None:
+            # The executor can finish a short job before SUBMITTED is dispatched; fall back to the planned time
+            _job_started[ev.job_id] = None
+            started = ev.scheduled_run_time
+    JOB_DURATION_SECONDS.labels(ev.job_id).observe(max(0.0, (now - started).total_seconds()))
+    JOB_RUNS.labels(ev.job_id, "error" if ev.code == EVENT_JOB_ERROR else "ok").inc()
+    rows = _job_rows(getattr(ev, "retval", None))
+    if rows is not None:
+        JOB_ROWS.labels(ev.job_id).observe(rows)
+
+def instrument_scheduler(scheduler) -> None:
+    scheduler.add_listener(_on_job_event, EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+
+# --- API budget (read at scrape time) ---
+
+def _scrape_value(fn):
+    # A scrape must not fail because the usage counters can't be seeded (DB down): report NaN instead
+    def read() -> float:
+        try:
+            value = fn()
+        except Exception:
+            return float("nan")
+        return float("inf") if value is None else float(value)
+    return read
+
+def track_budget(calls_today, calls_this_hour, calls_left_today) -> None:
+    API_CALLS_TODAY.set_function(_scrape_value(calls_today))
+    API_CALLS_THIS_HOUR.set_function(_scrape_value(calls_this_hour))
+    API_CALLS_LEFT_TODAY.set_function(_scrape_value(calls_left_today))
@@ -0,0 +1,103 @@
+from __future__ import annotations
+from collections import deque
+from threading import Lock
+from typing import Callable, Deque, List, Optional
+import logging
+import time
+
+from .config import settings
+
+log = logging.getLogger(__name__)
+
+
+class WindowLimit:
+    """At most `limit` calls in any `window` seconds: remembers when each of the last `limit` calls was made.
+    Unlike a token bucket that starts full and refills, this never lets a burst plus refill exceed the
+    provider's cap, and a window that holds the limit also holds it for every clock minute/hour inside it."""
+
+    def __init__(self, limit: int, window: float, spent: Optional[Callable[[], float]] = None):
+        self.limit = int(limit)
+        self.window = float(window)
+        self.calls: Deque[float] = deque()
+        # Calls already made in this window before the process started (e.g. the usage counters)
+        self.spent = spent
+
+    def seed(self) -> None:
+        if self.spent is not None:
+            # Timed as made just now: conservative, they age out a full window after startup
+            now = time.monotonic()
+            self.calls.extend([now] * min(self.limit, int(self.spent())))
+
+    def wait_time(self, now: float, n: float = 1) -> float:
+        while self.calls and self.calls[0] <= now - self.window:
+            self.calls.popleft()
+        over = len(self.calls) + int(n) - self.limit
+        if over <= 0:
+            return 0.0
+        if over > len(self.calls):
+            # n alone exceeds the limit: it can never be granted
+            return float("inf")
+        return self.calls[over - 1] + self.window - now
+
+    def take(self, n: float = 1) -> None:
+        self.calls.extend([time.monotonic()] * int(n))
+
+
+class RateLimiter:
+    """Thread-safe limiter over several windows; a call proceeds only when every window has room."""
+
+    def __init__(self, buckets: List[WindowLimit]):
+        self._buckets = buckets
+        self._lock = Lock()
+        self._seeded = False
+
+    def _seed(self) -> None:
+        # Lazily, on the first call: a restart mid-hour must not hand out a full hour's budget again
+        self._seeded = True
+        for b in self._buckets:
+            try:
+                b.seed()
+            except Exception as e:
+                log.warning("rate limiter: could not seed from usage: %r", e)
+
+    def acquire(self, n: int = 1, timeout: Optional[float] = None) -> bool:
+        """Wait for room for `n` calls; False if that would take longer than `timeout` seconds (None: no bound)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if not self._seeded:
+                    self._seed()
+                now = time.monotonic()
+                wait = max((b.wait_time(now, n) for b in self._buckets), default=0.0)
+                if wait <= 0:
+                    for b in self._buckets:
+                        b.take(n)
+                    return True
+            if wait == float("inf") or deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+def _per_minute(calls: int) -> Optional[WindowLimit]:
+    return WindowLimit(calls, 60.0) if calls and calls > 0 else None
+
+def _per_hour(calls: int) -> Optional[WindowLimit]:
+    return WindowLimit(calls, 3600.0, spent=_calls_this_hour) if calls and calls > 0 else None
+
+def _calls_this_hour() -> int:
+    # Imported here: usage -> ingest -> tiingo_client -> tiingo_http -> ratelimit would be circular
+    from .usage import calls_this_hour
+    return calls_this_hour()
+
+
+class RateLimitTimeout(RuntimeError):
+    """No room under the rate limiter within TIINGO_LIMIT_WAIT_SECONDS; the call was not made."""
+
+
+# Shared by every worker that talks to Tiingo; 0/unset limits are simply not enforced. Per process: with
+# replicas (COORDINATION_BACKEND) each one enforces the full limits on its own, so the provider can see
+# up to N times them. Intraday polling already plans only its shard of the budget; EOD jobs run on the leader.
+tiingo_limiter = RateLimiter([b for b in (
+    _per_minute(settings.MAX_CALLS_PER_MINUTE),
+    _per_hour(settings.MAX_API_CALLS_PER_HOUR),
+) if b is not None])
@@ -0,0 +1,68 @@
+from __future__ import annotations
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Hashable, Optional
+import time
+
+from .metrics import FETCH_COALESCED
+
+# Single-flight: concurrent callers for the same key share one in-flight call and its result (or error);
+# a successful result is also served for `fresh_seconds` afterwards without calling again.
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "finished")
+
+    def __init__(self):
+        self.done = Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.finished = 0.0
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any], fresh_seconds: float = 0.0) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.done.is_set():
+                if call.error is None and time.monotonic() - call.finished < fresh_seconds:
+                    FETCH_COALESCED.labels(self.name, "fresh").inc()
+                    return _shared(call.result)
+                call = None
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            FETCH_COALESCED.labels(self.name, "shared").inc()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return _shared(call.result)
+        FETCH_COALESCED.labels(self.name, "leader").inc()
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            call.finished = time.monotonic()
+            call.done.set()
+            with self._lock:
+                # Failures aren't cached; drop finished entries so the map only holds recent keys
+                if call.error is not None or fresh_seconds <= 0:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._calls.clear()
+
+
+def _shared(result: Any) -> Any:
+    # Mark results a caller didn't fetch itself; copies so callers never mutate each other's dict
+    return {**result, "shared": True} if isinstance(result, dict) else result
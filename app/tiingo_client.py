@@ -1,5 +1,9 @@
 from tiingo import TiingoClient
 from .config import settings
+from .tiingo_http import ClientSession
 
 
-tiingo_client = TiingoClient({"api_key": settings.TIINGO_API_KEY})
\ No newline at end of file
+tiingo_client = TiingoClient({"api_key": settings.TIINGO_API_KEY})
+# Route the client through the shared transport (pooling, retries, rate limit, usage accounting)
+tiingo_client._base_url = settings.TIINGO_BASE_URL.rstrip("/")
+tiingo_client._session = ClientSession()
@@ -0,0 +1,124 @@
+from __future__ import annotations
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from typing import Any, Optional
+import logging
+import random
+import re
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .config import settings
+from .metrics import tiingo_timer
+from .ratelimit import RateLimitTimeout, tiingo_limiter
+
+# Shared Tiingo transport: one keep-alive Session (pooled connections, gzip), per-attempt timeouts,
+# jittered backoff on 429/5xx that honours Retry-After. Every attempt that reaches Tiingo passes the
+# shared rate limiter and is counted in API usage exactly once, here and nowhere else.
+
+log = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session: Optional[requests.Session] = None
+_session_lock = Lock()
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(4, settings.TIINGO_POOL_SIZE))
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({
+                    "Authorization": f"Token {settings.TIINGO_API_KEY}",
+                    "Content-Type": "application/json",
+                    "Accept-Encoding": "gzip, deflate",
+                })
+                _session = session
+    return _session
+
+def endpoint_label(url: str) -> str:
+    path = re.sub(r"^https?://[^/]+", "", url).split("?")[0]
+    if path.startswith("/tiingo/daily/"):
+        return "daily"
+    if re.fullmatch(r"/iex/[^/]+/prices/?", path):
+        return "iex_prices"
+    if path.rstrip("/") == "/iex":
+        return "iex_top"
+    return "other"
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def _backoff(attempt: int) -> float:
+    # Full jitter over an exponential ceiling
+    return random.uniform(0, min(settings.TIINGO_BACKOFF_MAX_SECONDS, settings.TIINGO_BACKOFF_SECONDS * 2 ** attempt))
+
+def _count_call() -> None:
+    # Imported here: usage -> ingest -> tiingo_client -> tiingo_http would be circular at module load
+    from .usage import increment_calls
+    increment_calls(1)
+
+def request(method: str, url: str, client: str = "rest", **kwargs: Any) -> requests.Response:
+    """Send one logical request, retrying 429/5xx and connection errors; returns the last response
+    (callers decide on raise_for_status)."""
+    kwargs.setdefault("timeout", (settings.TIINGO_CONNECT_TIMEOUT, settings.TIINGO_READ_TIMEOUT))
+    endpoint = endpoint_label(url)
+    session = get_session()
+    attempt = 0
+    while True:
+        if not tiingo_limiter.acquire(timeout=settings.TIINGO_LIMIT_WAIT_SECONDS):
+            raise RateLimitTimeout(f"tiingo {endpoint}: rate limiter had no room within {settings.TIINGO_LIMIT_WAIT_SECONDS:g}s")
+        try:
+            with tiingo_timer(client, endpoint) as call:
+                response = session.request(method, url, **kwargs)
+                call["status"] = response.status_code
+        except (requests.ConnectionError, requests.Timeout) as e:
+            # No response: the request may not have reached Tiingo, so it is not counted
+            if attempt >= settings.TIINGO_MAX_RETRIES:
+                raise
+            delay = _backoff(attempt)
+            log.warning("tiingo %s %s failed (%r); retry %d in %.1fs", method, endpoint, e, attempt + 1, delay)
+        else:
+            _count_call()
+            if response.status_code not in RETRY_STATUSES or attempt >= settings.TIINGO_MAX_RETRIES:
+                return response
+            wait = _retry_after(response)
+            if wait is not None and wait > settings.TIINGO_BACKOFF_MAX_SECONDS:
+                # e.g. hourly quota exhausted: waiting inside a job would only stall the scheduler
+                return response
+            delay = wait if wait is not None else _backoff(attempt)
+            log.warning("tiingo %s %s -> %s; retry %d in %.1fs", method, endpoint, response.status_code, attempt + 1, delay)
+            response.close()
+        attempt += 1
+        time.sleep(delay)
+
+def get(path: str, params: Optional[dict] = None) -> requests.Response:
+    """GET {TIINGO_BASE_URL}{path} through the shared transport; raises for a final non-2xx."""
+    response = request("GET", f"{settings.TIINGO_BASE_URL.rstrip('/')}{path}", params=params)
+    response.raise_for_status()
+    return response
+
+
+class ClientSession:
+    """The `_session` object tiingo.TiingoClient calls (`request(method, url, **kwargs)`), routed here."""
+
+    def __init__(self, client: str = "tiingo_client"):
+        self.client = client
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        return request(method, url, client=self.client, **kwargs)
@@ -1,5 +1,7 @@
 from __future__ import annotations
 from datetime import date, datetime
+from threading import Lock
+from typing import Dict, Tuple
 from zoneinfo import ZoneInfo
 from sqlalchemy import text
 from .config import settings
@@ -7,6 +9,15 @@ from .ingest import get_engine
 
 SERVICE_NAME = "tiingo"
 
+# In-memory accountant: counters are seeded from ApiUsage/ApiUsageHourly, incremented in process
+# and written back as deltas by flush_usage() (scheduled job + shutdown).
+_lock = Lock()
+_loaded = False
+_daily: Dict[str, int] = {}
+_hourly: Dict[Tuple[str, int], int] = {}
+_pending_daily: Dict[str, int] = {}
+_pending_hourly: Dict[Tuple[str, int], int] = {}
+
 def _now_local() -> datetime:
     return datetime.now(ZoneInfo(settings.TIMEZONE))
 
@@ -20,72 +31,124 @@ def _hour_key(when: datetime | None = None):
     dt = when or _now_local()
     return dt.date().isoformat(), dt.hour
 
-def _ensure_daily_row():
-    with get_engine().begin() as conn:
-        conn.execute(text(
-            f"""
-            MERGE [{settings.SQLSERVER_DB_SCHEMA}].[ApiUsage] AS t
-            USING (SELECT CAST(:d AS DATE) d, CAST(:s AS NVARCHAR(50)) s) AS src
-            ON t.UsageDate = src.d AND t.Service = src.s
-            WHEN NOT MATCHED THEN INSERT ([UsageDate],[Service],[Calls]) VALUES (src.d, src.s, 0);
-            """
-        ), {"d": _today(), "s": SERVICE_NAME})
-
-def _ensure_hourly_row(d: str, h: int):
+def _read_day(conn, d: str):
+    daily = conn.execute(text(
+        f"""
+        SELECT [Calls] FROM [{settings.SQLSERVER_DB_SCHEMA}].[ApiUsage]
+        WHERE [UsageDate] = :d AND [Service] = :s
+        """
+    ), {"d": d, "s": SERVICE_NAME}).scalar()
+    hourly = conn.execute(text(f"""
+        SELECT UsageHour, Calls
+        FROM [{settings.SQLSERVER_DB_SCHEMA}].[ApiUsageHourly]
+        WHERE [UsageDate] = :d AND [Service] = :s
+    """), {"d": d, "s": SERVICE_NAME}).all()
+    return int(daily or 0), {int(h): int(c or 0) for h, c in hourly}
+
+def _apply_snapshot(d: str, daily: int, hourly: Dict[int, int]) -> None:
+    # Stored totals plus whatever has been counted but not flushed yet; caller holds _lock
+    _daily[d] = daily + _pending_daily.get(d, 0)
+    for key in [k for k in _hourly if k[0] == d]:
+        del _hourly[key]
+    for h, c in hourly.items():
+        _hourly[(d, h)] = c
+    for (pd_, h), n in _pending_hourly.items():
+        if pd_ == d:
+            _hourly[(d, h)] = _hourly.get((d, h), 0) + n
+
+def load_usage() -> None:
+    """Seed today's counters from the DB (called at startup and after every flush)."""
+    global _loaded
+    d = _today_local()
     with get_engine().begin() as conn:
-        conn.execute(text(f"""
-            MERGE [{settings.SQLSERVER_DB_SCHEMA}].[ApiUsageHourly] AS t
-            USING (SELECT CAST(:d AS DATE) d, CAST(:h AS TINYINT) h, CAST(:s AS NVARCHAR(50)) s) AS src
-            ON t.UsageDate = src.d AND t.UsageHour = src.h AND t.Service = src.s
-            WHEN NOT MATCHED THEN INSERT ([UsageDate],[UsageHour],[Service],[Calls]) VALUES (src.d, src.h, src.s, 0);
-        """), {"d": d, "h": h, "s": SERVICE_NAME})
+        daily, hourly = _read_day(conn, d)
+    with _lock:
+        _apply_snapshot(d, daily, hourly)
+        _loaded = True
+
+def _ensure_loaded() -> None:
+    if not _loaded:
+        load_usage()
 
 def increment_calls(n: int = 1, when: datetime | None = None) -> None:
+    _ensure_loaded()
     d, h = _hour_key(when)
-    _ensure_daily_row()
-    _ensure_hourly_row(d, h)
-    with get_engine().begin() as conn:
-        conn.execute(text(f"""
-            UPDATE [{settings.SQLSERVER_DB_SCHEMA}].[ApiUsage] SET [Calls] = [Calls] + :n
-            WHERE [UsageDate] = :d AND [Service] = :s;
-        """), {"n": n, "d": d, "s": SERVICE_NAME})
-        conn.execute(text(f"""
-            UPDATE [{settings.SQLSERVER_DB_SCHEMA}].[ApiUsageHourly] SET [Calls] = [Calls] + :n
-            WHERE [UsageDate] = :d AND [UsageHour] = :h AND [Service] = :s;
-        """), {"n": n, "d": d, "h": h, "s": SERVICE_NAME})
+    with _lock:
+        _daily[d] = _daily.get(d, 0) + n
+        _hourly[(d, h)] = _hourly.get((d, h), 0) + n
+        _pending_daily[d] = _pending_daily.get(d, 0) + n
+        _pending_hourly[(d, h)] = _pending_hourly.get((d, h), 0) + n
+
+def flush_usage() -> int:
+    """Write pending deltas to ApiUsage/ApiUsageHourly in one batch; returns the number of calls flushed."""
+    with _lock:
+        daily = dict(_pending_daily)
+        hourly = dict(_pending_hourly)
+        _pending_daily.clear()
+        _pending_hourly.clear()
+    if not daily and not hourly:
+        return 0
+
+    params: Dict[str, object] = {"s": SERVICE_NAME}
+    daily_rows, hourly_rows = [], []
+    for i, (d, n) in enumerate(daily.items()):
+        params.update({f"d{i}": d, f"n{i}": n})
+        daily_rows.append(f"(CAST(:d{i} AS DATE), :n{i})")
+    for i, ((d, h), n) in enumerate(hourly.items()):
+        params.update({f"hd{i}": d, f"hh{i}": h, f"hn{i}": n})
+        hourly_rows.append(f"(CAST(:hd{i} AS DATE), CAST(:hh{i} AS TINYINT), :hn{i})")
+
+    sql = text(f"""
+        MERGE [{settings.SQLSERVER_DB_SCHEMA}].[ApiUsage] AS t
+        USING (VALUES {", ".join(daily_rows)}) AS src (d, n)
+        ON t.UsageDate = src.d AND t.Service = CAST(:s AS NVARCHAR(50))
+        WHEN MATCHED THEN UPDATE SET [Calls] = t.[Calls] + src.n
+        WHEN NOT MATCHED THEN INSERT ([UsageDate],[Service],[Calls]) VALUES (src.d, CAST(:s AS NVARCHAR(50)), src.n);
+
+        MERGE [{settings.SQLSERVER_DB_SCHEMA}].[ApiUsageHourly] AS t
+        USING (VALUES {", ".join(hourly_rows)}) AS src (d, h, n)
+        ON t.UsageDate = src.d AND t.UsageHour = src.h AND t.Service = CAST(:s AS NVARCHAR(50))
+        WHEN MATCHED THEN UPDATE SET [Calls] = t.[Calls] + src.n
+        WHEN NOT MATCHED THEN INSERT ([UsageDate],[UsageHour],[Service],[Calls]) VALUES (src.d, src.h, CAST(:s AS NVARCHAR(50)), src.n);
+    """)
+    try:
+        d = _today_local()
+        with get_engine().begin() as conn:
+            conn.execute(sql, params)
+            # Pick up calls made by other processes since the last flush
+            snapshot = _read_day(conn, d)
+    except Exception:
+        # Put the deltas back so the next flush retries them
+        with _lock:
+            for k, n in daily.items():
+                _pending_daily[k] = _pending_daily.get(k, 0) + n
+            for k, n in hourly.items():
+                _pending_hourly[k] = _pending_hourly.get(k, 0) + n
+        raise
+    with _lock:
+        _apply_snapshot(d, *snapshot)
+    return sum(daily.values())
 
 def calls_today() -> int:
-    _ensure_daily_row()
-    with get_engine().begin() as conn:
-        val = conn.execute(text(
-            f"""
-            SELECT [Calls] FROM [{settings.SQLSERVER_DB_SCHEMA}].[ApiUsage]
-            WHERE [UsageDate] = :d AND [Service] = :s
-            """
-        ), {"d": _today(), "s": SERVICE_NAME}).scalar()
-    return int(val or 0)
+    _ensure_loaded()
+    with _lock:
+        return _daily.get(_today_local(), 0)
 
 def calls_this_hour() -> int:
+    _ensure_loaded()
     d, h = _hour_key(None)
-    with get_engine().begin() as conn:
-        val = conn.execute(text(f"""
-            SELECT [Calls] FROM [{settings.SQLSERVER_DB_SCHEMA}].[ApiUsageHourly]
-            WHERE [UsageDate] = :d AND [UsageHour] = :h AND [Service] = :s
-        """), {"d": d, "h": h, "s": SERVICE_NAME}).scalar()
-    return int(val or 0)
+    with _lock:
+        return _hourly.get((d, h), 0)
 
 def hourly_breakdown(date_str: str | None = None) -> dict:
-    d = date_str or _today()
-    buckets = {h: 0 for h in range(24)}
+    d = date_str or _today_local()
+    if d == _today_local():
+        _ensure_loaded()
+        with _lock:
+            return {h: _hourly.get((d, h), 0) for h in range(24)}
     with get_engine().begin() as conn:
-        rows = conn.execute(text(f"""
-            SELECT UsageHour, Calls
-            FROM [{settings.SQLSERVER_DB_SCHEMA}].[ApiUsageHourly]
-            WHERE [UsageDate] = :d AND [Service] = :s
-        """), {"d": d, "s": SERVICE_NAME}).all()
-    for h, c in rows:
-        buckets[int(h)] = int(c or 0)
-    return buckets
+        _, hourly = _read_day(conn, d)
+    return {h: hourly.get(h, 0) for h in range(24)}
 
 def calls_left_today() -> int | None:
     if not settings.MAX_API_CALLS_PER_DAY:
@@ -96,6 +159,3 @@ def calls_left_today() -> int | None:
 def can_make_call() -> bool:
     cl = calls_left_today()
     return True if cl is None else cl > 0
-
-
-    
\ No newline at end of file
@@ -0,0 +1,83 @@
+"""Payload size and encode time of the history output formats, on synthetic intraday rows.
+
+Runs offline (no DB, no Tiingo): rows are shaped like pyodbc returns them from PriceBarIntra
+(str, datetime, int, Decimal) and fed through the same encoders the endpoints use.
+
+    python -m bench.bench_formats --rows 10000 100000 --repeat 3
+"""
+from __future__ import annotations
+from datetime import datetime, timedelta
+from decimal import Decimal
+import argparse
+import json
+import random
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from app.export import _columnar, _csv, _ndjson
+
+COLUMNS = ["Symbol", "Source", "BarTime", "IntervalSec", "Open", "High", "Low", "Close", "Volume"]
+
+def synthetic_rows(n: int, seed: int = 7):
+    rnd = random.Random(seed)
+    t0 = datetime(2024, 1, 2, 14, 30)
+    price = 150.0
+    rows = []
+    for i in range(n):
+        price = max(1.0, price + rnd.gauss(0, 0.2))
+        o, c = price, price + rnd.gauss(0, 0.1)
+        rows.append((
+            "MSFT", "tiingo_iex", t0 + timedelta(minutes=i), 60,
+            Decimal(f"{o:.6f}"), Decimal(f"{max(o, c) + 0.05:.6f}"), Decimal(f"{min(o, c) - 0.05:.6f}"),
+            Decimal(f"{c:.6f}"), rnd.randint(100, 50000),
+        ))
+    return rows
+
+def _parts(rows, block: int):
+    yield list(COLUMNS)
+    for i in range(0, len(rows), block):
+        yield rows[i:i + block]
+
+def encode_json(rows, block: int) -> bytes:
+    # What the buffered endpoint does today: dict per row, jsonable_encoder, JSONResponse's json.dumps
+    data = {"data": [dict(zip(COLUMNS, r)) for r in rows]}
+    return json.dumps(jsonable_encoder(data), ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
+
+ENCODERS = {
+    "json": encode_json,
+    "ndjson": lambda rows, block: b"".join(_ndjson(_parts(rows, block))),
+    "csv": lambda rows, block: b"".join(_csv(_parts(rows, block))),
+    "arrow": lambda rows, block: b"".join(_columnar(_parts(rows, block), "arrow")),
+    "parquet": lambda rows, block: b"".join(_columnar(_parts(rows, block), "parquet")),
+}
+
+def run(sizes, repeat: int, block: int) -> dict:
+    results = []
+    for n in sizes:
+        rows = synthetic_rows(n)
+        for fmt, encode in ENCODERS.items():
+            timings = []
+            size = 0
+            for _ in range(repeat):
+                t = time.perf_counter()
+                size = len(encode(rows, block))
+                timings.append(time.perf_counter() - t)
+            best = min(timings)
+            results.append({
+                "rows": n, "format": fmt, "bytes": size, "bytes_per_row": round(size / n, 2),
+                "encode_s": round(best, 4), "rows_per_s": round(n / best),
+            })
+    return {"benchmark": "history_formats", "block": block, "repeat": repeat, "results": results}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--block", type=int, default=2000, help="cursor block size (HISTORY_STREAM_BATCH_SIZE)")
+    args = ap.parse_args()
+    print(json.dumps(run(args.rows, args.repeat, args.block), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+"""Offline benchmarks for the ingest and query hot paths, emitted as JSON for comparing commits.
+
+Tiingo is replaced by a local fake HTTP server (bench.fakes.FakeTiingo) and SQL Server by an in-memory
+engine (bench.fakes.FakeEngine) that counts every statement as one round trip and can add a simulated
+RTT. The app code under test is unchanged: only its engine, Tiingo base URL and rate limiter are swapped.
+
+    python -m bench.bench_suite --sizes 250 2500 --symbols 8 --db-rtt-ms 0.5 --out bench.json
+
+Measured per data size:
+  eod_ingest       fetch_prices_for_symbol (bulk and row path): rows/s, DB round trips and Tiingo calls per symbol
+  intraday_ingest  sync_intraday_for_symbol, cold (empty table) and warm (re-sync over existing bars)
+  stream           IntradayStreamer over two replayed IEX websocket sessions: bar close, grace period,
+                   micro-batch flushes (one failing), server close, reconnect REST gap backfill
+  usage            increment_calls throughput and the cost of one flush_usage
+  endpoints        p50/p99 latency of /prices/latest, /prices/history, /prices/intraday/history over HTTP
+"""
+from __future__ import annotations
+from contextlib import contextmanager, redirect_stdout
+from datetime import date, datetime, timedelta, timezone
+from threading import Lock, Thread
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+
+from app import db as app_db, dbexec, ingest, ingest_intraday, latest, tiingo_http, usage
+from app.bars import bucket_start
+from app.config import settings
+from app.ingest_stream import IntradayStreamer
+from app.ratelimit import RateLimiter
+from app.tiingo_client import tiingo_client
+
+from .fakes import FakeEngine, FakeTiingo, ReplayFeed, eod_rows, iex_trade_frames, intraday_rows
+
+INTRADAY_SOURCE = "tiingo_iex"
+
+# --- harness -----------------------------------------------------------------------------------
+
+class HttpMeter:
+    """Counts and times every outgoing requests call (what the app pays per Tiingo request)."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.seconds = 0.0
+
+    @contextmanager
+    def installed(self):
+        original = requests.Session.send
+        meter = self
+
+        def send(session, request, **kw):
+            t = time.perf_counter()
+            try:
+                return original(session, request, **kw)
+            finally:
+                with meter._lock:
+                    meter.calls += 1
+                    meter.seconds += time.perf_counter() - t
+
+        requests.Session.send = send
+        try:
+            yield self
+        finally:
+            requests.Session.send = original
+
+
+def _symbols(n: int):
+    return [f"SYM{i:03d}" for i in range(n)]
+
+def _point_app_at(engine: FakeEngine, tiingo: FakeTiingo) -> None:
+    # Fresh process-local state, then every engine/base-URL the code paths use points at the fakes
+    ingest._engine = engine
+    dbexec._read_engine = engine
+    tiingo_http.tiingo_limiter = RateLimiter([])
+    settings.TIINGO_BASE_URL = tiingo.url
+    tiingo_client._base_url = tiingo.url
+    ingest_intraday._batch_bars = None
+    ingest_intraday._reconciled.clear()
+    ingest_intraday._flights.clear()
+    ingest._flights.clear()
+    # Every phase must really fetch: no reuse of a result from the previous phase
+    settings.EOD_FRESH_SECONDS = settings.INTRADAY_FRESH_SECONDS = 0
+    latest.clear_latest()
+    with usage._lock:
+        usage._loaded = False
+        for state in (usage._daily, usage._hourly, usage._pending_daily, usage._pending_hourly):
+            state.clear()
+    app_db.load_watermarks(engine)
+    engine.reset_stats()
+    tiingo.reset_stats()
+
+def _weekdays_back(n: int, end: date) -> date:
+    d, left = end, n
+    while left > 1:
+        d -= timedelta(days=1)
+        if d.weekday() < 5:
+            left -= 1
+    return d
+
+@contextmanager
+def _quiet(enabled: bool = True):
+    # Keep whatever the ingest paths write to stdout (logs, debug previews) out of the JSON report
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        yield
+
+def _percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+def _ms(seconds: float) -> float:
+    return round(1000 * seconds, 3)
+
+
+# --- scenarios ---------------------------------------------------------------------------------
+
+def bench_eod_ingest(size: int, symbols, tiingo: FakeTiingo, meter: HttpMeter, rtt_ms: float, bulk: bool) -> dict:
+    engine = FakeEngine(rtt_ms)
+    settings.EOD_BULK_UPSERT = bulk
+    settings.INIT_START_DATE = _weekdays_back(size, date.today()).isoformat()
+    _point_app_at(engine, tiingo)
+    meter.reset()
+    rows = 0
+    t = time.perf_counter()
+    with _quiet():
+        for sym in symbols:
+            rows += ingest.fetch_prices_for_symbol(sym)
+    wall = time.perf_counter() - t
+    db = engine.stats.snapshot()
+    return {
+        "rows_per_symbol": size, "path": "bulk" if bulk else "row", "rows": rows, "wall_s": round(wall, 4),
+        "rows_per_s": round(rows / wall) if wall else None,
+        "db_round_trips_per_symbol": round(db["round_trips"] / len(symbols), 2),
+        "db_busy_s": db["busy_s"],
+        "api_calls_per_symbol": round(meter.calls / len(symbols), 2),
+        "api_ms_per_call": _ms(meter.seconds / meter.calls) if meter.calls else None,
+        "api_bytes_per_symbol": round(tiingo.bytes_sent / len(symbols)),
+        "api_share": round(meter.seconds / wall, 3) if wall else None,
+    }
+
+def bench_intraday_ingest(size: int, symbols, tiingo: FakeTiingo, meter: HttpMeter, rtt_ms: float) -> list:
+    engine = FakeEngine(rtt_ms)
+    tiingo.intraday_bars = size
+    _point_app_at(engine, tiingo)
+    out = []
+    for phase in ("cold", "warm"):
+        engine.reset_stats()
+        tiingo.reset_stats()
+        meter.reset()
+        fetched = inserted = 0
+        t = time.perf_counter()
+        with _quiet():
+            for sym in symbols:
+                # Cold: an initial window covering `size` bars; warm: whatever the delta logic asks for
+                res = ingest_intraday.sync_intraday_for_symbol(sym, window_minutes=max(1, size * tiingo.interval_sec // 60))
+                fetched += res.get("fetched", 0)
+                inserted += res.get("inserted", 0)
+        wall = time.perf_counter() - t
+        db = engine.stats.snapshot()
+        out.append({
+            "bars_per_response": size, "phase": phase, "fetched": fetched, "written": inserted,
+            "wall_s": round(wall, 4), "rows_per_s": round(fetched / wall) if wall else None,
+            "db_round_trips_per_symbol": round(db["round_trips"] / len(symbols), 2),
+            "db_busy_s": db["busy_s"],
+            "api_calls_per_symbol": round(meter.calls / len(symbols), 2),
+            "api_ms_per_call": _ms(meter.seconds / meter.calls) if meter.calls else None,
+            "api_bytes_per_symbol": round(tiingo.bytes_sent / len(symbols)),
+        })
+    return out
+
+def bench_stream(symbols, tiingo: FakeTiingo, meter: HttpMeter, rtt_ms: float, bars: int = 10) -> dict:
+    # Session 1 ends in a server close and its first micro-batch write fails; session 2 starts `gap` bars
+    # later (the reconnect backfills over REST) and then idles until the grace period closes its last bars
+    engine = FakeEngine(rtt_ms)
+    _point_app_at(engine, tiingo)
+    isec = ingest_intraday._interval_seconds(settings.INTRADAY_RESAMPLE)
+    settings.STREAM_BACKFILL_ON_START = False
+    settings.STREAM_RECONNECT_MAX_SECONDS = 0
+    settings.STREAM_BAR_GRACE_SECONDS = 1.0
+    settings.STREAM_FLUSH_SECONDS = 0.2
+    settings.STREAM_FLUSH_MAX_BARS = 2 * len(symbols)
+    gap = 3
+    start = bucket_start(datetime.now(timezone.utc) - timedelta(seconds=(2 * bars + gap + 3) * isec), isec)
+    resume = start + timedelta(seconds=(bars + gap) * isec)
+    feed = ReplayFeed([iex_trade_frames(symbols, start, bars, isec), iex_trade_frames(symbols, resume, bars, isec)])
+    # Each connection drops its first (partial) bar. Session 1 closes before the grace period ends, so only
+    # the first symbol (whose bar the final trade closes) keeps its last bar; session 2 idles and keeps all.
+    written = {(start + timedelta(seconds=b * isec)).replace(tzinfo=None) for b in range(1, bars - 1)} | \
+              {(resume + timedelta(seconds=b * isec)).replace(tzinfo=None) for b in range(1, bars)}
+    expected = len(symbols) * len(written) + 1
+    streamer = IntradayStreamer(symbols, url="ws://replay", connect=feed)
+    engine.fail_writes = 1
+    meter.reset()
+    t = time.perf_counter()
+    with _quiet():
+        thread = Thread(target=streamer.run, name="bench-stream", daemon=True)
+        thread.start()
+        while streamer.stats["bars_written"] < expected and time.perf_counter() - t < 15:
+            time.sleep(0.01)
+        wall = time.perf_counter() - t
+        streamer.stop_event.set()
+        thread.join(timeout=5)
+    last = engine.intra.get((symbols[-1], INTRADAY_SOURCE, isec), {})
+    stats = streamer.stats
+    return {
+        "symbols": len(symbols), "bars_per_session": bars, "wall_s": round(wall, 4),
+        "connects": stats["connects"], "trades": stats["trades"],
+        "bars_written": stats["bars_written"], "bars_expected": expected,
+        "micro_batches": stats["flushes"], "flush_errors": stats["flush_errors"],
+        # Stream bars hold four size-100 trades; 401 is one that also kept its size-1 straggler
+        "stragglers_kept": sum(1 for row in last.values() if row[8] == 401),
+        "subscribed": sorted(feed.sockets[0].sent[0]["eventData"]["tickers"]) == sorted(s.lower() for s in symbols),
+        "backfill_api_calls": meter.calls,
+    }
+
+def bench_usage(calls: int, rtt_ms: float, tiingo: FakeTiingo) -> dict:
+    engine = FakeEngine(rtt_ms)
+    _point_app_at(engine, tiingo)
+    usage.load_usage()
+    engine.reset_stats()
+    t = time.perf_counter()
+    for _ in range(calls):
+        usage.increment_calls(1)
+        usage.can_make_call()
+    incr = time.perf_counter() - t
+    trips_incr = engine.stats.round_trips
+    t = time.perf_counter()
+    usage.flush_usage()
+    flush = time.perf_counter() - t
+    return {
+        "increments": calls, "increment_us": round(1e6 * incr / calls, 3),
+        "db_round_trips_per_increment": round(trips_incr / calls, 4),
+        "flush_ms": _ms(flush), "flush_round_trips": engine.stats.round_trips - trips_incr,
+    }
+
+def _seed(engine: FakeEngine, symbols, size: int, isec: int) -> None:
+    end = date.today() - timedelta(days=1)
+    start = _weekdays_back(size, end)
+    for sym in symbols:
+        for r in eod_rows(sym, start, end):
+            engine.put_eod({"Symbol": sym, "Source": settings.SOURCE_EOD, "BarDate": r["date"][:10],
+                            "Open": r["open"], "High": r["high"], "Low": r["low"], "Close": r["close"],
+                            "Volume": r["volume"], "AdjClose": r["adjClose"]})
+        for r in intraday_rows(sym, size, isec):
+            engine.put_intra({"Symbol": sym, "Source": INTRADAY_SOURCE, "BarTime": r["date"][:19], "IntervalSec": isec,
+                              "Open": r["open"], "High": r["high"], "Low": r["low"], "Close": r["close"],
+                              "Volume": r["volume"]})
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@contextmanager
+def _serve_api():
+    import uvicorn
+    from app.main import app
+    # lifespan off: no scheduler, no startup DB work; handlers only
+    config = uvicorn.Config(app, host="127.0.0.1", port=_free_port(), lifespan="off", log_level="warning")
+    server = uvicorn.Server(config)
+    thread = Thread(target=server.run, name="bench-api", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{config.port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+def _check_rows(r, path: str, params: dict) -> None:
+    # A case that returns nothing would time an empty lookup, not the endpoint
+    r.raise_for_status()
+    empty = not r.json().get("data") if params.get("format", "json") == "json" else not r.content.strip()
+    if empty:
+        raise RuntimeError(f"bench: {path} {params} returned no rows; check the seeded symbols")
+
+def bench_endpoints(base: str, size: int, symbols, engine: FakeEngine, requests_n: int, warmup: int) -> list:
+    isec = ingest_intraday._interval_seconds(settings.INTRADAY_RESAMPLE)
+    sym = symbols[0]
+    cases = [
+        ("/prices/latest", {}, None),
+        ("/prices/latest", {}, "uncached"),
+        ("/prices/history", {"symbol": sym}, None),
+        ("/prices/history", {"symbol": sym, "format": "ndjson"}, None),
+        ("/prices/intraday/history", {"symbol": sym, "interval_sec": isec}, None),
+        ("/prices/intraday/history", {"symbol": sym, "interval_sec": isec, "format": "ndjson"}, None),
+    ]
+    out = []
+    ttl, configured = settings.LATEST_CACHE_TTL_SECONDS, settings.SYMBOLS
+    # /prices/latest without a symbol covers the configured list: point it at the seeded symbols
+    settings.SYMBOLS = list(symbols)
+    with requests.Session() as http:
+        for path, params, variant in cases:
+            settings.LATEST_CACHE_TTL_SECONDS = 0 if variant == "uncached" else ttl
+            for _ in range(warmup):
+                http.get(base + path, params=params).raise_for_status()
+            _check_rows(http.get(base + path, params=params), path, params)
+            engine.reset_stats()
+            timings, size_bytes = [], 0
+            for _ in range(requests_n):
+                t = time.perf_counter()
+                r = http.get(base + path, params=params)
+                body = r.content
+                timings.append(time.perf_counter() - t)
+                r.raise_for_status()
+                size_bytes = len(body)
+            timings.sort()
+            out.append({
+                "endpoint": path, "params": {k: v for k, v in params.items() if k != "symbol"},
+                "variant": variant or "default", "rows_per_symbol": size, "requests": requests_n,
+                "p50_ms": _ms(_percentile(timings, 0.50)), "p99_ms": _ms(_percentile(timings, 0.99)),
+                "mean_ms": _ms(sum(timings) / len(timings)), "bytes": size_bytes,
+                "db_round_trips_per_request": round(engine.stats.round_trips / requests_n, 3),
+            })
+    settings.LATEST_CACHE_TTL_SECONDS, settings.SYMBOLS = ttl, configured
+    return out
+
+
+# --- driver ------------------------------------------------------------------------------------
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+def run(args) -> dict:
+    symbols = _symbols(args.symbols)
+    # Unlimited budget and no limiter waits: the benchmark measures the code, not the pacing policy
+    settings.MAX_API_CALLS_PER_DAY = 0
+    settings.INGEST_WORKERS = 1
+    settings.INTRADAY_BATCH_MODE = False
+    settings.HISTORY_TIER_DIR = ""
+    isec = ingest_intraday._interval_seconds(settings.INTRADAY_RESAMPLE)
+    tiingo = FakeTiingo(interval_sec=isec, latency_ms=args.api_latency_ms).start()
+    meter = HttpMeter()
+    results = {"eod_ingest": [], "intraday_ingest": [], "stream": None, "usage": None, "endpoints": []}
+    try:
+        with meter.installed():
+            for size in args.sizes:
+                for bulk in (True, False):
+                    if not bulk and size > args.row_path_max:
+                        continue
+                    results["eod_ingest"].append(bench_eod_ingest(size, symbols, tiingo, meter, args.db_rtt_ms, bulk))
+                results["intraday_ingest"].extend(bench_intraday_ingest(size, symbols, tiingo, meter, args.db_rtt_ms))
+            results["stream"] = bench_stream(symbols, tiingo, meter, args.db_rtt_ms)
+            results["usage"] = bench_usage(args.usage_calls, args.db_rtt_ms, tiingo)
+        with _quiet(), _serve_api() as base:
+            for size in args.sizes:
+                engine = FakeEngine(args.db_rtt_ms)
+                _seed(engine, symbols, size, isec)
+                _point_app_at(engine, tiingo)
+                results["endpoints"].extend(bench_endpoints(base, size, symbols, engine, args.requests, args.warmup))
+    finally:
+        tiingo.stop()
+    return {
+        "benchmark": "suite",
+        "commit": _git_commit(),
+        "timestamp_utc": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "python": platform.python_version(),
+        "config": {
+            "sizes": args.sizes, "symbols": args.symbols, "db_rtt_ms": args.db_rtt_ms,
+            "api_latency_ms": args.api_latency_ms, "requests": args.requests, "interval_sec": isec,
+        },
+        "results": results,
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--sizes", type=int, nargs="+", default=[250, 2500],
+                    help="rows per symbol: EOD days fetched/stored and intraday bars per response/stored")
+    ap.add_argument("--symbols", type=int, default=8)
+    ap.add_argument("--db-rtt-ms", type=float, default=0.5, help="simulated latency added to every DB round trip")
+    ap.add_argument("--api-latency-ms", type=float, default=0.0, help="simulated Tiingo server latency")
+    ap.add_argument("--requests", type=int, default=200, help="timed requests per endpoint case")
+    ap.add_argument("--warmup", type=int, default=10)
+    ap.add_argument("--usage-calls", type=int, default=10000)
+    ap.add_argument("--row-path-max", type=int, default=2500, help="largest size to run the row-by-row EOD path at")
+    ap.add_argument("--out", help="write JSON here instead of stdout")
+    args = ap.parse_args()
+    report = json.dumps(run(args), indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(report + "\n")
+    else:
+        sys.stdout.write(report + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,529 @@
+"""Offline stand-ins for the benchmark suite: a local fake Tiingo HTTP server and an in-memory engine
+that answers the statements app.db / app.latest / app.usage / the history endpoints issue.
+
+Neither is a general SQL Server or Tiingo emulator; they only understand the shapes this repo sends.
+Every execute() on the fake engine counts as one DB round trip and can sleep a simulated RTT.
+"""
+from __future__ import annotations
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+import gzip
+import json
+import re
+import time
+import zlib
+
+from websocket import WebSocketTimeoutException
+
+# --- Fake Tiingo -------------------------------------------------------------------------------
+
+def _price(symbol: str, i: int) -> float:
+    # Deterministic random walk-ish price per (symbol, step)
+    seed = zlib.crc32(symbol.encode()) % 400 + 50
+    return round(seed + 10 * ((i * 7919) % 1000) / 1000.0, 4)
+
+def _tiingo_ts(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+def eod_rows(symbol: str, start: date, end: date) -> List[dict]:
+    rows = []
+    d = start
+    while d <= end:
+        if d.weekday() < 5:
+            i = d.toordinal()
+            c = _price(symbol, i)
+            rows.append({
+                "date": _tiingo_ts(datetime(d.year, d.month, d.day)), "open": c - 0.5, "high": c + 1.0,
+                "low": c - 1.0, "close": c, "volume": 100000 + i % 5000, "adjOpen": c - 0.5, "adjHigh": c + 1.0,
+                "adjLow": c - 1.0, "adjClose": c, "adjVolume": 100000 + i % 5000, "divCash": 0.0, "splitFactor": 1.0,
+            })
+        d += timedelta(days=1)
+    return rows
+
+def intraday_rows(symbol: str, bars: int, interval_sec: int, end: Optional[datetime] = None) -> List[dict]:
+    end = end or datetime.now(timezone.utc).replace(tzinfo=None)
+    last = end - timedelta(seconds=end.timestamp() % interval_sec)
+    rows = []
+    for k in range(bars, 0, -1):
+        t = last - timedelta(seconds=(k - 1) * interval_sec)
+        i = int(t.timestamp() // interval_sec)
+        c = _price(symbol, i)
+        rows.append({"date": _tiingo_ts(t), "open": c - 0.05, "high": c + 0.1, "low": c - 0.1, "close": c,
+                     "volume": 1000 + i % 700})
+    return rows
+
+
+class FakeTiingo:
+    """Threaded local HTTP server serving synthetic EOD and IEX payloads.
+
+    EOD responses contain every weekday in [startDate, endDate]; IEX price responses contain
+    `intraday_bars` bars ending now (fewer when startDate is a timestamp closer than that). Requests, payload bytes and server time are counted.
+    """
+
+    def __init__(self, intraday_bars: int = 390, interval_sec: int = 60, latency_ms: float = 0.0):
+        self.intraday_bars = intraday_bars
+        self.interval_sec = interval_sec
+        self.latency_ms = latency_ms
+        self._lock = Lock()
+        self.reset_stats()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without TCP_NODELAY keep-alive clients
+            # would pay Nagle + delayed-ACK stalls that real servers don't have
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                fake._handle(self)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = Thread(target=self._server.serve_forever, name="fake-tiingo", daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "FakeTiingo":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.bytes_sent = 0
+            self.paths: Dict[str, int] = {}
+
+    def _payload(self, path: str, query: Dict[str, str]):
+        m = re.fullmatch(r"/tiingo/daily/([^/]+)/prices", path)
+        if m:
+            today = date.today()
+            start = date.fromisoformat(query.get("startDate", today.isoformat()))
+            end = date.fromisoformat(query.get("endDate", today.isoformat()))
+            return "eod", eod_rows(m.group(1).upper(), start, end)
+        m = re.fullmatch(r"/iex/([^/]+)/prices", path)
+        if m:
+            bars = self.intraday_bars
+            if "T" in query.get("startDate", ""):
+                # Timestamp window: only the bars from startDate up to now
+                start = datetime.fromisoformat(query["startDate"].replace("Z", "")).replace(tzinfo=None)
+                elapsed = (datetime.now(timezone.utc).replace(tzinfo=None) - start).total_seconds()
+                bars = max(1, min(bars, int(elapsed // self.interval_sec) + 1))
+            return "iex_prices", intraday_rows(m.group(1).upper(), bars, self.interval_sec)
+        if path.rstrip("/") == "/iex":
+            now = _tiingo_ts(datetime.now(timezone.utc).replace(tzinfo=None))
+            return "iex_top", [{"ticker": t, "tngoLast": _price(t, 0), "lastSaleTimestamp": now, "volume": 1000}
+                               for t in query.get("tickers", "").upper().split(",") if t]
+        return None, None
+
+    def _handle(self, req: BaseHTTPRequestHandler) -> None:
+        t = time.perf_counter()
+        parsed = urlparse(req.path)
+        query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        kind, payload = self._payload(parsed.path, query)
+        if kind is None:
+            body, status = b'{"detail":"Not found."}', 404
+        else:
+            body, status = json.dumps(payload, separators=(",", ":")).encode("utf-8"), 200
+        headers = {"Content-Type": "application/json"}
+        if "gzip" in (req.headers.get("Accept-Encoding") or ""):
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        req.send_response(status)
+        for k, v in headers.items():
+            req.send_header(k, v)
+        req.send_header("Content-Length", str(len(body)))
+        req.end_headers()
+        req.wfile.write(body)
+        with self._lock:
+            self.requests += 1
+            self.bytes_sent += len(body)
+            self.paths[kind or "404"] = self.paths.get(kind or "404", 0) + 1
+
+
+# --- Fake Tiingo IEX websocket -----------------------------------------------------------------
+
+def _iex_frame(symbol: str, ts: datetime, price: float, size: int) -> str:
+    # [updateType, date, nanos, ticker, bidSize, bidPrice, midPrice, askPrice, askSize, lastPrice, lastSize, ...]
+    data = ["T", ts.isoformat(), int(ts.timestamp() * 1e9), symbol.lower(), None, None, None, None, None,
+            price, size, 0, 0, 0, 0, 0]
+    return json.dumps({"messageType": "A", "service": "iex", "data": data})
+
+def iex_trade_frames(symbols: List[str], start: datetime, buckets: int, interval_sec: int,
+                     trades_per_bucket: int = 4, straggler_s: float = 0.25) -> List[str]:
+    """Recorded-session shaped IEX frames: a subscription ack, `trades_per_bucket` trades of size 100 per
+    symbol per bar starting at `start` (a bar boundary), heartbeats, and one straggler per bar boundary:
+    a size-1 trade for the last symbol stamped `straggler_s` before the boundary, sent after the first
+    trade of the next bar. A final trade for the first symbol opens the bar after the last one."""
+    frames = [json.dumps({"messageType": "I", "response": {"code": 200, "message": "Success"},
+                          "data": {"subscriptionId": 1}})]
+    step = interval_sec / trades_per_bucket
+    for b in range(buckets + 1):
+        base = start + timedelta(seconds=b * interval_sec)
+        for k in range(trades_per_bucket if b < buckets else 1):
+            t = base + timedelta(seconds=straggler_s + k * step)
+            for sym in (symbols if b < buckets else symbols[:1]):
+                frames.append(_iex_frame(sym, t, _price(sym, b * trades_per_bucket + k), 100))
+                if k == 0 and b > 0 and sym == symbols[0] and len(symbols) > 1:
+                    late = base - timedelta(seconds=straggler_s)
+                    frames.append(_iex_frame(symbols[-1], late, _price(symbols[-1], b), 1))
+        frames.append(json.dumps({"messageType": "H", "response": {"code": 200, "message": "HeartBeat"}}))
+    return frames
+
+
+class ReplaySocket:
+    """One websocket connection replaying recorded frames, with the subset of the websocket-client
+    API IntradayStreamer uses. When the frames run out it either closes (recv() returns "", as on
+    a server close) or idles, sleeping `idle_s` per recv() before timing out."""
+
+    def __init__(self, frames: List[str], close_at_end: bool, idle_s: float):
+        self._frames = list(frames)
+        self._pos = 0
+        self.close_at_end = close_at_end
+        self.idle_s = idle_s
+        self.sent: List[dict] = []
+        self.closed = False
+
+    def settimeout(self, timeout: float) -> None:
+        self.idle_s = min(self.idle_s, timeout)
+
+    def send(self, payload: str) -> None:
+        self.sent.append(json.loads(payload))
+
+    def recv(self) -> str:
+        if self._pos < len(self._frames):
+            self._pos += 1
+            return self._frames[self._pos - 1]
+        if self.close_at_end:
+            return ""
+        time.sleep(self.idle_s)
+        raise WebSocketTimeoutException("idle")
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class ReplayFeed:
+    """Stand-in for websocket.create_connection: each connect replays the next recorded session.
+    Every session but the last ends in a server close; the last one stays open and idle."""
+
+    def __init__(self, sessions: List[List[str]], idle_s: float = 0.02):
+        self.sessions = list(sessions)
+        self.idle_s = idle_s
+        self.sockets: List[ReplaySocket] = []
+
+    def __call__(self, url: str, timeout: Optional[float] = None) -> ReplaySocket:
+        if len(self.sockets) >= len(self.sessions):
+            raise ConnectionRefusedError("no more recorded sessions")
+        n = len(self.sockets)
+        ws = ReplaySocket(self.sessions[n], close_at_end=n < len(self.sessions) - 1, idle_s=self.idle_s)
+        self.sockets.append(ws)
+        return ws
+
+
+# --- Fake engine -------------------------------------------------------------------------------
+
+EOD_COLS = ["Symbol", "Source", "BarDate", "Open", "High", "Low", "Close", "Volume", "AdjClose"]
+INTRA_COLS = ["Symbol", "Source", "BarTime", "IntervalSec", "Open", "High", "Low", "Close", "Volume"]
+_PRICE_COLS = {"Open", "High", "Low", "Close", "AdjClose"}
+_Q6 = Decimal("0.000001")
+
+def _dec(v):
+    # What DECIMAL(18,6) comes back as through pyodbc
+    if v is None or isinstance(v, Decimal):
+        return v
+    return Decimal(repr(float(v))).quantize(_Q6)
+
+def _dt(v) -> datetime:
+    if isinstance(v, datetime):
+        return v.replace(tzinfo=None)
+    if isinstance(v, date):
+        return datetime(v.year, v.month, v.day)
+    return datetime.fromisoformat(str(v).replace("Z", "")).replace(tzinfo=None)
+
+
+class FakeResult:
+    def __init__(self, columns: List[str] = (), rows: List[tuple] = (), rowcount: int = -1):
+        self._columns = list(columns)
+        self._rows = list(rows)
+        self.rowcount = rowcount
+
+    def keys(self):
+        return list(self._columns)
+
+    def scalar(self):
+        return self._rows[0][0] if self._rows else None
+
+    def all(self):
+        return list(self._rows)
+
+    fetchall = all
+
+    def mappings(self):
+        return FakeResult([], [dict(zip(self._columns, r)) for r in self._rows], self.rowcount)
+
+    def partitions(self, size: Optional[int] = None):
+        size = size or self._yield_per or 1000
+        for i in range(0, len(self._rows), size):
+            yield self._rows[i:i + size]
+
+    _yield_per: Optional[int] = None
+
+
+class FakeStats:
+    def __init__(self):
+        self._lock = Lock()
+        self.round_trips = 0
+        self.busy_s = 0.0
+        self.by_kind: Dict[str, int] = {}
+
+    def record(self, kind: str, seconds: float) -> None:
+        with self._lock:
+            self.round_trips += 1
+            self.busy_s += seconds
+            self.by_kind[kind] = self.by_kind.get(kind, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"round_trips": self.round_trips, "busy_s": round(self.busy_s, 4), "by_kind": dict(self.by_kind)}
+
+
+class FakeConnection:
+    def __init__(self, engine: "FakeEngine"):
+        self.engine = engine
+        self._yield_per: Optional[int] = None
+        self._stage: Dict[str, Dict[tuple, dict]] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execution_options(self, **kw):
+        self._yield_per = kw.get("yield_per", self._yield_per)
+        return self
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+    def exec_driver_sql(self, sql: str, params=None):
+        return self.execute(sql, params)
+
+    def execute(self, clause, params=None):
+        sql = " ".join(str(clause).split())
+        t = time.perf_counter()
+        kind, result = self.engine._dispatch(self, sql, params or {})
+        self.engine.stats.record(kind, time.perf_counter() - t)
+        if self.engine.rtt_s:
+            time.sleep(self.engine.rtt_s)
+        result._yield_per = self._yield_per
+        return result
+
+
+class _Begin:
+    def __init__(self, engine: "FakeEngine"):
+        self._conn = FakeConnection(engine)
+
+    def __enter__(self):
+        return self._conn
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeEngine:
+    """In-memory PriceBar / PriceBarIntra / ApiUsage* behind the subset of the Engine API the app uses."""
+
+    def __init__(self, rtt_ms: float = 0.0):
+        self.rtt_s = rtt_ms / 1000.0
+        self.stats = FakeStats()
+        self._lock = Lock()
+        self.eod: Dict[Tuple[str, str], Dict[datetime, tuple]] = {}
+        self.intra: Dict[Tuple[str, str, int], Dict[datetime, tuple]] = {}
+        self.usage_daily: Dict[str, int] = {}
+        self.usage_hourly: Dict[Tuple[str, int], int] = {}
+        self._sorted: Dict[tuple, List[datetime]] = {}
+        self.fail_writes = 0 # fail this many upcoming staged writes, as during a DB outage
+
+    def connect(self):
+        return FakeConnection(self)
+
+    def begin(self):
+        return _Begin(self)
+
+    def dispose(self):
+        pass
+
+    def reset_stats(self) -> None:
+        self.stats = FakeStats()
+
+    # -- storage helpers --
+    def _put(self, table: dict, key: tuple, ts: datetime, row: tuple) -> bool:
+        bucket = table.setdefault(key, {})
+        changed = bucket.get(ts) != row
+        if ts not in bucket:
+            self._sorted.pop((id(table), key), None)
+        bucket[ts] = row
+        return changed
+
+    def _times(self, table: dict, key: tuple) -> List[datetime]:
+        skey = (id(table), key)
+        times = self._sorted.get(skey)
+        if times is None:
+            times = self._sorted[skey] = sorted(table.get(key, {}))
+        return times
+
+    def put_eod(self, r: dict) -> bool:
+        ts = _dt(r["BarDate"])
+        row = (r["Symbol"], r["Source"], ts, *(_dec(r[c]) for c in ("Open", "High", "Low", "Close")),
+               None if r["Volume"] is None else int(r["Volume"]), _dec(r["AdjClose"]))
+        return self._put(self.eod, (r["Symbol"], r["Source"]), ts, row)
+
+    def put_intra(self, r: dict) -> bool:
+        ts = _dt(r["BarTime"])
+        isec = int(r["IntervalSec"])
+        row = (r["Symbol"], r["Source"], ts, isec, *(_dec(r[c]) for c in ("Open", "High", "Low", "Close")),
+               None if r["Volume"] is None else int(r["Volume"]))
+        return self._put(self.intra, (r["Symbol"], r["Source"], isec), ts, row)
+
+    # -- statement dispatch --
+    def _dispatch(self, conn: FakeConnection, sql: str, params):
+        with self._lock:
+            return self._dispatch_locked(conn, sql, params)
+
+    def _dispatch_locked(self, conn: FakeConnection, sql: str, params):
+        if sql == "SELECT 1":
+            return "ping", FakeResult(["c"], [(1,)])
+        if "CREATE SCHEMA" in sql:
+            return "ddl", FakeResult()
+        m = re.search(r"CREATE TABLE (#\w+)", sql)
+        if m:
+            conn._stage[m.group(1)] = {}
+            return "stage_ddl", FakeResult()
+        m = re.match(r"(?:TRUNCATE|DROP) TABLE (#\w+)", sql)
+        if m:
+            if sql.startswith("DROP"):
+                conn._stage.pop(m.group(1), None)
+            else:
+                conn._stage[m.group(1)].clear()
+            return "stage_ddl", FakeResult()
+        m = re.match(r"INSERT INTO (#\w+)", sql)
+        if m:
+            if self.fail_writes:
+                self.fail_writes -= 1
+                raise ConnectionError("fake engine: write failed")
+            stage = conn._stage[m.group(1)]
+            rows = params if isinstance(params, list) else [params]
+            time_col = "BarDate" if "BarDate" in rows[0] else "BarTime"
+            for r in rows:
+                stage[(r["Symbol"], r["Source"], r[time_col], r.get("IntervalSec"))] = r
+            return "stage_insert", FakeResult(rowcount=len(rows))
+        if sql.startswith("MERGE") and "ApiUsage" in sql:
+            for k, v in params.items():
+                if re.fullmatch(r"d\d+", k):
+                    self.usage_daily[v] = self.usage_daily.get(v, 0) + params["n" + k[1:]]
+                elif re.fullmatch(r"hd\d+", k):
+                    key = (v, int(params["hh" + k[2:]]))
+                    self.usage_hourly[key] = self.usage_hourly.get(key, 0) + params["hn" + k[2:]]
+            return "usage_merge", FakeResult()
+        if sql.startswith("MERGE"):
+            # Staged MERGEs return one OUTPUT $action row per target row written
+            if "USING #PriceBarStage" in sql:
+                stage = conn._stage["#PriceBarStage"]
+                for r in stage.values():
+                    self.put_eod(r)
+                return "merge", FakeResult(["$action"], [("UPDATE",)] * len(stage), len(stage))
+            if "USING #PriceBarIntraStage" in sql:
+                n = sum(1 for r in conn._stage["#PriceBarIntraStage"].values() if self.put_intra(r))
+                return "merge", FakeResult(["$action"], [("UPDATE",)] * n, n)
+            if "[PriceBarIntra]" in sql:
+                self.put_intra(params)
+            else:
+                self.put_eod(params)
+            return "merge_row", FakeResult(rowcount=1)
+        if "FROM [" in sql and "[ApiUsageHourly]" in sql:
+            d = str(params["d"])
+            return "usage_read", FakeResult(["UsageHour", "Calls"],
+                                            [(h, c) for (dd, h), c in self.usage_hourly.items() if dd == d])
+        if "[ApiUsage]" in sql:
+            return "usage_read", FakeResult(["Calls"], [(self.usage_daily[str(params["d"])],)]
+                                            if str(params["d"]) in self.usage_daily else [])
+        if "OBJECT_ID" in sql:
+            return "meta", FakeResult(["id"], [(1,)])
+        if "CROSS APPLY" in sql:
+            return "latest", self._latest(sql, params)
+        if "MAX([BarDate])" in sql or "MAX([BarTime])" in sql:
+            return "watermark", self._watermark(sql, params)
+        if sql.startswith("SELECT") and "ORDER BY [Bar" in sql:
+            return "history", self._history(sql, params)
+        raise NotImplementedError(f"FakeEngine does not understand: {sql[:160]}")
+
+    def _latest(self, sql: str, params) -> FakeResult:
+        symbols = [v for k, v in params.items() if re.fullmatch(r"s\d+", k)]
+        rows = []
+        if "[PriceBarIntra]" in sql:
+            for sym in symbols:
+                key = (sym, params["source"], int(params["isec"]))
+                times = self._times(self.intra, key)
+                if times:
+                    rows.append(self.intra[key][times[-1]])
+            return FakeResult(INTRA_COLS, rows)
+        for sym in symbols:
+            key = (sym, params["source"])
+            times = self._times(self.eod, key)
+            if times:
+                rows.append(self.eod[key][times[-1]])
+        return FakeResult(EOD_COLS, rows)
+
+    def _watermark(self, sql: str, params) -> FakeResult:
+        intra = "[PriceBarIntra]" in sql
+        table = self.intra if intra else self.eod
+        if "GROUP BY" in sql:
+            rows = [(*key, max(bucket)) for key, bucket in table.items() if bucket]
+            return FakeResult(["Symbol", "Source"] + (["IntervalSec"] if intra else []) + ["Latest"], rows)
+        key = (params["symbol"], params["source"], int(params["isec"])) if intra else (params["symbol"], params["source"])
+        times = self._times(table, key)
+        return FakeResult(["Latest"], [(times[-1] if times else None,)])
+
+    def _history(self, sql: str, params) -> FakeResult:
+        intra = "[PriceBarIntra]" in sql
+        if intra:
+            key, table, cols = (params["symbol"], params["source"], int(params["isec"])), self.intra, INTRA_COLS
+        else:
+            key, table, cols = (params["symbol"], params["source"]), self.eod, EOD_COLS
+        lo = max((_dt(params[p]) for p in ("start", "lo") if params.get(p)), default=None)
+        hi = min((_dt(params[p]) for p in ("end", "hi") if params.get(p)), default=None)
+        desc = re.search(r"ORDER BY \[Bar\w+\] DESC", sql) is not None
+        after = _dt(params["after"]) if params.get("after") else None
+        bucket = table.get(key, {})
+        out = []
+        times = self._times(table, key)
+        for ts in (reversed(times) if desc else times):
+            if (lo and ts < lo) or (hi and ts > hi) or (after and (ts >= after if desc else ts <= after)):
+                continue
+            out.append(bucket[ts])
+        top = re.search(r"SELECT TOP \((\d+)\)", sql)
+        if top:
+            out = out[:int(top.group(1))]
+        return FakeResult(cols, out)